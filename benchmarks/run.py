@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+    Throughput and peak memory benchmarks for streamline's generators,
+    streamers, executors and consumers using synthetic inputs.
+
+    python benchmarks/run.py                    # run everything and compare with the baseline
+    python benchmarks/run.py -k sort json       # only benchmarks whose name contains one of these
+    python benchmarks/run.py --save-baseline    # record the results as the new baseline
+    python benchmarks/run.py -k executor --loops asyncio uvloop   # compare event loops
+
+    Executor benchmarks run once per event loop in --loops (default every
+    installed one); results for loops other than asyncio are named
+    "<benchmark>@<loop>".
+
+    Exits non-zero if any benchmark regressed beyond --tolerance.
+"""
+import tracemalloc
+import argparse
+import tempfile
+import asyncio
+import random
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamline import generators, consumers, streamers, serializers, columnar, spill
+from streamline.core import pipe, sync_exec, install_event_loop
+from streamline.entries import EntryFactory
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZE = 20000
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """ Register a benchmark setup function: (size, workdir) -> zero argument coroutine factory """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+# ========== Synthetic data ==========
+
+def synthetic_record(i):
+    return {
+        'host': 'host-{}.example.com'.format(i % 1000),
+        'index': i,
+        'status': random.choice([200, 200, 200, 404, 500]),
+        'latency': random.random(),
+        'tags': ['a', 'b', str(i % 7)],
+    }
+
+def synthetic_nested(i):
+    return {
+        'id': i,
+        'request': {'method': 'GET', 'path': '/items/{}'.format(i), 'headers': {'accept': 'application/json', 'x-trace': str(i * 31)}},
+        'response': {'status': 200, 'timings': [random.random() for j in range(5)], 'body': {'items': [synthetic_record(i + j) for j in range(3)]}},
+    }
+
+def write_lines(workdir, name, lines):
+    path = os.path.join(workdir, name)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    return path
+
+async def source(values):
+    factory = EntryFactory()
+    for value in values:
+        yield factory(value)
+
+async def count_consumer(stream):
+    # Drain without holding entries so memory reflects the stage under test
+    async for entry in stream:
+        pass
+
+def streamer_benchmark(values, *chain):
+    return lambda: pipe(source(values), list(chain), consumer=count_consumer)
+
+# ========== Generators ==========
+
+@benchmark('generator:file')
+def bench_file_reader(size, workdir):
+    path = write_lines(workdir, 'lines.txt', ('line {}'.format(i) for i in range(size)))
+    return lambda: pipe(generators.FileReader(input=path).stream(), [], consumer=count_consumer)
+
+@benchmark('generator:file-gzip')
+def bench_gzip_file_reader(size, workdir):
+    import gzip
+    path = os.path.join(workdir, 'lines.txt.gz')
+    with gzip.open(path, 'wt') as f:
+        f.write('\n'.join('line {}'.format(i) for i in range(size)))
+    return lambda: pipe(generators.FileReader(input=path).stream(), [], consumer=count_consumer)
+
+@benchmark('generator:csv')
+def bench_csv_reader(size, workdir):
+    lines = ['host,index,status'] + ['host-{},{},200'.format(i, i) for i in range(size)]
+    path = write_lines(workdir, 'rows.csv', lines)
+    return lambda: pipe(generators.CSVReader(input=path).stream(), [], consumer=count_consumer)
+
+@benchmark('generator:csv-tuples')
+def bench_csv_tuple_reader(size, workdir):
+    lines = ['host,index,status'] + ['host-{},{},200'.format(i, i) for i in range(size)]
+    path = write_lines(workdir, 'rows.csv', lines)
+    return lambda: pipe(generators.CSVReader(input=path, tuples=True).stream(), [], consumer=count_consumer)
+
+# ========== Streamers ==========
+
+@benchmark('streamer:json')
+def bench_json(size, workdir):
+    values = [json.dumps(synthetic_record(i)) for i in range(size)]
+    return streamer_benchmark(values, streamers.json_parser)
+
+@benchmark('streamer:json-auto')
+def bench_json_auto(size, workdir):
+    parse = bench_json(size, workdir)
+    async def run():
+        serializers.set_serializer('auto')
+        try:
+            await parse()
+        finally:
+            serializers.set_serializer(serializers.DEFAULT_SERIALIZER)
+    return run
+
+@benchmark('streamer:py')
+def bench_py(size, workdir):
+    return streamer_benchmark(['value {}'.format(i) for i in range(size)], streamers.PyExecTransform(code='value.upper()').stream)
+
+@benchmark('streamer:pyfilter')
+def bench_pyfilter(size, workdir):
+    return streamer_benchmark(['value {}'.format(i) for i in range(size)], streamers.PyExecFilter(code='"1" in value').stream)
+
+@benchmark('streamer:extract')
+def bench_extract(size, workdir):
+    values = [synthetic_record(i) for i in range(size)]
+    return streamer_benchmark(values, streamers.ExtractionStreamer(selector='tags[2]').stream)
+
+@benchmark('streamer:sort')
+def bench_sort(size, workdir):
+    values = [synthetic_record(i) for i in range(size)]
+    return streamer_benchmark(values, streamers.SortStreamer(path='latency', numeric=True).stream)
+
+@benchmark('streamer:sort-spill')
+def bench_sort_spill(size, workdir):
+    sort = bench_sort(size, workdir)
+    async def run():
+        # Small enough that the sort spills several runs to disk and merges them
+        spill.set_memory_limit('1M')
+        try:
+            await sort()
+        finally:
+            spill.set_memory_limit(spill.DEFAULT_MEMORY_LIMIT)
+    return run
+
+@benchmark('streamer:split')
+def bench_split(size, workdir):
+    # Each value splits into ten entries
+    values = [','.join(str(i * 10 + j) for j in range(10)) for i in range(size // 10)]
+    return streamer_benchmark(values, streamers.Split(delimiter=',').stream)
+
+@benchmark('streamer:breakdown')
+def bench_breakdown(size, workdir):
+    values = [synthetic_record(i) for i in range(size)]
+    return streamer_benchmark(values, streamers.ValueBreakdown(group_by='status').stream)
+
+@benchmark('streamer:headers')
+def bench_headers(size, workdir):
+    values = [synthetic_record(i) for i in range(size)]
+    return streamer_benchmark(values, streamers.InputHeaders().stream)
+
+@benchmark('streamer:chain')
+def bench_chain(size, workdir):
+    # Synchronous stages that `core.fuse` runs in a single loop
+    values = ['  {}  '.format(json.dumps(synthetic_record(i))) for i in range(size)]
+    return streamer_benchmark(
+        values,
+        streamers.StripWhitespace().stream,
+        streamers.json_parser,
+        streamers.ExtractionStreamer(selector='host').stream,
+        streamers.InputHeaders().stream,
+    )
+
+# ========== Executors ==========
+
+async def dummy_handler(value):
+    await asyncio.sleep(0)
+    return value
+
+@benchmark('executor:async')
+def bench_async_executor(size, workdir):
+    values = list(range(size))
+    def run():
+        executor = streamers.AsyncExecutor(executor=dummy_handler, workers=100)
+        return pipe(source(values), [executor.stream], consumer=count_consumer)
+    return run
+
+# ========== Consumers ==========
+
+def consumer_benchmark(Consumer, values, workdir, name):
+    path = os.path.join(workdir, name)
+    return lambda: pipe(source(values), [], consumer=Consumer(output=path).stream)
+
+@benchmark('consumer:file')
+def bench_file_writer(size, workdir):
+    return consumer_benchmark(consumers.FileWriter, [synthetic_record(i) for i in range(size)], workdir, 'out.txt')
+
+@benchmark('consumer:csv')
+def bench_csv_writer(size, workdir):
+    return consumer_benchmark(consumers.CSVWriter, [synthetic_record(i) for i in range(size)], workdir, 'out.csv')
+
+@benchmark('consumer:json')
+def bench_json_writer(size, workdir):
+    return consumer_benchmark(consumers.JsonWriter, [synthetic_record(i) for i in range(size)], workdir, 'out.json')
+
+@benchmark('consumer:ndjson')
+def bench_ndjson_writer(size, workdir):
+    return consumer_benchmark(consumers.NDJsonWriter, [synthetic_record(i) for i in range(size)], workdir, 'out.ndjson')
+
+@benchmark('consumer:ndjson-gzip')
+def bench_ndjson_gzip_writer(size, workdir):
+    return consumer_benchmark(consumers.NDJsonWriter, [synthetic_record(i) for i in range(size)], workdir, 'out.ndjson.gz')
+
+@benchmark('consumer:columnar')
+def bench_columnar_writer(size, workdir):
+    path = os.path.join(workdir, 'out.stc')
+    values = [synthetic_record(i) for i in range(size)]
+    return lambda: pipe(source(values), [], consumer=columnar.ColumnarWriter(output=path, format='builtin').stream)
+
+@benchmark('consumer:json-nested')
+def bench_json_writer_nested(size, workdir):
+    return consumer_benchmark(consumers.JsonWriter, [synthetic_nested(i) for i in range(size)], workdir, 'nested.json')
+
+@benchmark('consumer:json-nested-auto')
+def bench_json_writer_nested_auto(size, workdir):
+    write = bench_json_writer_nested(size, workdir)
+    async def run():
+        serializers.set_serializer('auto')
+        try:
+            await write()
+        finally:
+            serializers.set_serializer(serializers.DEFAULT_SERIALIZER)
+    return run
+
+# ========== Serializers ==========
+
+def serializer_benchmark(library):
+    def setup(size, workdir):
+        try:
+            serializer = serializers.LIBRARIES[library]()
+        except ImportError:
+            return None
+        values = [synthetic_nested(i) for i in range(size)]
+        async def run():
+            # A round trip of each value, as parsing and then writing a stream does
+            for value in values:
+                serializer.loads(serializer.dumps(value))
+        return run
+    return setup
+
+for library in serializers.LIBRARIES:
+    benchmark('serializer:{}'.format(library))(serializer_benchmark(library))
+
+# ========== Runner ==========
+
+def measure(run, size, repeat):
+    """ Best-of-`repeat` throughput, then a separate traced pass for peak memory """
+    best = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        sync_exec(run())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    sync_exec(run())
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': best,
+        'throughput': size / best,
+        'peak_memory': peak,
+    }
+
+def compare(name, result, baseline, tolerance):
+    """ Return a list of regression messages """
+    if name not in baseline:
+        return []
+    previous = baseline[name]
+    problems = []
+    if result['throughput'] < previous['throughput'] * (1 - tolerance):
+        problems.append('throughput {:.0f}/s vs baseline {:.0f}/s'.format(result['throughput'], previous['throughput']))
+    if result['peak_memory'] > previous['peak_memory'] * (1 + tolerance):
+        problems.append('peak memory {:.1f}MB vs baseline {:.1f}MB'.format(
+            result['peak_memory'] / 2 ** 20,
+            previous['peak_memory'] / 2 ** 20,
+        ))
+    return problems
+
+def available_loops():
+    try:
+        import uvloop
+    except ImportError:
+        return ['asyncio']
+    return ['asyncio', 'uvloop']
+
+def benchmark_plan(loops):
+    """ Yield (name, setup, loop) with executor benchmarks repeated for each event loop """
+    for name, setup in BENCHMARKS.items():
+        if not name.startswith('executor:'):
+            yield name, setup, 'asyncio'
+            continue
+        for loop in loops:
+            yield (name if loop == 'asyncio' else '{}@{}'.format(name, loop)), setup, loop
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Streamline benchmarks')
+    parser.add_argument('-k', '--filter', nargs='*', help='Only run benchmarks whose name contains one of these')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Number of synthetic entries per benchmark')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per benchmark (best is kept)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write results to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed fractional regression')
+    parser.add_argument('--loops', nargs='*', choices=['asyncio', 'uvloop'], help='Event loops to run executor benchmarks under')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    return parser.parse_args(args)
+
+def main(args):
+    options = parse_args(args)
+    random.seed(0)
+
+    baseline = {}
+    if os.path.exists(options.baseline) and not options.save_baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+    loops = options.loops or available_loops()
+
+    results = {}
+    regressions = {}
+    print('{:<24} {:>14} {:>12} {:>12}  {}'.format('benchmark', 'entries/s', 'seconds', 'peak MB', 'vs baseline'))
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup, loop in benchmark_plan(loops):
+            if options.filter and not any(f in name for f in options.filter):
+                continue
+            if install_event_loop(loop) != loop:
+                print('{:<24} skipped, {} is not available'.format(name, loop))
+                continue
+            run = setup(options.size, workdir)
+            if run is None:
+                print('{:<24} skipped, not installed'.format(name))
+                continue
+            result = measure(run, options.size, options.repeat)
+            result['size'] = options.size
+            results[name] = result
+
+            problems = compare(name, result, baseline, options.tolerance)
+            if problems:
+                regressions[name] = problems
+            status = 'REGRESSED: ' + '; '.join(problems) if problems else ('ok' if name in baseline else '-')
+            print('{:<24} {:>14.0f} {:>12.4f} {:>12.2f}  {}'.format(
+                name,
+                result['throughput'],
+                result['seconds'],
+                result['peak_memory'] / 2 ** 20,
+                status,
+            ))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.save_baseline:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baseline saved to {}'.format(options.baseline))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
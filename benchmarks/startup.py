@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+    Measures how long `streamline` takes to start and process an empty input,
+    which dominates when it is invoked many times from cron or xargs.
+
+    python benchmarks/startup.py                 # time the default noop pipeline
+    python benchmarks/startup.py -- -s json py   # time a different command
+    python benchmarks/startup.py --imports       # also list the slowest imports
+"""
+import subprocess
+import argparse
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'bin', 'streamline')
+DEFAULT_RUNS = 20
+
+def time_command(command, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for i in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, env=env, check=True)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)
+
+def slowest_imports(args, count=15):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', SCRIPT, *args],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    imports = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        imports.append((int(cumulative), name))
+    return sorted(imports, reverse=True)[:count]
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Streamline startup benchmark')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Number of invocations to time')
+    parser.add_argument('--imports', action='store_true', help='Show the slowest imports (cumulative)')
+    parser.add_argument('command', nargs='*', help='streamline arguments (default "-s noop")')
+    options = parser.parse_args(args)
+    streamline_args = options.command or ['-s', 'noop']
+
+    baseline = time_command([sys.executable, '-c', 'pass'], options.runs)
+    timings = time_command([sys.executable, SCRIPT, *streamline_args], options.runs)
+    print('streamline {}'.format(' '.join(streamline_args)))
+    print('  min {:.1f}ms  median {:.1f}ms  max {:.1f}ms  (bare interpreter median {:.1f}ms)'.format(
+        timings[0] * 1000,
+        timings[len(timings) // 2] * 1000,
+        timings[-1] * 1000,
+        baseline[len(baseline) // 2] * 1000,
+    ))
+
+    if options.imports:
+        print('Slowest imports (cumulative us):')
+        for cumulative, name in slowest_imports(streamline_args):
+            print('  {:>8}  {}'.format(cumulative, name))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import asyncio
+import sqlite3
+import json
+import time
+import os
+
+
+def _describe(obj):
+    # Options can hold sentinels like `SSHHandler.NO_SUDO` whose repr changes every run
+    return type(obj).__name__
+
+class ResultCache():
+    """
+        :: On-disk cache of executor results
+
+        Results are stored as JSON in a SQLite database (WAL mode so several
+        runs can share a cache directory) keyed by a hash of the executor
+        namespace (its name and options) and the input value. Entries older
+        than `ttl` seconds are ignored and the least recently used rows are
+        evicted once there are more than `max_entries`.
+
+        Executors use `fetch` and `store`, which run the SQLite queries on a
+        dedicated thread so they never block the event loop.
+    """
+    FILE_NAME = 'streamline-cache.sqlite3'
+    DEFAULT_MAX_ENTRIES = 100000
+    EVICTION_INTERVAL = 1000
+
+    def __init__(self, cache_dir, ttl=None, max_entries=DEFAULT_MAX_ENTRIES):
+        cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.ttl = ttl
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+
+        self.connection = None
+        self.connect()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def connect(self):
+        """ (Re)open the database, e.g. in a forked process which can't share the parent's connection """
+        # A single thread runs every query (see `fetch` and `store`), the connection only moves there
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='streamline-cache')
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS results '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    @staticmethod
+    def make_key(namespace, value):
+        serialized = json.dumps([namespace, value], sort_keys=True, default=_describe)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """ Return a (found, value) pair """
+        row = self.connection.execute('SELECT value, created FROM results WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+            self.misses += 1
+            return False, None
+        self.connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        self.hits += 1
+        return True, json.loads(row[0])
+
+    def put(self, key, value):
+        try:
+            serialized = json.dumps(value)
+        except (TypeError, ValueError):
+            # Only JSON friendly results are cached
+            return
+        now = time.time()
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+            (key, serialized, now, now),
+        )
+        self.stores += 1
+        if self.stores % self.EVICTION_INTERVAL == 1:
+            self.evict()
+
+    async def fetch(self, key):
+        """ `get` off the event loop """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.get, key)
+
+    async def store(self, key, value):
+        """ `put` off the event loop """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.put, key, value)
+
+    def evict(self):
+        count = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self.connection.execute(
+            'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)',
+            (excess,),
+        )
+        self.evictions += excess
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+    def summary(self):
+        return 'Cache: {hits} hits, {misses} misses, {stores} stored, {evictions} evicted\n'.format(**self.stats())
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.evict()
+        self.connection.close()
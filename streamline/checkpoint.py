@@ -0,0 +1,173 @@
+import weakref
+import json
+import time
+import os
+
+from .entries import Entry
+
+
+def _detached():
+    return None
+
+class Lineage():
+    """
+        Counts the live entries descending from one input: the input itself
+        and its clones (e.g. the pieces of `split_lists`). Once none is left
+        every output has either been journaled or dropped (e.g. by a filter)
+        and `on_complete` is called with the index.
+
+        Pickled entries (spilled to disk, sent to a worker process) can't be
+        followed, so pickling pins the lineage; such inputs complete with the
+        run.
+    """
+    __slots__ = ('index', 'live', 'on_complete', '__weakref__')
+
+    def __init__(self, index, on_complete):
+        self.index = index
+        self.live = 0
+        self.on_complete = on_complete
+
+    def track(self, entry):
+        entry.lineage = self
+        self.live += 1
+        # Not on interpreter exit, which isn't the end of the entry's processing
+        weakref.finalize(entry, self.release).atexit = False
+
+    def pin(self):
+        self.live += 1
+
+    def release(self):
+        self.live -= 1
+        if self.live == 0:
+            self.on_complete(self.index)
+
+    def __reduce__(self):
+        self.pin()
+        return (_detached, ())
+
+class CheckpointJournal():
+    """
+        :: Checkpoint journal for resuming long runs
+
+        An append-only file with one JSON record per entry handed to the
+        consumer (`{"index": ..., "input": ..., "value": ...}`), followed by
+        a `{"index": ..., "done": true}` marker once every output of that
+        input has been handed over (see `Lineage`). Records are written in
+        batches and flushed without fsync so journaling doesn't add a syscall
+        per entry. When resuming, inputs with a marker are skipped and their
+        recorded outputs replayed instead; the records of inputs without one
+        (e.g. only some pieces of a split) are dropped and the input rerun.
+
+        Only entries carrying a generator index are journaled, so aggregating
+        streamers (breakdown, stats, ...) aren't meaningfully resumable.
+    """
+    DEFAULT_BATCH_SIZE = 500
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, path, resume=False, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = os.path.expanduser(path)
+        self.resume = resume
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.completed = {}
+        self.lineages = {}
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.target = None
+
+        if resume:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        unfinished = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A partially written final line from a run that died
+                    continue
+                if record.get('done'):
+                    self.completed[record['index']] = unfinished.pop(record['index'], [])
+                else:
+                    unfinished.setdefault(record['index'], []).append(record)
+
+    def _serialize(self, entry):
+        record = {'index': entry.index}
+        for key, value in (('input', entry.original_value), ('value', entry.value)):
+            try:
+                record[key] = json.loads(json.dumps(value))
+            except (TypeError, ValueError):
+                record[key] = str(value)
+        return json.dumps(record) + '\n'
+
+    def record(self, entry):
+        if entry.index is None:
+            return
+        self.pending.append(self._serialize(entry))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def track(self, entry):
+        lineage = Lineage(entry.index, self.complete)
+        self.lineages[entry.index] = lineage
+        lineage.track(entry)
+
+    def complete(self, index):
+        # Called when the last entry of an input is garbage collected, so only queues the marker
+        if self.lineages.pop(index, None) is not None:
+            self.pending.append(json.dumps({'index': index, 'done': True}) + '\n')
+
+    def _open_target(self):
+        if not self.resume:
+            return open(self.path, 'w')
+        # A resume starts from the finished inputs only, so the records of unfinished ones aren't read twice
+        temp_path = self.path + '.tmp'
+        target = open(temp_path, 'w')
+        for index, records in self.completed.items():
+            target.writelines(json.dumps(record) + '\n' for record in records)
+            target.write(json.dumps({'index': index, 'done': True}) + '\n')
+        target.flush()
+        os.replace(temp_path, self.path)
+        return target
+
+    def flush(self):
+        if self.target is None:
+            self.target = self._open_target()
+        # Markers can be queued while writing
+        pending, self.pending = self.pending, []
+        if pending:
+            self.target.write(''.join(pending))
+        self.target.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        # The stream is over, so inputs still followed (e.g. pinned) are finished too
+        for index in list(self.lineages):
+            self.complete(index)
+        self.flush()
+        self.target.close()
+        self.target = None
+
+    async def skip_completed(self, source):
+        """ Streamer for the start of the pipeline that drops inputs finished by a previous run """
+        async for entry in source:
+            if entry.index not in self.completed:
+                if entry.index is not None:
+                    self.track(entry)
+                yield entry
+
+    async def replay_and_record(self, source):
+        """ Streamer for the end of the pipeline that replays finished outputs and journals new ones """
+        for index, records in self.completed.items():
+            for record in records:
+                entry = Entry(record['input'], index=index)
+                entry.value = record['value']
+                yield entry
+
+        async for entry in source:
+            yield entry
+            # Control returns here once the consumer has asked for the next entry (i.e. written this one)
+            self.record(entry)
+        self.close()
@@ -1,17 +1,21 @@
 import argparse
 import asyncio
 import logging
-import yaml
+import time
 import sys
 import os
 import re
 
 from . import utils
-from . import executors
 from . import generators
 from . import consumers
 from . import streamers
-from .core import pipe
+from . import serializers
+from . import spill
+from .core import pipe, fuse, install_event_loop, EVENT_LOOPS, DEFAULT_EVENT_LOOP
+from .retry import RetryPolicy
+from .checkpoint import CheckpointJournal
+from .metrics import MetricsCollector
 
 logger = logging.getLogger(__file__)
 
@@ -61,13 +65,166 @@ def _parser_main():
     cmd_parser.add_argument(
         '-p', '--progress',
         choices=['buffer', 'stream-output', 'streaming'],
-        help='Print progress to stdout. ("buffer": buffers input and output, "stream-output" buffers only input, "stream" for no buffering at all)',
+        help='Print progress to stderr. ("buffer": buffers input and output, "stream-output" buffers only input, "stream" for no buffering at all)',
     )
     cmd_parser.add_argument(
         '-w', '--workers',
         type=int,
         help='Number of concurrent workers for any one async execution module to have',
     )
+    cmd_parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        default=None,
+        help='Adjust the worker count of async execution modules from observed latency and errors (starting at --workers)',
+    )
+    cmd_parser.add_argument(
+        '--min-workers',
+        type=int,
+        help='Lower bound of the worker count in --adaptive mode (default 1)',
+    )
+    cmd_parser.add_argument(
+        '--max-workers',
+        type=int,
+        help='Upper bound of the worker count in --adaptive mode (default 4x --workers)',
+    )
+    cmd_parser.add_argument(
+        '--rate',
+        type=float,
+        help='Maximum executions per second for any one async execution module',
+    )
+    cmd_parser.add_argument(
+        '--burst',
+        type=int,
+        help='Number of executions allowed to start at once before --rate kicks in (default 1)',
+    )
+    cmd_parser.add_argument(
+        '--group-key',
+        help='Selector for a key (e.g. "value.domain") to limit concurrency per group of entries with --group-workers',
+    )
+    cmd_parser.add_argument(
+        '--group-workers',
+        type=int,
+        help='Number of concurrent workers allowed per --group-key value',
+    )
+    cmd_parser.add_argument(
+        '--retries',
+        type=int,
+        help='Retry failed executions of async execution modules this many times',
+    )
+    cmd_parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        help='Initial retry wait in seconds, doubling each attempt with random jitter (default {})'.format(RetryPolicy.DEFAULT_BACKOFF),
+    )
+    cmd_parser.add_argument(
+        '--retry-max-delay',
+        type=float,
+        help='Longest wait between retries in seconds (default {})'.format(RetryPolicy.DEFAULT_MAX_DELAY),
+    )
+    cmd_parser.add_argument(
+        '--retry-exceptions',
+        help='Only retry these exception types (e.g. "ConnectionError,TimeoutError"). Default is any exception',
+    )
+    cmd_parser.add_argument(
+        '--retry-exit-codes',
+        help='Also retry results with these exit codes (e.g. "255")',
+    )
+    cmd_parser.add_argument(
+        '--retry-status-codes',
+        help='Also retry HTTP results with these status codes (e.g. "429,5xx")',
+    )
+    cmd_parser.add_argument(
+        '--timeout',
+        type=float,
+        help='Seconds an async execution module may spend on a single entry before it is cancelled',
+    )
+    cmd_parser.add_argument(
+        '--deadline',
+        type=float,
+        help='Seconds the whole run may take. Entries still executing (or not yet started) after this time are errored',
+    )
+    cmd_parser.add_argument(
+        '--dedupe',
+        action='store_true',
+        default=None,
+        help='Run async execution modules once per distinct value, sharing the result with duplicate entries',
+    )
+    cmd_parser.add_argument(
+        '--dedupe-memo',
+        type=int,
+        help='Number of finished results to remember for --dedupe (default {})'.format(
+            streamers.AsyncExecutor.DEFAULT_DEDUPE_MEMO,
+        ),
+    )
+    cmd_parser.add_argument(
+        '--cache-dir',
+        help='Cache results of async execution modules in this directory and reuse them for repeated inputs',
+    )
+    cmd_parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        help='Ignore cached results older than this many seconds',
+    )
+    cmd_parser.add_argument(
+        '--cache-size',
+        type=int,
+        help='Maximum number of cached results to keep (least recently used are evicted)',
+    )
+    cmd_parser.add_argument(
+        '--checkpoint',
+        help='Record finished entries in this journal file so an interrupted run can be resumed',
+    )
+    cmd_parser.add_argument(
+        '--resume',
+        help='Resume from a --checkpoint journal, skipping finished inputs and replaying their output',
+    )
+    cmd_parser.add_argument(
+        '--metrics',
+        action='store_true',
+        default=None,
+        help='Print per-stage entry counts, timings and executor latencies to stderr at exit',
+    )
+    cmd_parser.add_argument(
+        '--metrics-file',
+        help='Periodically write the metrics as JSON to this file',
+    )
+    cmd_parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        help='Seconds between --metrics-file writes (default {})'.format(MetricsCollector.DEFAULT_INTERVAL),
+    )
+    cmd_parser.add_argument(
+        '--profile',
+        help='Profile the run, writing pstats to this file, flamegraph stacks to <file>.collapsed and event loop lag to stderr',
+    )
+    cmd_parser.add_argument(
+        '--processes',
+        type=int,
+        help='Run the streamers in this many processes (streamers that need every entry, like sort or stats, and those after them stay in the main process)',
+    )
+    cmd_parser.add_argument(
+        '--ordered',
+        action='store_true',
+        default=None,
+        help='Keep entries in input order when using --processes',
+    )
+    cmd_parser.add_argument(
+        '--loop',
+        choices=EVENT_LOOPS,
+        help='Event loop implementation ("auto" uses uvloop when installed, default {})'.format(DEFAULT_EVENT_LOOP),
+    )
+    cmd_parser.add_argument(
+        '--serializer',
+        choices=serializers.SERIALIZERS,
+        help='JSON library used to read and write values ("auto" uses orjson or ujson when installed for speed, writing compact JSON; default {})'.format(
+            serializers.DEFAULT_SERIALIZER,
+        ),
+    )
+    cmd_parser.add_argument(
+        '--memory-limit',
+        help='Memory buffered entries (buffer, sort, buffered progress) may use before spilling to temporary files, e.g. "512M" (default no limit)',
+    )
     cmd_parser.add_argument(
         '-y', '--yaml',
         help='Take options from a yaml or json config file',
@@ -149,6 +306,15 @@ def wrap_streamer(streamer, input_path=None, output_path=None, target=None):
         subpipe.append(combiner.stream)
     return subpipe
 
+def async_executors(command_streamers):
+    """ Find the AsyncExecutor instances behind a list of streamers """
+    found = []
+    for streamer in command_streamers:
+        owner = getattr(streamer, '__self__', None)
+        if isinstance(owner, streamers.AsyncExecutor):
+            found.append(owner)
+    return found
+
 def streamline_command(args):
     if args and '-s' not in args:
         args.insert(0, '-s'),
@@ -159,6 +325,8 @@ def streamline_command(args):
     yaml_config = {}
     use_yaml = main_args.yaml is not None
     if main_args.yaml:
+        # Imported here as yaml is slow to import and most runs don't need it
+        import yaml
         with open(main_args.yaml, 'r') as f:
             yaml_config = yaml.safe_load(f.read())
 
@@ -171,6 +339,9 @@ def streamline_command(args):
             'consumer': 'file',
             'workers': streamers.AsyncExecutor.DEFAULT_WORKERS,
             'streamers': [],
+            'loop': DEFAULT_EVENT_LOOP,
+            'serializer': serializers.DEFAULT_SERIALIZER,
+            'memory_limit': spill.DEFAULT_MEMORY_LIMIT,
         },
         {
             'generator': yaml_generator_config.get('name', None),
@@ -179,7 +350,50 @@ def streamline_command(args):
         main_args,
         ignore_nulls=True,
     )
-    ae_args = {'workers': command_config.get('workers')}
+    if command_config['loop'] not in EVENT_LOOPS:
+        # --loop is checked by argparse, this is the STREAMLINE_EVENT_LOOP default
+        main_parser.error('invalid STREAMLINE_EVENT_LOOP: {!r} (choose from {})'.format(
+            command_config['loop'],
+            ', '.join(repr(loop) for loop in EVENT_LOOPS),
+        ))
+    # Everything below may grab the event loop so the policy has to be in place first
+    install_event_loop(command_config['loop'])
+    serializers.set_serializer(command_config['serializer'])
+    spill.set_memory_limit(command_config.get('memory_limit'))
+
+    ae_args = {
+        'workers': command_config.get('workers'),
+        'timeout': command_config.get('timeout'),
+        'adaptive': command_config.get('adaptive', False),
+        'min_workers': command_config.get('min_workers'),
+        'max_workers': command_config.get('max_workers'),
+        'rate': command_config.get('rate'),
+        'burst': command_config.get('burst'),
+        'group_key': command_config.get('group_key'),
+        'group_workers': command_config.get('group_workers'),
+        'dedupe': command_config.get('dedupe', False),
+        'dedupe_memo': command_config.get('dedupe_memo', streamers.AsyncExecutor.DEFAULT_DEDUPE_MEMO),
+    }
+    cache = None
+    if command_config.get('cache_dir'):
+        from .cache import ResultCache
+        cache = ResultCache(
+            command_config['cache_dir'],
+            ttl=command_config.get('cache_ttl'),
+            max_entries=command_config.get('cache_size'),
+        )
+        ae_args['cache'] = cache
+    if command_config.get('retries'):
+        ae_args['retry'] = RetryPolicy(
+            attempts=command_config['retries'] + 1,
+            backoff=command_config.get('retry_backoff', RetryPolicy.DEFAULT_BACKOFF),
+            max_delay=command_config.get('retry_max_delay', RetryPolicy.DEFAULT_MAX_DELAY),
+            exceptions=command_config.get('retry_exceptions'),
+            exit_codes=command_config.get('retry_exit_codes'),
+            status_codes=command_config.get('retry_status_codes'),
+        )
+    if command_config.get('deadline') is not None:
+        ae_args['deadline'] = time.monotonic() + command_config['deadline']
         
     # Load Generator & Consumer
     Generator = generators.load_generator(command_config['generator'])
@@ -269,21 +483,81 @@ def streamline_command(args):
         sys.stderr.write('Extra arguments found: {}\n'.format(' '.join(options_processor.remaining_args())))
         sys.exit(2)
 
+    # Shard the per-entry streamers across processes, everything from the first global streamer on stays here
+    if command_config.get('processes', 1) > 1:
+        from .sharding import ShardedPipeline, split_streamers
+        sharded, command_streamers = split_streamers(command_streamers)
+        if sharded:
+            # A leading aggregate is partially computed in each process and merged here
+            aggregate = None
+            if command_streamers and isinstance(getattr(command_streamers[0], '__self__', None), streamers.AggregateStreamer):
+                aggregate = command_streamers.pop(0).__self__
+            shards = ShardedPipeline(
+                sharded,
+                processes=command_config['processes'],
+                ordered=command_config.get('ordered', False),
+                aggregate=aggregate,
+            )
+            command_streamers = [shards.stream, *command_streamers]
+
+    # Run adjacent synchronous per-entry streamers in one loop (done here so metrics see the fused stage)
+    command_streamers = fuse(command_streamers)
+
+    # Instrument the user's pipeline before adding our own hidden streamers
+    source = generator.stream()
+    consumer_stream = consumer.stream
+    metrics = None
+    if command_config.get('metrics') or command_config.get('metrics_file'):
+        metrics = MetricsCollector()
+        source, command_streamers, consumer_stream = metrics.instrument(source, command_streamers, consumer_stream)
+
     # Override streamers
     progress_option = command_config.get('progress', None)
     if command_config.get('progress', None):
         buffer_start = progress_option in ('buffer', 'stream-output')
         buffer_end = progress_option in ('buffer')
-        progress = streamers.ProgressStreamer(buffer_start=buffer_start, buffer_end=buffer_end)
+        progress = streamers.ProgressStreamer(
+            buffer_start=buffer_start,
+            buffer_end=buffer_end,
+            executors=async_executors(command_streamers),
+        )
         command_streamers = [progress.streamer_start, *command_streamers, progress.streamer_end]
 
-    future = pipe(generator.stream(), command_streamers, consumer=consumer.stream)
+    # Checkpointing wraps everything else so progress reflects only the remaining work
+    if command_config.get('checkpoint') or command_config.get('resume'):
+        journal = CheckpointJournal(
+            command_config.get('resume') or command_config.get('checkpoint'),
+            resume=bool(command_config.get('resume')),
+        )
+        source = journal.skip_completed(source)
+        command_streamers = [*command_streamers, journal.replay_and_record]
+
+    future = pipe(source, command_streamers, consumer=consumer_stream)
+    if metrics:
+        future = metrics.run(
+            future,
+            path=command_config.get('metrics_file'),
+            interval=command_config.get('metrics_interval', MetricsCollector.DEFAULT_INTERVAL),
+        )
+    profiler = None
+    if command_config.get('profile'):
+        from .profiling import PipelineProfiler
+        profiler = PipelineProfiler(command_config['profile'])
+        future = profiler.run(future)
 
     # Loop until complete
     loop = asyncio.get_event_loop()
     task = asyncio.ensure_future(future, loop=loop)
     loop.run_until_complete(task)
 
+    if profiler:
+        sys.stderr.write(profiler.summary())
+    if metrics and command_config.get('metrics'):
+        sys.stderr.write(metrics.summary())
+    if cache:
+        sys.stderr.write(cache.summary())
+        cache.close()
+
 def load_streamer(path, options_processor=None, options=None, print_help=False, ae_args=None):
     kwargs = {}
     if options:
@@ -316,7 +590,7 @@ def load_streamer(path, options_processor=None, options=None, print_help=False,
             executor = Executor
 
         # Now build the wrapper
-        ae = streamers.AsyncExecutor(executor, **ae_args)
+        ae = streamers.AsyncExecutor(executor, cache_namespace=[path, kwargs], **ae_args)
         return ae.stream
     else:
         if type(Streamer) == type:
@@ -0,0 +1,414 @@
+from importlib import import_module
+from array import array
+import struct
+import json
+import sys
+import os
+
+from . import serializers
+from . import utils
+
+COLUMN_TYPES = ('bool', 'int', 'float', 'str', 'json')
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def infer_type(values, default='str'):
+    """ The narrowest column type holding all the (non-null) values, `default` when they're all null """
+    types = {type(value) for value in values if value is not None}
+    if not types:
+        return default
+    if types <= {int, float} and any(type(value) is int and not INT64_MIN <= value <= INT64_MAX for value in values):
+        # Kept exact rather than overflowing int64 or rounded to a float
+        return 'json'
+    if types == {bool}:
+        return 'bool'
+    if types == {int}:
+        return 'int'
+    if types <= {int, float}:
+        return 'float'
+    if types == {str}:
+        return 'str'
+    return 'json'
+
+def widen_type(column_type, values):
+    """ `column_type`, or if some of the values don't fit it the narrowest type holding them as well """
+    if column_type in ('str', 'json'):
+        # Anything can be written as text
+        return column_type
+    needed = infer_type(values, default=column_type)
+    if needed == column_type:
+        return column_type
+    if {column_type, needed} == {'int', 'float'}:
+        return 'float'
+    return 'json'
+
+# Values of a bool or int column are written as they are
+CONVERTERS = {
+    'bool': None,
+    'int': None,
+    'float': float,
+    'str': utils.force_string,
+    'json': serializers.dumps,
+}
+
+class Column():
+    """ A column collecting one batch of values at a time, widening its type when values don't fit it """
+    def __init__(self, name, column_type):
+        self.name = name
+        self.type = column_type
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def take(self):
+        """ The batch of values converted to the column type, widened first if need be """
+        values = self.values
+        self.values = []
+        column_type = widen_type(self.type, values)
+        if column_type != self.type:
+            sys.stderr.write('Column {} widened from {} to {} to fit its values\n'.format(self.name, self.type, column_type))
+            self.type = column_type
+        convert = CONVERTERS[column_type]
+        if convert is None:
+            return values
+        return [None if value is None else convert(value) for value in values]
+
+# ========== Built-in format ==========
+#
+#   b'STLCOL2\n'
+#   u32 length + schema JSON: {"columns": [{"name": ..., "type": ...}, ...]}
+#   batches, each: u64 row count, then per column a u64 byte length followed by
+#       the column type of this batch (1 byte, an index into COLUMN_TYPES), the
+#       validity bytes (1 per row) and the data: bool as 1 byte per row, int as
+#       int64, float as float64, str/json as int64 offsets (rows + 1) into a
+#       utf-8 blob
+#   u64 0 to mark the end
+#
+#   All numbers are little endian. The byte length of each column lets a
+#   reader skip columns it doesn't need. The schema has the type of the first
+#   batch, a column widened later on (e.g. int to float) says so per batch.
+
+MAGIC = b'STLCOL2\n'
+LENGTH = struct.Struct('<Q')
+SCHEMA_LENGTH = struct.Struct('<I')
+
+def _to_bytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode_column(column_type, values):
+    validity = bytes([COLUMN_TYPES.index(column_type)]) + bytes(value is not None for value in values)
+    if column_type == 'bool':
+        data = bytes(bool(value) for value in values)
+    elif column_type == 'int':
+        data = _to_bytes(array('q', [0 if value is None else value for value in values]))
+    elif column_type == 'float':
+        data = _to_bytes(array('d', [0.0 if value is None else value for value in values]))
+    else:
+        encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+        offsets = array('q', [0])
+        position = 0
+        for item in encoded:
+            position += len(item)
+            offsets.append(position)
+        data = _to_bytes(offsets) + b''.join(encoded)
+    return validity + data
+
+def decode_column(rows, data):
+    column_type = COLUMN_TYPES[data[0]]
+    validity = data[1:rows + 1]
+    data = data[rows + 1:]
+    if column_type == 'bool':
+        values = [bool(value) for value in data]
+    elif column_type == 'int':
+        values = _from_bytes('q', data).tolist()
+    elif column_type == 'float':
+        values = _from_bytes('d', data).tolist()
+    else:
+        size = (rows + 1) * 8
+        offsets = _from_bytes('q', data[:size])
+        blob = data[size:]
+        values = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(rows)]
+        if column_type == 'json':
+            values = [serializers.loads(value) if valid else None for value, valid in zip(values, validity)]
+    return [value if valid else None for value, valid in zip(values, validity)]
+
+class BuiltinColumnarWriter():
+    def __init__(self, path, schema):
+        self.target = open(path, 'wb')
+        header = json.dumps({'columns': [{'name': name, 'type': column_type} for name, column_type in schema]})
+        header = header.encode('utf-8')
+        self.target.write(MAGIC + SCHEMA_LENGTH.pack(len(header)) + header)
+
+    def write_batch(self, columns, types):
+        rows = len(columns[0]) if columns else 0
+        if rows == 0:
+            return
+        chunks = [LENGTH.pack(rows)]
+        for column_type, values in zip(types, columns):
+            encoded = encode_column(column_type, values)
+            chunks.append(LENGTH.pack(len(encoded)))
+            chunks.append(encoded)
+        self.target.write(b''.join(chunks))
+
+    def close(self, complete=True):
+        # Without the end marker a failed run reads as truncated rather than complete
+        if complete:
+            self.target.write(LENGTH.pack(0))
+        self.target.close()
+
+def _read_exact(f, size, path):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('{} is truncated'.format(path))
+    return data
+
+def read_columnar(path, columns=None):
+    """
+        Read a file written in the built-in columnar format returning a dict
+        of column name to list of values. Only the named `columns` are decoded
+        when given.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a streamline columnar file'.format(path))
+        header_length, = SCHEMA_LENGTH.unpack(_read_exact(f, SCHEMA_LENGTH.size, path))
+        schema = json.loads(_read_exact(f, header_length, path).decode('utf-8'))['columns']
+        wanted = [column['name'] for column in schema if columns is None or column['name'] in columns]
+        result = {name: [] for name in wanted}
+
+        while True:
+            rows, = LENGTH.unpack(_read_exact(f, LENGTH.size, path))
+            if rows == 0:
+                break
+            for column in schema:
+                size, = LENGTH.unpack(_read_exact(f, LENGTH.size, path))
+                if column['name'] not in result:
+                    f.seek(size, 1)
+                    continue
+                result[column['name']].extend(decode_column(rows, _read_exact(f, size, path)))
+    return result
+
+# ========== pyarrow ==========
+
+class ArrowColumnarWriter():
+    """ Parquet or Arrow IPC ("arrow") output through pyarrow """
+    def __init__(self, path, schema, file_format='parquet'):
+        utils.inject_module('pyarrow', globals())
+        arrow_types = {
+            'bool': pyarrow.bool_(),
+            'int': pyarrow.int64(),
+            'float': pyarrow.float64(),
+            'str': pyarrow.string(),
+            'json': pyarrow.string(),
+        }
+        self.schema = pyarrow.schema([(name, arrow_types[column_type]) for name, column_type in schema])
+        self.column_types = dict(schema)
+        if file_format == 'parquet':
+            import_module('pyarrow.parquet')
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            import_module('pyarrow.ipc')
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write_batch(self, columns, types):
+        if not columns or not columns[0]:
+            return
+        for field, column_type in zip(self.schema, types):
+            if column_type != self.column_types[field.name]:
+                # Batches already written can't change type, failing beats writing nulls
+                raise ValueError(
+                    'Column {} needs type {} but was written as {}, try a larger --batch-size or --format builtin'.format(
+                        field.name, column_type, self.column_types[field.name],
+                    )
+                )
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+
+    def close(self, complete=True):
+        self.writer.close()
+
+def pyarrow_available():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+# Extensions that name a format only pyarrow can write
+PYARROW_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+
+def resolve_format(path, file_format='auto'):
+    """
+        The format "auto" stands for: from the extension for Parquet or Arrow
+        files (which need pyarrow), otherwise Parquet when pyarrow is installed
+        and the built-in format when it isn't
+    """
+    if file_format != 'auto':
+        return file_format
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PYARROW_EXTENSIONS:
+        if not pyarrow_available():
+            raise ValueError('Writing {} files requires pyarrow (try "pip install pyarrow") or use --format builtin'.format(extension))
+        return PYARROW_EXTENSIONS[extension]
+    return 'parquet' if pyarrow_available() else 'builtin'
+
+def open_writer(path, schema, file_format='auto'):
+    """ A columnar writer for `schema` (a list of (name, type) pairs) """
+    file_format = resolve_format(path, file_format)
+    if file_format == 'builtin':
+        return BuiltinColumnarWriter(path, schema)
+    return ArrowColumnarWriter(path, schema, file_format=file_format)
+
+class ColumnarWriter():
+    """
+        :: Columnar file writer
+
+        Collects entries into batches of rows and writes them column by column
+        as Parquet (or Arrow IPC with --format arrow) through pyarrow when it
+        is installed, otherwise in a simple built-in typed format that
+        `streamline.columnar.read_columnar` reads back. A .parquet, .arrow or
+        .feather output always needs pyarrow.
+
+        Columns are taken from the first entry like the csv consumer (dict keys
+        or named tuple fields, else "input" and "value") and each column type
+        (bool, int, float, str or json) is inferred from the first batch. When
+        later values don't fit, the built-in format widens the column (int to
+        float, anything else to json) while Parquet and Arrow, whose schema is
+        fixed once written, fail.
+    """
+    FORMATS = ('auto', 'parquet', 'arrow', 'builtin')
+    BATCH_SIZE = 10000
+
+    @classmethod
+    def args(cls, parser):
+        parser.add_argument('--output', required=True, help='File to write')
+        parser.add_argument(
+            '--format',
+            choices=cls.FORMATS,
+            default='auto',
+            help='Output format (Default from a .parquet/.arrow/.feather extension, else parquet when pyarrow is installed, else builtin)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=cls.BATCH_SIZE,
+            help='Rows per record batch (Default {})'.format(cls.BATCH_SIZE),
+        )
+        parser.add_argument(
+            '--input-column',
+            action='store_true',
+            default=False,
+            help='Automatically add a column for input value',
+        )
+
+    def __init__(self, output=None, format='auto', batch_size=BATCH_SIZE, input_column=False):
+        if not output or output == '-':
+            raise ValueError('Columnar output requires an --output file name')
+        if format not in self.FORMATS:
+            raise ValueError('Invalid columnar format: {}'.format(format))
+        self.target_name = output
+        # Resolved up front so a missing pyarrow is reported before any work is done
+        self.format = resolve_format(output, format)
+        self.batch_size = batch_size
+        self.input_column = input_column
+        self.columns = None
+        self.writer = None
+
+    def _parse_fields(self, entry):
+        if isinstance(entry.value, dict):
+            return list(entry.value.keys())
+        elif isinstance(entry.value, tuple) and hasattr(entry.value, '_fields'):
+            return list(entry.value._fields)
+        else:
+            return None
+
+    def _get_values(self, entry, fields):
+        if fields is None:
+            return [entry.original_value, entry.value]
+
+        if isinstance(entry.value, dict):
+            values = [entry.value.get(field) for field in fields]
+        elif isinstance(entry.value, tuple) and hasattr(entry.value, '_fields'):
+            values = [getattr(entry.value, field, None) for field in fields]
+        else:
+            values = [None] * len(fields)
+
+        if self.input_column:
+            values.insert(0, entry.original_value)
+        return values
+
+    def _open(self, names, rows):
+        """ Infer the column types from the first batch of rows and start the file """
+        self.columns = [
+            Column(name, infer_type([row[index] for row in rows]))
+            for index, name in enumerate(names)
+        ]
+        schema = [(column.name, column.type) for column in self.columns]
+        self.writer = open_writer(self.target_name, schema, file_format=self.format)
+        for row in rows:
+            self._append(row)
+
+    def _append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def _flush(self):
+        values = [column.take() for column in self.columns]
+        self.writer.write_batch(values, [column.type for column in self.columns])
+
+    async def stream(self, source):
+        try:
+            await self._write_entries(source)
+        except BaseException:
+            if self.writer is not None:
+                self.writer.close(complete=False)
+            raise
+
+    async def _write_entries(self, source):
+        fields = None
+        names = None
+        pending = []
+        rows = 0
+        async for entry in source:
+            if names is None:
+                fields = self._parse_fields(entry)
+                if fields is None:
+                    names = ['input', 'value']
+                else:
+                    names = (['input'] if self.input_column else []) + fields
+
+            values = self._get_values(entry, fields)
+            if self.writer is None:
+                pending.append(values)
+                if len(pending) >= self.batch_size:
+                    self._open(names, pending)
+                    pending = []
+                    self._flush()
+                continue
+
+            self._append(values)
+            rows += 1
+            if rows >= self.batch_size:
+                self._flush()
+                rows = 0
+
+        if self.writer is None:
+            # Fewer entries than a batch (or none at all, leaving a file without columns)
+            self._open(names or [], pending)
+        self._flush()
+        self.writer.close()
@@ -0,0 +1,94 @@
+import contextlib
+import asyncio
+import time
+
+
+class AdaptiveLimit():
+    """
+        :: AIMD concurrency limit
+
+        Works like TCP congestion control: every healthy completion grows the
+        limit by roughly one per "window" of completions while a failure, or a
+        latency well above the best we've seen, cuts it multiplicatively. Only
+        executions started after the last cut can trigger another one so a
+        burst of slow results from a single overloaded window only counts once.
+    """
+    DEFAULT_BACKOFF = 0.7
+    DEFAULT_TOLERANCE = 2.0
+    BASELINE_DRIFT = 0.01
+
+    def __init__(self, initial, min_limit=1, max_limit=None, backoff=DEFAULT_BACKOFF, tolerance=DEFAULT_TOLERANCE):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit or initial
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.tolerance = tolerance
+
+        self.baseline = None
+        self.last_decrease = time.monotonic()
+
+    def current(self):
+        return int(self.limit)
+
+    def record(self, started, latency, failed=False):
+        """ Feed back the outcome of an execution that began at `started` (a `time.monotonic()` value) """
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Let the baseline creep upwards so a permanent shift in remote latency isn't treated as congestion forever
+            self.baseline += (latency - self.baseline) * self.BASELINE_DRIFT
+
+        congested = failed or latency > self.baseline * self.tolerance
+        if not congested:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif started >= self.last_decrease:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self.last_decrease = time.monotonic()
+
+class TokenBucket():
+    """
+        :: Rate limiter
+
+        Tokens refill at `rate` per second up to `burst`. Callers reserve a
+        token up front (letting the balance go negative) and sleep until it
+        would have been available, so waiters are served in arrival order
+        without polling.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, burst or 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+class KeyedSemaphore():
+    """ A semaphore per key, created on demand and dropped again once nobody holds or waits on it """
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphores = {}
+        self.users = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(self.limit)
+            self.users[key] = 0
+        self.users[key] += 1
+        try:
+            async with self.semaphores[key]:
+                yield
+        finally:
+            self.users[key] -= 1
+            if self.users[key] == 0:
+                del self.users[key]
+                del self.semaphores[key]
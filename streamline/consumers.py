@@ -1,12 +1,24 @@
-import json
+import math
 import csv
+import sys
 import os
 
+from . import serializers
 from . import utils 
 
 def stringify_all(source):
     return [utils.force_string(v) for v in source]
 
+def csv_cell(value):
+    """ Leave strings and numbers for the csv writer to format, anything else is stringified as usual """
+    value_type = type(value)
+    if value_type is str or value_type is int or (value_type is float and math.isfinite(value)):
+        return value
+    return utils.force_string(value)
+
+def csv_cells(values):
+    return [csv_cell(value) for value in values]
+
 class FileWriter():
     DEFAULT_OUTPUT = '-'
     DELIMITER = '\n'
@@ -75,23 +87,29 @@ class CSVWriter():
         self.input_column = input_column
 
     def _parse_fields(self, entry):
-        if not isinstance(entry.value, dict):
-            return None
-        else:
+        if isinstance(entry.value, dict):
             return entry.value.keys()
+        elif isinstance(entry.value, tuple) and hasattr(entry.value, '_fields'):
+            # Named tuple rows (e.g. from the csv generator's --tuples)
+            return entry.value._fields
+        else:
+            return None
     
     def _get_values(self, entry, fields):
         if fields is None:
-            return stringify_all((entry.original_value, entry.value))
+            return csv_cells((entry.original_value, entry.value))
 
-        # Return blanks for all invalid rows
-        if not isinstance(entry.value, dict):
+        if isinstance(entry.value, dict):
+            values = [entry.value.get(field, '') for field in fields]
+        elif isinstance(entry.value, tuple) and hasattr(entry.value, '_fields'):
+            values = [getattr(entry.value, field, '') for field in fields]
+        else:
+            # Return blanks for all invalid rows
             return [''] * len(fields)
 
-        values = [entry.value.get(field, '') for field in fields]
         if self.input_column:
             values.insert(0, entry.original_value)
-        return stringify_all(values)
+        return csv_cells(values)
 
     async def stream(self, source):
         self.target = utils.get_file_io(self.target_name, write=True)
@@ -121,6 +139,7 @@ class CSVWriter():
 
 class JsonWriter():
     DEFAULT_OUTPUT = '-'
+    BLOCK_SIZE = 2 ** 16
 
     @classmethod
     def args(cls, parser):
@@ -135,26 +154,213 @@ class JsonWriter():
 
     async def stream(self, source):
         self.target = utils.get_file_io(self.target_name, write=True)
-        self.target.write('[\n')
-        first = True
+        dumps = serializers.get_serializer().dumps
+
+        # Collect output into large blocks rather than writing a few bytes at a time
+        block = ['[\n']
+        block_size = 0
+        separator = '    '
         async for entry in source:
-            if not first:
-                self.target.write(',\n    ')
-            else:
-                self.target.write('    ')
-            self.target.write(json.dumps(entry.value))
-            first = False
-        self.target.write('\n]')
+            text = dumps(entry.value)
+            block.append(separator)
+            block.append(text)
+            separator = ',\n    '
+            block_size += len(text)
+            if block_size >= self.BLOCK_SIZE:
+                self.target.write(''.join(block))
+                block = []
+                block_size = 0
+        block.append('\n]')
+        self.target.write(''.join(block))
 
         if hasattr(self.target, 'close'):
             self.target.close()
 
+class TextOutput():
+    """ Takes utf-8 bytes for a stream that only accepts text """
+    def __init__(self, target):
+        self.target = target
+
+    def write(self, data):
+        return self.target.write(data.decode('utf-8'))
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        self.flush()
+
+class NDJsonWriter():
+    """
+        :: Newline delimited JSON writer
+
+        Writes one JSON document per line, optionally compressed (picked from
+        the file extension unless --compress is given) and rotated to a new
+        segment after a number of entries or (uncompressed) bytes. Segments
+        are written to a hidden temporary file and renamed into place once
+        complete so readers never see a partial segment.
+
+        When rotating, the output name can hold a "{part}" placeholder (e.g.
+        "events-{part:05d}.ndjson.gz"), otherwise the part number is added
+        before the extension.
+    """
+    DEFAULT_OUTPUT = '-'
+    BLOCK_SIZE = 2 ** 20
+
+    @classmethod
+    def args(cls, parser):
+        parser.add_argument(
+            '--output',
+            default=cls.DEFAULT_OUTPUT,
+            help='Set target of output (Default stdout)',
+        )
+        parser.add_argument(
+            '--compress',
+            choices=utils.COMPRESSIONS,
+            help='Compress the output (Default from the file extension: .gz, .bz2, .xz or .zst)',
+        )
+        parser.add_argument(
+            '--compress-level',
+            type=int,
+            help='Compression level',
+        )
+        parser.add_argument(
+            '--rotate-size',
+            help='Start a new file after this much uncompressed data (e.g. "512M")',
+        )
+        parser.add_argument(
+            '--rotate-entries',
+            type=int,
+            help='Start a new file after this many entries',
+        )
+        parser.add_argument(
+            '--block-size',
+            help='Buffer this much output between writes (Default 1M)',
+        )
+
+    def __init__(self, output=DEFAULT_OUTPUT, compress=None, compress_level=None, rotate_size=None,
+                 rotate_entries=None, block_size=None):
+        self.target_name = output
+        self.compression = compress or utils.compression_from_name(output)
+        self.compress_level = compress_level
+        self.rotate_size = utils.parse_size(rotate_size)
+        self.rotate_entries = rotate_entries
+        self.block_size = utils.parse_size(block_size) or self.BLOCK_SIZE
+        self.rotating = bool(self.rotate_size or self.rotate_entries)
+        if self.rotating and self.target_name == '-':
+            raise ValueError('Rotating output requires an --output file name')
+
+        self.part = 0
+        self.paths = []
+        self.raw = None
+        self.target = None
+        self.temp_path = None
+        self.segment_entries = 0
+        self.segment_bytes = 0
+
+    def segment_path(self, part):
+        if not self.rotating:
+            return self.target_name
+        if '{part' in self.target_name:
+            return self.target_name.format(part=part)
+        directory, name = os.path.split(self.target_name)
+        stem, dot, extensions = name.partition('.')
+        return os.path.join(directory, '{}-{:05d}{}{}'.format(stem, part, dot, extensions))
+
+    def _open_segment(self):
+        if self.target_name == '-':
+            self.raw = getattr(sys.stdout, 'buffer', None)
+            if self.raw is None:
+                # A replaced stdout (e.g. captured output) may only take text
+                if self.compression:
+                    raise ValueError('Compressed output needs a binary stdout, give an --output file name')
+                self.raw = TextOutput(sys.stdout)
+        else:
+            path = self.segment_path(self.part)
+            directory, name = os.path.split(path)
+            self.temp_path = os.path.join(directory, '.{}.tmp'.format(name))
+            self.raw = open(self.temp_path, 'wb')
+        self.target = self.raw
+        if self.compression:
+            self.target = utils.compressed_writer(self.raw, self.compression, level=self.compress_level)
+        self.segment_entries = 0
+        self.segment_bytes = 0
+
+    def _close_segment(self):
+        if self.target is not self.raw:
+            self.target.close()
+        if self.temp_path is None:
+            self.raw.flush()
+        else:
+            self.raw.close()
+            path = self.segment_path(self.part)
+            os.replace(self.temp_path, path)
+            self.paths.append(path)
+            self.temp_path = None
+        self.raw = self.target = None
+        self.part += 1
+
+    def _abort_segment(self):
+        """ Drop an unfinished segment so it is never published under its final name """
+        try:
+            if self.target is not self.raw:
+                self.target.close()
+        finally:
+            if self.temp_path is None:
+                self.raw.flush()
+            else:
+                self.raw.close()
+                os.unlink(self.temp_path)
+                self.temp_path = None
+            self.raw = self.target = None
+
+    def _segment_full(self):
+        if self.rotate_entries and self.segment_entries >= self.rotate_entries:
+            return True
+        return bool(self.rotate_size and self.segment_bytes >= self.rotate_size)
+
+    async def stream(self, source):
+        dumps = serializers.get_serializer().dumps
+        block = []
+        block_size = 0
+        self._open_segment()
+        try:
+            async for entry in source:
+                if self.target is None:
+                    self._open_segment()
+                line = (dumps(entry.value) + '\n').encode('utf-8')
+                block.append(line)
+                block_size += len(line)
+                self.segment_entries += 1
+                self.segment_bytes += len(line)
+
+                if self._segment_full():
+                    self.target.write(b''.join(block))
+                    block = []
+                    block_size = 0
+                    # The next segment is only started once there is more to write
+                    self._close_segment()
+                elif block_size >= self.block_size:
+                    self.target.write(b''.join(block))
+                    block = []
+                    block_size = 0
+        except BaseException:
+            if self.target is not None:
+                self._abort_segment()
+            raise
+
+        if self.target is not None:
+            self.target.write(b''.join(block))
+            self._close_segment()
+
 
-CONSUMERS = {
+CONSUMERS = utils.LazyRegistry({
     'file': FileWriter,
     'csv': CSVWriter,
     'json': JsonWriter,
-}
+    'ndjson': NDJsonWriter,
+    'columnar': 'streamline.columnar:ColumnarWriter',
+})
 
 def load_consumer(path):
     if path is None:
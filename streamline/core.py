@@ -1,4 +1,11 @@
+import functools
 import asyncio
+import sys
+
+from . import utils
+
+EVENT_LOOPS = ('auto', 'asyncio', 'uvloop')
+DEFAULT_EVENT_LOOP = utils.get_env_as('STREAMLINE_EVENT_LOOP', str, default='auto')
 
 async def drain(generator):
     """ A no-op drain of a generator """
@@ -20,6 +27,64 @@ async def static_pipe(stream, inputs):
     outputs = await drain(stream(source))
     return outputs
 
+def per_entry(transform):
+    """
+        Build a streamer from a synchronous `transform(entry)` returning the
+        entry to pass on or None to drop it. The transform is kept on the
+        streamer so `fuse` can run it without an async generator of its own.
+    """
+    @functools.wraps(transform)
+    async def streamer(source):
+        async for entry in source:
+            entry = transform(entry)
+            if entry is not None:
+                yield entry
+    streamer.transform = transform
+    return streamer
+
+def entry_transform(streamer):
+    """ The synchronous per-entry transform behind a streamer function or bound `stream` method (or None) """
+    transform = getattr(streamer, 'transform', None)
+    if transform is None:
+        transform = getattr(getattr(streamer, '__self__', None), 'transform', None)
+    return transform
+
+def fuse(streamers):
+    """
+        Collapse each run of adjacent streamers that have an `entry_transform`
+        into a single streamer applying them in turn, so an entry costs a
+        function call per stage rather than an async generator hop.
+    """
+    fused = []
+    run = []
+
+    def close_run():
+        if len(run) == 1:
+            fused.append(run[0])
+        elif run:
+            transforms = tuple(entry_transform(streamer) for streamer in run)
+
+            def transform(entry):
+                for stage in transforms:
+                    entry = stage(entry)
+                    if entry is None:
+                        return None
+                return entry
+            transform.__name__ = 'fused({})'.format('+'.join(
+                getattr(stage, '__qualname__', repr(stage)).replace('.transform', '') for stage in transforms
+            ))
+            fused.append(per_entry(transform))
+        run.clear()
+
+    for streamer in streamers:
+        if entry_transform(streamer) is not None:
+            run.append(streamer)
+            continue
+        close_run()
+        fused.append(streamer)
+    close_run()
+    return fused
+
 async def pipe(generator, streamers, consumer=None):
     """
         The "pipe" function is the central piece of a stream, the pipe connects
@@ -35,7 +100,7 @@ async def pipe(generator, streamers, consumer=None):
         consumer = drain
 
     pipe = generator
-    for streamer in streamers:
+    for streamer in fuse(streamers):
         pipe = streamer(pipe)
 
     await consumer(pipe)
@@ -45,3 +110,27 @@ def sync_exec(future):
     task = asyncio.ensure_future(future, loop=loop)
     result = loop.run_until_complete(task)
     return result
+
+def install_event_loop(name=DEFAULT_EVENT_LOOP):
+    """
+        Install the event loop policy for `name` ("auto" prefers uvloop when
+        it is installed) returning the implementation actually in use. Must be
+        called before any pipeline pieces grab the loop.
+    """
+    if name not in EVENT_LOOPS:
+        raise ValueError('Invalid event loop: {}'.format(name))
+
+    if name in ('auto', 'uvloop'):
+        try:
+            import uvloop
+        except ImportError:
+            if name == 'uvloop':
+                sys.stderr.write('uvloop is not installed, falling back to asyncio (try "pip install uvloop")\n')
+        else:
+            if not isinstance(asyncio.get_event_loop_policy(), uvloop.EventLoopPolicy):
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return 'uvloop'
+
+    if type(asyncio.get_event_loop_policy()) is not asyncio.DefaultEventLoopPolicy:
+        asyncio.set_event_loop_policy(None)
+    return 'asyncio'
@@ -15,6 +15,9 @@ class EntryFactory():
         return entry
 
 class Entry():
+    # Set by a checkpoint journal to follow the entries descending from an input (see `checkpoint.Lineage`)
+    lineage = None
+
     def __init__(self, value=None, index=None, error_value=None):
         self.index = index
         self.history = [[value]]
@@ -57,9 +60,14 @@ class Entry():
         self.value = self.error_value
 
     def clone(self):
-        new_clone = Entry(index=self.index, error_value=self.error_value)
+        # Skips __init__ as everything it sets up is replaced
+        new_clone = Entry.__new__(Entry)
+        new_clone.index = self.index
+        new_clone.error_value = self.error_value
         new_clone.errors = self.errors.copy()
         new_clone.history = [h.copy() for h in self.history]
+        if self.lineage is not None:
+            self.lineage.track(new_clone)
         return new_clone
 
     value = property(get_value, set_value)
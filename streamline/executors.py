@@ -2,12 +2,13 @@ import subprocess
 import argparse
 import asyncio
 import base64
+import signal
 import shlex
 import uuid
 import sys
 import os
 
-from .utils import import_obj, inject_module, arg_help
+from .utils import import_obj, inject_module, arg_help, parse_size
 
 SSH_CONNECTION_TIMEOUT = int(os.environ.get('STREAMLINE_SSH_CONNECTION_TIMEOUT', 10))
 
@@ -76,6 +77,11 @@ class BaseAsyncSSHHandler():
     def initialize(self):
         pass
 
+    @property
+    def side_effects(self):
+        """ Whether running does more than produce a result, so a cached result can't stand in for it """
+        return bool(self.options.get('stream_output'))
+
     async def handle(self, value):
         connection_options = dict(self.connection_options)
         username = self.options.get('username', None)
@@ -87,6 +93,8 @@ class BaseAsyncSSHHandler():
 @arg_help('Treat each value as a host to connect to. Copy a file to or from this host', example='"/tmp/file.txt" "{value}:/tmp/file.txt"')
 class ScpHandler(BaseAsyncSSHHandler):
     async_handler = True
+    # Copying the file is the point
+    side_effects = True
 
     @classmethod
     def args(cls, parser):
@@ -119,11 +127,188 @@ class ScpHandler(BaseAsyncSSHHandler):
             'target': formatted_target,
         }
 
+class OutputCapture():
+    """
+        A file-like sink for subprocess output that keeps at most `max_bytes`
+        (or writes everything through to `target`) so a noisy command can't
+        exhaust memory. Bytes are only decoded once, on request.
+    """
+    def __init__(self, max_bytes=None, target=None):
+        self.max_bytes = max_bytes
+        self.target = target
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    def write(self, data):
+        if not data:
+            return
+        if self.target is not None:
+            self.target.write(data)
+            return
+        if self.max_bytes is not None:
+            remaining = self.max_bytes - self.size
+            if len(data) > remaining:
+                self.truncated = True
+                data = data[:max(0, remaining)]
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+    def text(self):
+        # A cap can split a multi-byte character so don't fail on the tail
+        return self.getvalue().decode('utf-8', errors='replace')
+
+def kill_process_group(process):
+    """ Kill a process started with `start_new_session` along with any children it spawned """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+async def pump_stream(stream, sink, chunk_size=2 ** 16):
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            break
+        sink.write(chunk)
+
+class ShellWorker():
+    """
+        A long-lived shell coprocess that runs one command at a time.
+
+        Each command is written to the shell's stdin followed by a pair of
+        sentinel markers (one on stdout carrying the exit code, one on stderr)
+        so we know where each command's output ends without spawning a new
+        shell for every value.
+    """
+    SHELL = '/bin/sh'
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self):
+        self.process = None
+        self.sentinel = uuid.uuid4().hex.encode('utf-8')
+        self.buffers = {}
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            self.SHELL,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.buffers = {'stdout': bytearray(), 'stderr': bytearray()}
+
+    def _script(self, command):
+        # The subshell keeps `cd`, `exit` and variables from leaking between
+        # commands and stdin is detached so commands can't eat the protocol.
+        # The command is a single quoted word for `eval` so an unbalanced
+        # quote is a syntax error in the subshell rather than eating the sentinels
+        sentinel = self.sentinel.decode('utf-8')
+        return '(eval {}) </dev/null\nprintf "%s%d\\n" "{}" "$?"\nprintf "%s\\n" "{}" >&2\n'.format(
+            shlex.quote(command),
+            sentinel,
+            sentinel,
+        )
+
+    async def _read_until_sentinel(self, name, sink):
+        """ Pump a stream into `sink` up to the sentinel line, returning the text after the sentinel """
+        stream = getattr(self.process, name)
+        buffer = self.buffers[name]
+        while True:
+            position = buffer.find(self.sentinel)
+            if position != -1:
+                line_end = buffer.find(b'\n', position)
+                if line_end != -1:
+                    sink.write(bytes(buffer[:position]))
+                    trailer = bytes(buffer[position + len(self.sentinel):line_end])
+                    del buffer[:line_end + 1]
+                    return trailer
+            else:
+                # Hand off everything that can't be the start of a sentinel
+                flush_size = len(buffer) - len(self.sentinel) + 1
+                if flush_size > 0:
+                    sink.write(bytes(buffer[:flush_size]))
+                    del buffer[:flush_size]
+
+            chunk = await stream.read(self.CHUNK_SIZE)
+            if not chunk:
+                raise RuntimeError('Shell worker exited unexpectedly')
+            buffer.extend(chunk)
+
+    async def run(self, command, stdout_sink, stderr_sink):
+        if not self.is_alive():
+            await self.start()
+        self.process.stdin.write(self._script(command).encode('utf-8'))
+        await self.process.stdin.drain()
+        exit_code, _ = await asyncio.gather(
+            self._read_until_sentinel('stdout', stdout_sink),
+            self._read_until_sentinel('stderr', stderr_sink),
+        )
+        return int(exit_code)
+
+    def kill(self):
+        if self.is_alive():
+            kill_process_group(self.process)
+        self.process = None
+
+    async def close(self):
+        if not self.is_alive():
+            return
+        self.process.stdin.close()
+        await self.process.wait()
+        self.process = None
+
+class ShellPool():
+    """ A fixed size pool of `ShellWorker`s handed out one command at a time """
+    def __init__(self, size):
+        self.size = size
+        self.workers = []
+        self.idle = None
+
+    async def run(self, command, stdout_sink, stderr_sink):
+        if self.idle is None:
+            # Created lazily so the queue binds to the running loop
+            self.idle = asyncio.Queue()
+            self.workers = [ShellWorker() for i in range(self.size)]
+            for worker in self.workers:
+                self.idle.put_nowait(worker)
+
+        worker = await self.idle.get()
+        try:
+            return await worker.run(command, stdout_sink, stderr_sink)
+        except BaseException:
+            # The protocol state is unknown after a failure so start fresh
+            worker.kill()
+            raise
+        finally:
+            self.idle.put_nowait(worker)
+
+    async def close(self):
+        for worker in self.workers:
+            await worker.close()
+
 @arg_help('Run a shell command for each value', example='"nc -zv {value} 22"')
 class ShellHandler():
     async_handler = True
-    def __init__(self, command=None):
+    def __init__(self, command=None, pool=None, max_output=None, stream_output=None, stream_append=False):
         self.command = command
+        self.pool = None
+        if pool:
+            self.pool = ShellPool(pool)
+        self.max_output = parse_size(max_output)
+        self.stream_output = stream_output
+        self.stream_append = stream_append
+
+    @property
+    def side_effects(self):
+        return bool(self.stream_output)
 
     @classmethod
     def args(cls, parser):
@@ -133,20 +318,76 @@ class ShellHandler():
             default='echo "{value}"',
             help='Subprocess command to run'
         )
+        parser.add_argument(
+            '--pool',
+            type=int,
+            help='Reuse this many long-lived shells instead of spawning a shell per value',
+        )
+        parser.add_argument(
+            '--max-output',
+            help='Keep at most this many bytes of stdout and stderr (e.g. 64K, 10M)',
+        )
+        parser.add_argument(
+            '--stream-output',
+            help='Write stdout to this file instead of returning it (e.g. ~/out/{value}.txt)'
+        )
+        parser.add_argument(
+            '--stream-append',
+            default=False,
+            action='store_true',
+            help='Append to streaming output instead of overwriting'
+        )
 
-    async def handle(self, value):
-        command = self.command.format(value=shlex.quote(value))
+    async def _run_subprocess(self, command, stdout_sink, stderr_sink):
         subprocess = await asyncio.create_subprocess_shell(
             command,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
         )
-        stdout, stderr = await subprocess.communicate()
-        return {
-            'stdout': stdout.decode('utf-8'),
-            'stderr': stderr.decode('utf-8'),
-            'exit_code': subprocess.returncode,
-        }
+        try:
+            await asyncio.gather(
+                pump_stream(subprocess.stdout, stdout_sink),
+                pump_stream(subprocess.stderr, stderr_sink),
+            )
+            return await subprocess.wait()
+        except asyncio.CancelledError:
+            # Timed out (or the run was aborted); don't leave the command running
+            kill_process_group(subprocess)
+            raise
+
+    async def handle(self, value):
+        command = self.command.format(value=shlex.quote(value))
+
+        out_file = None
+        if self.stream_output:
+            out_path = os.path.expanduser(self.stream_output).replace('{value}', value)
+            out_file = open(out_path, 'ab' if self.stream_append else 'wb')
+        stdout = OutputCapture(self.max_output, target=out_file)
+        stderr = OutputCapture(self.max_output)
+        try:
+            if self.pool:
+                exit_code = await self.pool.run(command, stdout, stderr)
+            else:
+                exit_code = await self._run_subprocess(command, stdout, stderr)
+        finally:
+            if out_file:
+                out_file.close()
+
+        result = {}
+        if not out_file:
+            result['stdout'] = stdout.text()
+        result['stderr'] = stderr.text()
+        result['exit_code'] = exit_code
+        if self.max_output is not None:
+            if not out_file:
+                result['stdout_truncated'] = stdout.truncated
+            result['stderr_truncated'] = stderr.truncated
+        return result
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
 
 @arg_help('Treat each value as a host to connect to. SSH in and run a command returning the output', example='"uptime"')
 class SSHHandler(BaseAsyncSSHHandler):
@@ -1,9 +1,15 @@
+from . import serializers
 from . import utils 
 from . import entries
 
+import multiprocessing
+import collections
+import itertools
+import asyncio
+import locale
 import glob
-import json
 import csv
+import io
 import os
 
 class FileReader():
@@ -23,15 +29,22 @@ class FileReader():
             action='store_true',
             default=False,
         )
+        parser.add_argument(
+            '--read-thread',
+            help='Decompress compressed (.gz, .bz2, .xz, .zst) input in a background thread',
+            action='store_true',
+            default=False,
+        )
 
-    def __init__(self, input=DEFAULT_SOURCE, keep_trailing_newline=False):
+    def __init__(self, input=DEFAULT_SOURCE, keep_trailing_newline=False, read_thread=False):
         self.source_name = input 
         self.keep_trailing_newline = keep_trailing_newline
+        self.read_thread = read_thread
         self.source = None
 
     async def stream(self):
         factory = entries.EntryFactory()
-        source = utils.get_file_io(self.source_name)
+        source = utils.get_file_io(self.source_name, threaded=self.read_thread)
 
         ending_delim = False
         try:
@@ -49,8 +62,64 @@ class FileReader():
         if hasattr(source, 'close'):
             source.close()
 
+def csv_row_builder(header, tuples=False):
+    """
+        A function turning a list of parsed cells into a row: a dict like
+        `csv.DictReader` makes (missing cells are None and extras are kept in
+        a list under the None key) or, with `tuples`, a namedtuple shared by
+        every row (invalid column names become _0, _1, ...).
+    """
+    width = len(header)
+    if tuples:
+        Row = collections.namedtuple('Row', header, rename=True)
+        make = tuple.__new__
+        def build(cells):
+            if len(cells) != width:
+                cells = (cells + [None] * width)[:width]
+            # Skips Row._make's length check, done above
+            return make(Row, cells)
+        return build
+
+    def build(cells):
+        row = dict(zip(header, cells))
+        if len(cells) > width:
+            row[None] = cells[width:]
+        elif len(cells) < width:
+            for key in header[len(cells):]:
+                row[key] = None
+        return row
+    return build
+
+def parse_csv_range(path, start, end, encoding='utf-8'):
+    """
+        Parse the lines starting in the byte range [start, end) of a csv file
+        returning lists of cells. Fails on quoted fields containing newlines as
+        those can't be split safely.
+    """
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip the tail of a line that started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        data = f.read(max(0, end - position))
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+
+    reader = csv.reader(io.StringIO(data.decode(encoding), newline=''))
+    rows = list(reader)
+    # A row spanning lines inside the range or a quoted field left open at its end
+    if len(rows) != reader.line_num or (rows and any('\n' in cell for cell in rows[-1])):
+        raise ValueError('Found quoted fields spanning lines in {} which --parallel cannot split'.format(path))
+    return [cells for cells in rows if cells]
+
+def _parse_csv_range_args(args):
+    return parse_csv_range(*args)
+
 class CSVReader():
     DEFAULT_SOURCE = '-'
+    CHUNK_SIZE = 100
+    RANGE_SIZE = 2 ** 24
 
     @classmethod
     def args(cls, parser):
@@ -59,18 +128,110 @@ class CSVReader():
             default=cls.DEFAULT_SOURCE,
             help='Set source (Default stdin)',
         )
+        parser.add_argument(
+            '--tuples',
+            action='store_true',
+            default=False,
+            help='Yield rows as named tuples sharing the header instead of a dict per row',
+        )
+        parser.add_argument(
+            '--parallel',
+            type=int,
+            default=None,
+            help='Parse an uncompressed file in this many processes (the file must not have quoted fields spanning lines)',
+        )
+        parser.add_argument(
+            '--read-thread',
+            help='Decompress compressed (.gz, .bz2, .xz, .zst) input in a background thread',
+            action='store_true',
+            default=False,
+        )
+        parser.add_argument(
+            '--encoding',
+            default=None,
+            help='Text encoding of the input (Default the locale\'s, like any other file read)',
+        )
 
-    def __init__(self, input=None, **kwargs):
+    def __init__(self, input=DEFAULT_SOURCE, tuples=False, parallel=None, read_thread=False, encoding=None, **kwargs):
         self.source_name = input
+        self.tuples = tuples
+        self.parallel = parallel
+        self.read_thread = read_thread
+        self.encoding = encoding
         self.source = None
 
+    def _byte_encoding(self):
+        # What open() would decode the file with, so --parallel reads the same text as a serial read
+        return self.encoding or locale.getpreferredencoding(False)
+
+    def _can_parallelize(self):
+        if not self.parallel or self.parallel < 2:
+            return False
+        if self.source_name in (None, '-') or hasattr(self.source_name, 'read'):
+            return False
+        # Byte ranges of a compressed file (or of a pipe) can't be parsed on their own
+        return os.path.isfile(self.source_name) and utils.file_compression(self.source_name) is None
+
+    def _header_and_offset(self):
+        with open(self.source_name, 'rb') as f:
+            header_line = f.readline()
+            offset = f.tell()
+        header = next(csv.reader([header_line.decode(self._byte_encoding())]), [])
+        return header, offset
+
+    async def _parallel_chunks(self):
+        header, offset = self._header_and_offset()
+        yield header
+        size = os.path.getsize(self.source_name)
+        # Several ranges per process so a slow range doesn't hold up the rest
+        range_size = max(1, min(self.RANGE_SIZE, (size - offset) // (self.parallel * 4) + 1))
+        encoding = self._byte_encoding()
+        ranges = [
+            (self.source_name, start, min(size, start + range_size), encoding)
+            for start in range(offset, size, range_size)
+        ]
+
+        loop = asyncio.get_event_loop()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.parallel) as pool:
+            results = pool.imap(_parse_csv_range_args, ranges)
+            while True:
+                rows = await loop.run_in_executor(None, next, results, None)
+                if rows is None:
+                    break
+                yield rows
+
+    async def _serial_chunks(self, source):
+        reader = csv.reader(source)
+        yield next(reader, [])
+        while True:
+            chunk = list(itertools.islice(reader, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            # Blank lines are skipped like csv.DictReader does
+            yield [cells for cells in chunk if cells]
+
     async def stream(self):
         factory = entries.EntryFactory()
-        source = utils.get_file_io(self.source_name)
-        reader = csv.DictReader(source)
+        source = None
+        if self._can_parallelize():
+            chunks = self._parallel_chunks()
+        else:
+            source = utils.get_file_io(
+                self.source_name or self.DEFAULT_SOURCE,
+                threaded=self.read_thread,
+                encoding=self.encoding,
+            )
+            chunks = self._serial_chunks(source)
 
-        for row in reader:
-            yield factory(row)
+        build = None
+        async for rows in chunks:
+            if build is None:
+                # The first chunk is the header
+                build = csv_row_builder(rows, tuples=self.tuples)
+                continue
+            for cells in rows:
+                yield factory(build(cells))
 
         if hasattr(source, 'close'):
             source.close()
@@ -98,7 +259,7 @@ class JsonReader():
         if hasattr(source, 'close'):
             source.close()
 
-        data = json.loads(content)
+        data = serializers.loads(content)
         if isinstance(data, list):
             for row in data:
                 yield factory(row)
@@ -133,7 +294,7 @@ class MultifileReader():
         factory = entries.EntryFactory()
         for path in glob.glob(self.pattern):
             if os.path.isfile(path):
-                with open(path, 'r') as f:
+                with utils.get_file_io(path) as f:
                     content = f.read()
                 if self.include_metadata:
                     yield factory({
@@ -144,12 +305,12 @@ class MultifileReader():
                     yield factory(content)
 
 
-GENERATORS = {
+GENERATORS = utils.LazyRegistry({
     'file': FileReader,
     'csv': CSVReader,
     'json': JsonReader,
     'files': MultifileReader,
-}
+})
 
 def load_generator(path):
     if path is None:
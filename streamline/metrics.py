@@ -0,0 +1,223 @@
+import asyncio
+import json
+import math
+import time
+import os
+
+
+def stage_name(streamer):
+    """ A readable name for a streamer function or bound `stream` method """
+    owner = getattr(streamer, '__self__', None)
+    if owner is None:
+        return getattr(streamer, '__name__', repr(streamer))
+    executor = getattr(owner, 'executor', None)
+    if executor is not None:
+        # AsyncExecutor: name it after the handler it wraps
+        return '{}({})'.format(type(owner).__name__, stage_name(executor))
+    return type(owner).__name__
+
+class Histogram():
+    """ Latency histogram with exponential buckets (0.1ms doubling up to ~30 hours) """
+    BASE = 0.0001
+    BUCKET_COUNT = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        if seconds <= self.BASE:
+            bucket = 0
+        else:
+            bucket = min(self.BUCKET_COUNT - 1, math.ceil(math.log2(seconds / self.BASE)))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket holding the given fraction of samples """
+        if not self.count:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min(self.max, self.BASE * (2 ** bucket))
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(.5),
+            'p90': self.percentile(.9),
+            'p99': self.percentile(.99),
+            'max': self.max,
+        }
+
+class StageMetrics():
+    """
+        Counts entries in and out of a stage and splits its wall time into time
+        spent waiting on the upstream stage and time spent in the stage itself
+        (which, for concurrent stages, overlaps with upstream time).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.entries_in = 0
+        self.entries_out = 0
+        self.total_time = 0
+        self.upstream_time = 0
+
+    async def _count_upstream(self, source):
+        while True:
+            started = time.perf_counter()
+            try:
+                entry = await source.__anext__()
+            except StopAsyncIteration:
+                self.upstream_time += time.perf_counter() - started
+                return
+            self.upstream_time += time.perf_counter() - started
+            self.entries_in += 1
+            yield entry
+
+    async def _count_output(self, stream):
+        while True:
+            started = time.perf_counter()
+            try:
+                entry = await stream.__anext__()
+            except StopAsyncIteration:
+                self.total_time += time.perf_counter() - started
+                return
+            self.total_time += time.perf_counter() - started
+            self.entries_out += 1
+            yield entry
+
+    def wrap_source(self, source):
+        return self._count_output(source)
+
+    def wrap_streamer(self, streamer):
+        def instrumented(source):
+            return self._count_output(streamer(self._count_upstream(source)))
+        return instrumented
+
+    def wrap_consumer(self, consumer):
+        async def instrumented(source):
+            started = time.perf_counter()
+            try:
+                return await consumer(self._count_upstream(source))
+            finally:
+                self.total_time += time.perf_counter() - started
+        return instrumented
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'entries_in': self.entries_in,
+            'entries_out': self.entries_out,
+            'self_time': max(0, self.total_time - self.upstream_time),
+            'upstream_time': self.upstream_time,
+        }
+
+class MetricsCollector():
+    """ Per-stage timing, AsyncExecutor queue depths and handler latency for a whole pipeline """
+    DEFAULT_INTERVAL = 5
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.source_stage = None
+        self.consumer_stage = None
+        self.stages = []
+        self.executors = []
+
+    def instrument(self, source, streamers, consumer):
+        """ Wrap every piece of a pipeline returning the instrumented (source, streamers, consumer) """
+        self.source_stage = StageMetrics('generator')
+        source = self.source_stage.wrap_source(source)
+
+        instrumented = []
+        for streamer in streamers:
+            stage = StageMetrics(stage_name(streamer))
+            self.stages.append(stage)
+            instrumented.append(stage.wrap_streamer(streamer))
+
+            owner = getattr(streamer, '__self__', None)
+            if hasattr(owner, 'latency_histogram'):
+                owner.latency_histogram = Histogram()
+                self.executors.append((stage.name, owner))
+
+        self.consumer_stage = StageMetrics('consumer')
+        consumer = self.consumer_stage.wrap_consumer(consumer)
+        return source, instrumented, consumer
+
+    def snapshot(self):
+        stages = [self.source_stage, *self.stages, self.consumer_stage]
+        return {
+            'elapsed': time.monotonic() - self.started,
+            'stages': [stage.to_dict() for stage in stages if stage],
+            'executors': [
+                {
+                    'name': name,
+                    'active': executor.active_count,
+                    'retry_waiting': executor.retry_waiting,
+                    'output_queue': executor.output_queue.qsize(),
+                    'started': executor.entry_count,
+                    'completed': executor.complete_count,
+                    'concurrency_limit': executor.concurrency_limit(),
+                    'latency': executor.latency_histogram.to_dict(),
+                }
+                for name, executor in self.executors
+            ],
+        }
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = ['Metrics ({:.3f}s elapsed)'.format(snapshot['elapsed'])]
+        lines.append('{:<40} {:>10} {:>10} {:>12} {:>12}'.format('stage', 'in', 'out', 'self (s)', 'upstream (s)'))
+        for stage in snapshot['stages']:
+            lines.append('{:<40} {:>10} {:>10} {:>12.3f} {:>12.3f}'.format(
+                stage['name'][:40],
+                stage['entries_in'],
+                stage['entries_out'],
+                stage['self_time'],
+                stage['upstream_time'],
+            ))
+        for executor in snapshot['executors']:
+            latency = executor['latency']
+            lines.append('{}: {} completed, latency mean {:.4f}s p50 {:.4f}s p90 {:.4f}s p99 {:.4f}s max {:.4f}s'.format(
+                executor['name'],
+                executor['completed'],
+                latency['mean'],
+                latency['p50'],
+                latency['p90'],
+                latency['p99'],
+                latency['max'],
+            ))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        # Write then rename so readers never see a half written file
+        temp_path = '{}.tmp'.format(path)
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    async def dump_periodically(self, path, interval=DEFAULT_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump(path)
+
+    async def run(self, future, path=None, interval=DEFAULT_INTERVAL):
+        """ Await the pipeline, dumping stats to `path` every `interval` seconds and once at the end """
+        reporter = None
+        if path:
+            reporter = asyncio.ensure_future(self.dump_periodically(path, interval))
+        try:
+            return await future
+        finally:
+            if reporter:
+                reporter.cancel()
+                self.dump(path)
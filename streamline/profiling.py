@@ -0,0 +1,111 @@
+import threading
+import cProfile
+import asyncio
+import sys
+import os
+
+from .metrics import Histogram
+
+
+class StackSampler(threading.Thread):
+    """
+        Samples the stack of another thread on a fixed interval and counts
+        identical stacks, producing the "collapsed" format understood by
+        flamegraph.pl and speedscope (`frame;frame;frame count` per line).
+    """
+    DEFAULT_INTERVAL = 0.005
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.stopped = threading.Event()
+
+    def _collapse(self, frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = self._collapse(frame)
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+class LoopLagMonitor():
+    """ Measures how late the event loop wakes a sleeping task, i.e. how long something blocked it """
+    DEFAULT_INTERVAL = 0.05
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.lag = Histogram()
+        self.max_tasks = 0
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(0, loop.time() - scheduled - self.interval))
+            self.max_tasks = max(self.max_tasks, len(asyncio.all_tasks()))
+
+    def summary(self):
+        lag = self.lag.to_dict()
+        return 'Event loop lag: mean {:.4f}s p90 {:.4f}s p99 {:.4f}s max {:.4f}s over {} samples, peak {} tasks\n'.format(
+            lag['mean'],
+            lag['p90'],
+            lag['p99'],
+            lag['max'],
+            lag['count'],
+            self.max_tasks,
+        )
+
+class PipelineProfiler():
+    """
+        Runs a pipeline under cProfile (written to `path` in pstats format)
+        while a side thread samples stacks into `path`.collapsed and a task
+        on the loop measures event loop lag.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident())
+        self.lag_monitor = LoopLagMonitor()
+
+    async def run(self, future):
+        monitor = asyncio.ensure_future(self.lag_monitor.run())
+        self.sampler.start()
+        self.profile.enable()
+        try:
+            return await future
+        finally:
+            self.profile.disable()
+            self.sampler.stop()
+            monitor.cancel()
+            self.write()
+
+    def write(self):
+        self.profile.dump_stats(self.path)
+        self.sampler.write(self.path + '.collapsed')
+
+    def summary(self):
+        return '{}Profile written to {} (pstats) and {}.collapsed (flamegraph stacks)\n'.format(
+            self.lag_monitor.summary(),
+            self.path,
+            self.path,
+        )
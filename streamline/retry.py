@@ -0,0 +1,80 @@
+import random
+
+
+def parse_codes(codes):
+    """ Parse "255,5xx,429" style lists into a set of ints """
+    if codes is None:
+        return None
+    if isinstance(codes, str):
+        codes = codes.split(',')
+    parsed = set()
+    for code in codes:
+        code = str(code).strip().lower()
+        if not code:
+            continue
+        if code.endswith('xx'):
+            base = int(code[:-2]) * 100
+            parsed.update(range(base, base + 100))
+        else:
+            parsed.add(int(code))
+    return parsed
+
+def parse_names(names):
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = names.split(',')
+    return set(name.strip() for name in names if name.strip())
+
+class RetryPolicy():
+    """
+        :: Retry rules for async executors
+
+        An execution is retried (up to `attempts` total tries) when it raises
+        a matching exception or when its result carries a matching `exit_code`
+        (shell/ssh) or HTTP status `code`. Waits grow exponentially from
+        `backoff` seconds, capped at `max_delay`, with "full jitter" so a batch
+        of failures against the same host doesn't retry in lockstep.
+    """
+    DEFAULT_BACKOFF = 0.5
+    DEFAULT_MAX_DELAY = 30
+
+    def __init__(self, attempts=1, backoff=DEFAULT_BACKOFF, max_delay=DEFAULT_MAX_DELAY,
+                 exit_codes=None, status_codes=None, exceptions=None):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.exit_codes = parse_codes(exit_codes)
+        self.status_codes = parse_codes(status_codes)
+
+        # With no exception names given any exception is retried
+        self.exceptions = parse_names(exceptions)
+
+    def _matches_error(self, error):
+        if self.exceptions is None:
+            return True
+        return any(cls.__name__ in self.exceptions for cls in type(error).__mro__)
+
+    def _matches_result(self, result):
+        if not isinstance(result, dict):
+            return False
+        if self.exit_codes and result.get('exit_code', None) in self.exit_codes:
+            return True
+        if self.status_codes and result.get('code', None) in self.status_codes:
+            return True
+        return False
+
+    def is_failure(self, result=None, error=None):
+        if error is not None:
+            return self._matches_error(error)
+        return self._matches_result(result)
+
+    def should_retry(self, attempt, result=None, error=None):
+        """ Whether a failed (or unwanted) outcome of try number `attempt` should be retried """
+        if attempt >= self.attempts:
+            return False
+        return self.is_failure(result=result, error=error)
+
+    def delay(self, attempt):
+        ceiling = min(self.max_delay, self.backoff * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
@@ -0,0 +1,118 @@
+import json
+import sys
+import os
+
+SERIALIZERS = ('auto', 'orjson', 'ujson', 'json')
+# Defaults to the standard library so output stays byte for byte the same ("auto" opts into the
+# fastest library, which writes compact JSON and `null` for NaN)
+DEFAULT_SERIALIZER = os.environ.get('STREAMLINE_SERIALIZER', 'json')
+
+
+class JsonSerializer():
+    """ The standard library `json` module """
+    name = 'json'
+
+    def dumps(self, value):
+        return json.dumps(value)
+
+    def loads(self, text):
+        return json.loads(text)
+
+class OrjsonSerializer():
+    """
+        orjson, falling back to `json` for what it doesn't handle (non-string
+        keys, integers over 64 bits, NaN in input, ...) so it never fails where
+        the standard library wouldn't
+    """
+    name = 'orjson'
+    # orjson parses integers outside of 64 bits as floats rather than failing. They all have a run of
+    # 19+ digits, found by mapping digits to 0 and everything else to a space (much faster than a regex)
+    DIGITS_ONLY = bytes(ord('0') if byte in b'0123456789' else ord(' ') for byte in range(256))
+    LONG_NUMBER = b'0' * 19
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def _digit_runs(self, text):
+        if isinstance(text, str):
+            text = text.encode('utf-8', 'surrogatepass')
+        return text.translate(self.DIGITS_ONLY)
+
+    def dumps(self, value):
+        try:
+            return self.orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            return json.dumps(value)
+
+    def loads(self, text):
+        if self.LONG_NUMBER in self._digit_runs(text):
+            return json.loads(text)
+        try:
+            return self.orjson.loads(text)
+        except self.orjson.JSONDecodeError:
+            return json.loads(text)
+
+class UjsonSerializer():
+    """ ujson, falling back to `json` like `OrjsonSerializer` """
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, value):
+        try:
+            return self.ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return json.dumps(value)
+
+    def loads(self, text):
+        try:
+            return self.ujson.loads(text)
+        except ValueError:
+            return json.loads(text)
+
+LIBRARIES = {
+    'orjson': OrjsonSerializer,
+    'ujson': UjsonSerializer,
+    'json': JsonSerializer,
+}
+
+def load_serializer(name='auto'):
+    """
+        Build the serializer for `name` ("auto" picks the fastest installed).
+        A library that isn't installed falls back to the standard library with
+        a warning.
+    """
+    if name not in SERIALIZERS:
+        raise ValueError('Invalid serializer: {}'.format(name))
+
+    candidates = ['orjson', 'ujson', 'json'] if name == 'auto' else [name, 'json']
+    for candidate in candidates:
+        try:
+            return LIBRARIES[candidate]()
+        except ImportError:
+            if candidate == name:
+                sys.stderr.write('{} is not installed, falling back to json (try "pip install {}")\n'.format(name, name))
+
+_writer = None
+
+def set_serializer(name):
+    """ Select the serializer used to read and write JSON, returning the library actually in use """
+    global _writer
+    _writer = load_serializer(name)
+    return _writer.name
+
+def get_serializer():
+    global _writer
+    if _writer is None:
+        # Resolved on first use so startup doesn't pay for importing a library
+        _writer = load_serializer(DEFAULT_SERIALIZER)
+    return _writer
+
+def dumps(value):
+    return get_serializer().dumps(value)
+
+def loads(text):
+    return get_serializer().loads(text)
@@ -0,0 +1,260 @@
+import multiprocessing
+import traceback
+import asyncio
+import pickle
+import queue
+
+from .core import pipe, transync
+from . import utils
+
+
+def needs_global_view(streamer):
+    """ Whether a streamer (function, class or bound `stream` method) has to see every entry """
+    owner = getattr(streamer, '__self__', streamer)
+    return bool(getattr(owner, 'global_view', False))
+
+def split_streamers(streamers):
+    """
+        Split a list of streamers into the leading per-entry streamers that can
+        be sharded across processes and the rest (starting at the first
+        streamer that needs a global view) which must run in the main process.
+    """
+    for position, streamer in enumerate(streamers):
+        if needs_global_view(streamer):
+            return streamers[:position], streamers[position:]
+    return list(streamers), []
+
+def sanitize_entry(entry):
+    """ Make an entry safe to send between processes by stringifying what can't be pickled """
+    try:
+        pickle.dumps(entry.value)
+    except Exception:
+        entry.history = [[utils.force_string(value) for value in level] for level in entry.history]
+    entry.errors = [error if isinstance(error, str) else repr(error) for error in entry.errors]
+    return entry
+
+def dump_entries(entries):
+    try:
+        return pickle.dumps(entries)
+    except Exception:
+        return pickle.dumps([sanitize_entry(entry) for entry in entries])
+
+def executors_of(streamers):
+    """ The `AsyncExecutor`s behind a list of streamers """
+    from .streamers import AsyncExecutor
+    owners = [getattr(streamer, '__self__', None) for streamer in streamers]
+    return [owner for owner in owners if isinstance(owner, AsyncExecutor)]
+
+def shard_worker(streamers, aggregate, input_queue, output_queue, ordered=False, batch_size=200):
+    """
+        Process body: run the batches from `input_queue` through `streamers`
+        until a None arrives, folding the results into a partial `aggregate`
+        state that is sent along when done.
+
+        Unordered, one pipe runs for the life of the process and results are
+        sent in chunks as they come. Ordered output needs to know where each
+        batch ends so every batch gets its own pipe, but executors (and
+        resources like shell pools) stay open between batches either way and
+        are closed once at the end.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    executors = executors_of(streamers)
+    for executor in executors:
+        executor.keep_open = True
+        # SQLite connections can't be shared with the parent
+        if executor.cache is not None:
+            executor.cache.connect()
+
+    state = aggregate.init() if aggregate else None
+    results = []
+
+    def collect(entry):
+        nonlocal state
+        if aggregate:
+            state = aggregate.update(state, entry)
+            if not aggregate.passthrough:
+                return
+        results.append(entry)
+
+    def send(sequence=None):
+        nonlocal results
+        output_queue.put(('batch', sequence, dump_entries(results)))
+        results = []
+
+    async def next_task():
+        return await loop.run_in_executor(None, input_queue.get)
+
+    async def collect_batch(stream):
+        async for entry in stream:
+            collect(entry)
+
+    async def run_batches():
+        while True:
+            task = await next_task()
+            if task is None:
+                return
+            sequence, payload = task
+            await pipe(transync(pickle.loads(payload)), streamers, consumer=collect_batch)
+            # Empty batches are still sent so ordered output can move past them
+            send(sequence)
+
+    async def batch_entries():
+        while True:
+            if results:
+                # Nothing more to do until the next batch arrives, pass on what is ready
+                send()
+            task = await next_task()
+            if task is None:
+                return
+            sequence, payload = task
+            for entry in pickle.loads(payload):
+                yield entry
+
+    async def collect_stream(stream):
+        async for entry in stream:
+            collect(entry)
+            if len(results) >= batch_size:
+                send()
+        if results:
+            send()
+
+    try:
+        if ordered:
+            loop.run_until_complete(run_batches())
+        else:
+            loop.run_until_complete(pipe(batch_entries(), streamers, consumer=collect_stream))
+        for executor in executors:
+            loop.run_until_complete(executor.close())
+        output_queue.put(('done', None, pickle.dumps(state)))
+    except BaseException:
+        output_queue.put(('error', None, traceback.format_exc()))
+    finally:
+        loop.close()
+
+class ShardedPipeline():
+    """
+        :: Run per-entry streamers in several processes
+
+        Entries are sent to a pool of forked worker processes in batches over a
+        shared queue (so faster workers take more of the work) and each batch is
+        run through the streamers there. Results come back as soon as a batch is
+        done, or in input order with `ordered`.
+
+        Only streamers that handle each entry independently can be sharded (see
+        `split_streamers`); per-process state like executor worker counts, rate
+        limits and --dedupe memos applies to each process separately. An
+        `aggregate` streamer following them is updated in the workers too and
+        only the partial states are merged here.
+    """
+    DEFAULT_BATCH_SIZE = 200
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, streamers, processes, ordered=False, batch_size=DEFAULT_BATCH_SIZE, aggregate=None):
+        self.streamers = streamers
+        self.aggregate = aggregate
+        self.processes = processes
+        self.ordered = ordered
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.workers = []
+        self.stopped = False
+
+    async def _put(self, input_queue, item):
+        loop = asyncio.get_event_loop()
+        while not self.stopped:
+            try:
+                # Time out now and then so a stopped run doesn't leave a thread blocked on a full queue
+                return await loop.run_in_executor(None, input_queue.put, item, True, self.POLL_INTERVAL)
+            except queue.Full:
+                pass
+
+    async def _feed(self, source, input_queue):
+        sequence = 0
+        batch = []
+        async for entry in source:
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                await self._put(input_queue, (sequence, pickle.dumps(batch)))
+                sequence += 1
+                batch = []
+        if batch:
+            await self._put(input_queue, (sequence, pickle.dumps(batch)))
+            sequence += 1
+        for worker in self.workers:
+            await self._put(input_queue, None)
+        return sequence
+
+    def _check(self, feeder):
+        if feeder.done() and not feeder.cancelled() and feeder.exception():
+            raise feeder.exception()
+        for worker in self.workers:
+            if worker.exitcode not in (None, 0):
+                raise RuntimeError('Shard worker {} died with exit code {}'.format(worker.pid, worker.exitcode))
+
+    async def _receive(self, output_queue, feeder):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(None, output_queue.get, True, self.POLL_INTERVAL)
+            except queue.Empty:
+                self._check(feeder)
+
+    async def stream(self, source):
+        self.stopped = False
+        context = multiprocessing.get_context('fork')
+        input_queue = context.Queue(maxsize=self.processes * 2)
+        output_queue = context.Queue()
+        self.workers = [
+            context.Process(
+                target=shard_worker,
+                args=(self.streamers, self.aggregate, input_queue, output_queue, self.ordered, self.batch_size),
+                daemon=True,
+            )
+            for i in range(self.processes)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        feeder = asyncio.ensure_future(self._feed(source, input_queue))
+        try:
+            finished = 0
+            states = []
+            waiting = {}
+            next_sequence = 0
+            while finished < len(self.workers):
+                kind, sequence, payload = await self._receive(output_queue, feeder)
+                if kind == 'error':
+                    raise RuntimeError('Shard worker failed:\n{}'.format(payload))
+                if kind == 'done':
+                    finished += 1
+                    states.append(pickle.loads(payload))
+                    continue
+
+                if not self.ordered:
+                    for entry in pickle.loads(payload):
+                        yield entry
+                    continue
+
+                waiting[sequence] = payload
+                while next_sequence in waiting:
+                    for entry in pickle.loads(waiting.pop(next_sequence)):
+                        yield entry
+                    next_sequence += 1
+            await feeder
+
+            if self.aggregate:
+                state = self.aggregate.init()
+                for partial in states:
+                    state = self.aggregate.merge(state, partial)
+                for entry in self.aggregate.finalize(state):
+                    yield entry
+        finally:
+            self.stopped = True
+            if not feeder.done():
+                feeder.cancel()
+            input_queue.cancel_join_thread()
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
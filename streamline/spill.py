@@ -0,0 +1,221 @@
+from operator import itemgetter, attrgetter
+import itertools
+import tempfile
+import weakref
+import pickle
+import heapq
+import os
+
+from . import utils
+
+# Bytes of buffered entries kept in memory, across all buffers, before they spill to disk (None for no limit)
+DEFAULT_MEMORY_LIMIT = utils.parse_size(os.environ.get('STREAMLINE_MEMORY_LIMIT'))
+
+# A spill writes at least this fraction of the limit so memory held elsewhere can't cause tiny runs
+MIN_RUN_FRACTION = 16
+# Sorted runs are merged into one file once there are this many open
+MAX_OPEN_RUNS = 32
+
+_memory_limit = DEFAULT_MEMORY_LIMIT
+_memory_used = 0
+_buffers = weakref.WeakSet()
+
+
+def set_memory_limit(limit):
+    """ Set the memory budget shared by buffers created from now on (e.g. "512M", None for no limit) """
+    global _memory_limit
+    _memory_limit = utils.parse_size(limit)
+    return _memory_limit
+
+def get_memory_limit():
+    return _memory_limit
+
+def memory_used():
+    return _memory_used
+
+def _account(size):
+    global _memory_used
+    _memory_used += size
+
+def _make_room(limit):
+    """ Spill the buffers holding the most memory until back under `limit` """
+    min_run = limit // MIN_RUN_FRACTION
+    for buffer in sorted(_buffers, key=attrgetter('size'), reverse=True):
+        if _memory_used <= limit or buffer.size < max(min_run, 1):
+            break
+        buffer.spill()
+
+class Held():
+    """ Stands in (in memory or on disk) for an item that can't be pickled, which stays in memory """
+    def __init__(self, number):
+        self.number = number
+
+def _unhold(item, held):
+    if isinstance(item, Held):
+        return held.pop(item.number)
+    return item
+
+class SpillBuffer():
+    """
+        An append-only buffer of items that is drained once, in insertion
+        order or (given a sort `key`) sorted.
+
+        Without a memory limit items are simply kept in a list. With one,
+        items are pickled as they arrive and counted against the budget shared
+        by every buffer; once it is exceeded the buffers holding the most write
+        their items out to anonymous temporary files. Sorted buffers write each
+        spill as a sorted run and merge the runs when drained (an external
+        merge sort), merging early if too many runs pile up. Items that can't
+        be pickled stay in memory.
+    """
+    def __init__(self, key=None, reverse=False):
+        self.key = key
+        self.reverse = reverse
+        self.limit = _memory_limit
+        self.items = []
+        # Pickled bytes held in `items`
+        self.size = 0
+        # Spill files and how many items each holds
+        self.runs = []
+        self.held = {}
+        self.length = 0
+        _buffers.add(self)
+
+    def __len__(self):
+        return self.length
+
+    def __del__(self):
+        self.discard()
+
+    def __reduce__(self):
+        # Pickled (e.g. to leave a worker process) as its items
+        return (_restore, (self.key, self.reverse, list(self.drain())))
+
+    def append(self, item):
+        self.length += 1
+        if self.limit is None:
+            self.items.append(item)
+            return
+
+        try:
+            data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self.held[self.length] = item
+            data = pickle.dumps(Held(self.length), pickle.HIGHEST_PROTOCOL)
+        self.items.append(data if self.key is None else (self.key(item), data))
+        self.size += len(data)
+        _account(len(data))
+        if _memory_used > self.limit:
+            _make_room(self.limit)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def spill(self):
+        """ Move the items held in memory to a temporary file """
+        if not self.items:
+            return
+        if self.key is None and self.runs:
+            # Insertion order only needs a single file to append to
+            run, count = self.runs.pop()
+            run.seek(0, os.SEEK_END)
+        else:
+            run, count = tempfile.TemporaryFile(prefix='streamline-spill-'), 0
+            if self.key is not None:
+                self.items.sort(key=itemgetter(0), reverse=self.reverse)
+
+        if self.key is None:
+            run.writelines(self.items)
+        else:
+            run.writelines(data for sort_value, data in self.items)
+        self.runs.append((run, count + len(self.items)))
+        self._release()
+        if len(self.runs) >= MAX_OPEN_RUNS:
+            self._merge_runs()
+
+    def _read_keyed(self, run, count):
+        """ The pickled items of a sorted run with their sort values, held items left in place """
+        run.seek(0)
+        for _ in range(count):
+            item = pickle.load(run)
+            value = self.held[item.number] if isinstance(item, Held) else item
+            yield self.key(value), item
+
+    def _merge_runs(self):
+        """ Merge every sorted run into a single one, keeping the number of open files bounded """
+        merged = tempfile.TemporaryFile(prefix='streamline-spill-')
+        count = 0
+        runs = [self._read_keyed(run, run_count) for run, run_count in self.runs]
+        for sort_value, item in heapq.merge(*runs, key=itemgetter(0), reverse=self.reverse):
+            pickle.dump(item, merged, pickle.HIGHEST_PROTOCOL)
+            count += 1
+        for run, run_count in self.runs:
+            run.close()
+        self.runs = [(merged, count)]
+
+    def _replay_run(self, run, count, held):
+        """ Replay `count` pickled items from a spill file, closing it once done """
+        try:
+            run.seek(0)
+            for _ in range(count):
+                yield _unhold(pickle.load(run), held)
+        finally:
+            run.close()
+
+    def _release(self):
+        _account(-self.size)
+        self.items = []
+        self.size = 0
+
+    def _replay_memory(self, items, held):
+        """ Yield the in-memory items, giving their memory back to the budget as they go """
+        if self.limit is None:
+            yield from items
+            return
+
+        try:
+            for index, data in enumerate(items):
+                items[index] = None
+                if self.key is not None:
+                    data = data[1]
+                _account(-len(data))
+                yield _unhold(pickle.loads(data), held)
+        finally:
+            _account(-(sum(len(data if self.key is None else data[1]) for data in items if data is not None)))
+
+    def drain(self):
+        """ An iterator over every item, leaving the buffer empty """
+        if self.runs:
+            # Once on disk anyway, the rest goes too rather than staying counted while the runs replay
+            self.spill()
+        items, runs, held = self.items, self.runs, self.held
+        if self.key is not None:
+            if self.limit is None:
+                items.sort(key=self.key, reverse=self.reverse)
+            else:
+                items.sort(key=itemgetter(0), reverse=self.reverse)
+        # The replay gives back the memory of the items it takes over
+        self.items, self.runs, self.held = [], [], {}
+        self.size = 0
+        self.length = 0
+
+        replays = [self._replay_run(run, count, held) for run, count in runs]
+        replays.append(self._replay_memory(items, held))
+        if self.key is None:
+            return itertools.chain.from_iterable(replays)
+        return heapq.merge(*replays, key=self.key, reverse=self.reverse)
+
+    def discard(self):
+        """ Drop everything, removing any spill files """
+        for run, count in self.runs:
+            run.close()
+        self.runs = []
+        self.held = {}
+        self._release()
+        self.length = 0
+
+def _restore(key, reverse, items):
+    buffer = SpillBuffer(key=key, reverse=reverse)
+    buffer.extend(items)
+    return buffer
@@ -4,6 +4,8 @@ import traceback
 import argparse
 import asyncio
 import math
+import itertools
+import time
 import json
 import copy
 import re
@@ -12,7 +14,10 @@ import sys
 
 from .entries import entry_wrap, Entry
 from .extractor import Extractor
-from . import executors
+from .concurrency import AdaptiveLimit, TokenBucket, KeyedSemaphore
+from .core import per_entry
+from .spill import SpillBuffer
+from . import serializers
 from . import utils
 
 arg_help = utils.arg_help
@@ -24,6 +29,14 @@ def get_eval_scope(entry):
     return scope, scope
 
 class BaseStreamer():
+    # Streamers that need to see every entry (aggregates, sorting, ...) set this so
+    # a sharded run (`--processes`) keeps them in the main process
+    global_view = False
+
+    # Synchronous one-entry-at-a-time streamers can implement `transform(entry)`
+    # (returning the entry or None to drop it) so `core.fuse` can chain them
+    transform = None
+
     def __init__(self, **options):
         self.options = options
         self.initialize()
@@ -35,6 +48,13 @@ class BaseStreamer():
         raise NotImplemented('Implement either the stream or handle method of a BaseStreamer subclass')
 
     async def stream(self, source):
+        if self.transform is not None:
+            async for entry in source:
+                entry = self.transform(entry)
+                if entry is not None:
+                    yield entry
+            return
+
         async for entry in source:
             result = await self.handle(entry.value)
             entry.value = result
@@ -43,6 +63,41 @@ class BaseStreamer():
     def initialize(self):
         pass
 
+class AggregateStreamer(BaseStreamer):
+    """
+        Base for streamers that reduce the whole stream to a summary.
+
+        The reduction is split into `init` (an empty state), `update` (fold one
+        entry in), `merge` (combine two partial states) and `finalize` (turn a
+        state into output entries) so partial states built separately (e.g. by
+        the worker processes of a --processes run) can be combined without
+        going back to the raw entries. States must be picklable.
+    """
+    global_view = True
+    # Whether entries are passed along while aggregating
+    passthrough = False
+
+    def init(self):
+        raise NotImplementedError()
+
+    def update(self, state, entry):
+        raise NotImplementedError()
+
+    def merge(self, state, other):
+        raise NotImplementedError()
+
+    def finalize(self, state):
+        raise NotImplementedError()
+
+    async def stream(self, source):
+        state = self.init()
+        async for entry in source:
+            state = self.update(state, entry)
+            if self.passthrough:
+                yield entry
+        for entry in self.finalize(state):
+            yield entry
+
 @arg_help('Translate each value by assigning it to the result of a python expression', example='"value.upper()"')
 class PyExecTransform(BaseStreamer):
     @classmethod
@@ -68,21 +123,20 @@ class PyExecTransform(BaseStreamer):
             traceback.print_exc()
             sys.exit(1)
 
-    async def stream(self, source):
-        async for entry in source:
-            global_scope, local_scope = get_eval_scope(entry)
-            try:
-                if self.expression:
-                    entry.value = self.runner(self.code, global_scope, local_scope)
+    def transform(self, entry):
+        global_scope, local_scope = get_eval_scope(entry)
+        try:
+            if self.expression:
+                entry.value = self.runner(self.code, global_scope, local_scope)
+            else:
+                self.runner(self.code, global_scope, local_scope)
+                if 'result' in local_scope:
+                    entry.value = local_scope.get('result')
                 else:
-                    self.runner(self.code, global_scope, local_scope)
-                    if 'result' in local_scope:
-                        entry.value = local_scope.get('result')
-                    else:
-                        entry.value = local_scope.get('result')
-            except Exception as e:
-                entry.error(e)
-            yield entry
+                    entry.value = local_scope.get('result')
+        except Exception as e:
+            entry.error(e)
+        return entry
 
 @arg_help('Filter out values that dont have a truthy result to a particular python expression', example='"\'foobar\' in value"')
 class PyExecFilter(BaseStreamer):
@@ -101,15 +155,14 @@ class PyExecFilter(BaseStreamer):
             traceback.print_exc()
             sys.exit(1)
 
-    async def stream(self, source):
-        async for entry in source:
-            global_scope, local_scope = get_eval_scope(entry)
-            try:
-                keep = eval(self.code, global_scope, local_scope)
-            except Exception as e:
-                keep = False
-            if keep:
-                yield entry
+    def transform(self, entry):
+        global_scope, local_scope = get_eval_scope(entry)
+        try:
+            keep = eval(self.code, global_scope, local_scope)
+        except Exception as e:
+            keep = False
+        if keep:
+            return entry
 
 @arg_help('Change the value to an attribute of the current value', example='--selector exit_code')
 class ExtractionStreamer(BaseStreamer):
@@ -127,6 +180,10 @@ class ExtractionStreamer(BaseStreamer):
     async def handle(self, value):
         return self.extractor.extract(value)
 
+    def transform(self, entry):
+        entry.value = self.extractor.extract(entry.value)
+        return entry
+
 @arg_help('Combine two previous historical values by setting an attribute', example='--source "-1" --target "-2"')
 class Combiner(BaseStreamer):
     @classmethod
@@ -155,32 +212,27 @@ class Combiner(BaseStreamer):
             help='Path of attribute on "target" to set as the value of "source"',
         )
 
-    async def stream(self, source):
-        path = self.options.get('path', None)
-
-        async for entry in source:
-            history = entry.get_history()
-            try:
-                source = history[self.options['source']]
-                target = history[self.options['target']]
-            except IndexError as e:
-                entry.error(e)
-                yield entry
-                continue
+    def transform(self, entry):
+        path = self.options.get('path', None) or 'value'
+        history = entry.get_history()
+        try:
+            source = history[self.options['source']]
+            target = history[self.options['target']]
+        except IndexError as e:
+            entry.error(e)
+            return entry
 
-            if path is None:
-                path = 'value'
-            if not isinstance(target, dict) :
-                if self.options.get('disallow_wrapping', False):
-                    # We can't set any attributes here, move on
-                    entry.error('Cannot combine attributes as target is not an object')
-                else:
-                    entry.value = {'base': target, path: source}
+        if not isinstance(target, dict) :
+            if self.options.get('disallow_wrapping', False):
+                # We can't set any attributes here, move on
+                entry.error('Cannot combine attributes as target is not an object')
             else:
-                new_value = copy.deepcopy(target)
-                new_value[path] = source
-                entry.value = new_value
-            yield entry
+                entry.value = {'base': target, path: source}
+        else:
+            new_value = copy.deepcopy(target)
+            new_value[path] = source
+            entry.value = new_value
+        return entry
 
 class AsyncExecutor():
     """
@@ -191,17 +243,94 @@ class AsyncExecutor():
         I'm re-implementing a worker-style executor pool which could be used with jobs that are threaded or async.
     """
     DEFAULT_WORKERS = utils.get_env_as('STREAMLINE_WORKER_COUNT', int, default=20)
+    DEFAULT_DEDUPE_MEMO = 10000
 
-    def __init__(self, executor=None, workers=DEFAULT_WORKERS, loop=None):
+    def __init__(self, executor=None, workers=DEFAULT_WORKERS, loop=None, timeout=None, deadline=None,
+                 adaptive=False, min_workers=None, max_workers=None, rate=None, burst=None,
+                 group_key=None, group_workers=None, retry=None, cache=None, cache_namespace=None,
+                 dedupe=False, dedupe_memo=DEFAULT_DEDUPE_MEMO):
         self.executor = executor
         self.output_queue = asyncio.Queue()
         self.worker_count = workers or self.DEFAULT_WORKERS
 
+        # Optionally let the worker count float between bounds based on latency and errors
+        self.adaptive_limit = None
+        if adaptive:
+            self.adaptive_limit = AdaptiveLimit(
+                self.worker_count,
+                min_limit=min_workers or 1,
+                max_limit=max_workers or self.worker_count * 4,
+            )
+
+        # Optional executions-per-second cap and a worker limit per group of entries (e.g. per domain)
+        self.rate_limiter = None
+        if rate:
+            self.rate_limiter = TokenBucket(rate, burst=burst)
+        self.group_extractor = None
+        self.group_semaphore = None
+        if group_key and group_workers:
+            self.group_extractor = Extractor(group_key, value_symbol=True)
+            self.group_semaphore = KeyedSemaphore(group_workers)
+
+        # Per-entry timeout in seconds and an absolute `time.monotonic()` deadline for the whole run
+        self.timeout = timeout
+        self.deadline = deadline
+
+        # A `retry.RetryPolicy`. Entries waiting to retry give up their worker until the backoff is over
+        self.retry = retry
+
+        # A `cache.ResultCache` shared between executors, told apart by `cache_namespace`. A cache hit skips
+        # the handler entirely so handlers with side effects (e.g. writing --stream-output files) aren't cached
+        handler = getattr(executor, '__self__', None)
+        if cache is not None and getattr(handler, 'side_effects', False):
+            sys.stderr.write('Not caching {} results as it has side effects (e.g. --stream-output)\n'.format(
+                type(handler).__name__,
+            ))
+            cache = None
+        self.cache = cache
+        self.cache_namespace = cache_namespace
+
+        # Coalesce identical values onto one execution and remember the latest `dedupe_memo` results
+        self.dedupe = dedupe
+        self.dedupe_memo_size = dedupe_memo
+        self.dedupe_memo = OrderedDict()
+        self.in_flight = {}
+
         # State data
         self.entry_count = 0
         self.complete_count = 0
         self.active_count = 0
-        self.loop = loop or asyncio.get_event_loop()
+        self.retry_waiting = 0
+        self.latency_histogram = None
+        self.slot_freed = asyncio.Event()
+        # Resolved when the stream runs so an executor can be built before (or outside of) its loop
+        self.loop = loop
+        # Set when one executor serves several streams (e.g. the batches of a sharded run) and is closed by its owner
+        self.keep_open = False
+
+    def _get_loop(self):
+        return self.loop or asyncio.get_event_loop()
+
+    def concurrency_limit(self):
+        if self.adaptive_limit:
+            return self.adaptive_limit.current()
+        return self.worker_count
+
+    def _has_free_slot(self):
+        return self.active_count + self.retry_waiting < self.concurrency_limit()
+
+    async def _acquire_slot(self):
+        # Retries queue ahead of new input (see `_has_free_slot`)
+        self.retry_waiting += 1
+        while self.active_count >= self.concurrency_limit():
+            self.slot_freed.clear()
+            await self.slot_freed.wait()
+        self.retry_waiting -= 1
+        self.active_count += 1
+
+    def _release_slot(self):
+        self.active_count -= 1
+        self.slot_freed.set()
 
     def _save_result(self, entry):
         self.complete_count += 1
@@ -213,77 +342,258 @@ class AsyncExecutor():
         pending = 0
         next_input = None
         next_output = None
-        
-        while True:
-            # Break condition
-            if all_read and pending == 0:
-                break
-
-            if not next_input and not all_read and pending < self.worker_count:
-                next_input = asyncio.create_task(self.source.__anext__())
-
-            if not next_output:
-                next_output = asyncio.create_task(self.output_queue.get())
-
-            awaitables = [aw for aw in (next_input, next_output) if aw]
-            tasks_done, tasks_pending = await asyncio.wait(awaitables, return_when=asyncio.FIRST_COMPLETED)
+        next_slot = None
+        handlers = set()
 
-            if next_input in tasks_done:
-                try:
-                    entry = next_input.result()
-                    next_input = None
-                    entry_future = asyncio.create_task(self.handle(entry))
-                    pending += 1
-                except StopAsyncIteration:
-                    all_read = True
+        try:
+            while True:
+                # Break condition
+                if all_read and pending == 0:
+                    break
+
+                if not next_input and not all_read:
+                    if self._has_free_slot():
+                        next_input = asyncio.create_task(self.source.__anext__())
+                    elif not next_slot:
+                        # Wake up when a worker is released without producing output (e.g. to wait on a retry)
+                        self.slot_freed.clear()
+                        next_slot = asyncio.create_task(self.slot_freed.wait())
+
+                if not next_output:
+                    next_output = asyncio.create_task(self.output_queue.get())
+
+                awaitables = [aw for aw in (next_input, next_output, next_slot) if aw]
+                tasks_done, tasks_pending = await asyncio.wait(awaitables, return_when=asyncio.FIRST_COMPLETED)
+
+                if next_slot in tasks_done:
+                    next_slot = None
+
+                if next_input in tasks_done:
+                    try:
+                        entry = next_input.result()
+                        next_input = None
+                        self.entry_count += 1
+                        self.active_count += 1
+                        entry_future = asyncio.create_task(self.handle(entry))
+                        handlers.add(entry_future)
+                        entry_future.add_done_callback(handlers.discard)
+                        pending += 1
+                    except StopAsyncIteration:
+                        all_read = True
+
+                if next_output in tasks_done:
+                    pending -= 1
+                    yield next_output.result()
+                    self.output_queue.task_done()
+                    next_output = None
+        finally:
+            # Also reached when the stream is abandoned early (e.g. by `head`) or fails
+            unfinished = [task for task in (next_input, next_output, next_slot, *handlers) if task and not task.done()]
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.wait(unfinished)
+            if not self.keep_open:
+                await self.close()
+
+    async def close(self):
+        # Give handlers holding resources (e.g. shell pools) a chance to release them
+        handler = getattr(self.executor, '__self__', None)
+        close = getattr(handler, 'close', None)
+        if close is None:
+            return
+        if asyncio.iscoroutinefunction(close):
+            await close()
+        else:
+            close()
+
+    def _time_limit(self):
+        """ Seconds the next execution may take (None for no limit) """
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if self.timeout is None:
+            return remaining
+        return min(self.timeout, remaining)
+
+    async def execute(self, value):
+        if asyncio.iscoroutinefunction(self.executor):
+            return await self.executor(value)
+        else:
+            def executor_wrapper():
+                return self.executor(value)
+            # Note that a timeout can only stop waiting on a threaded executor, not interrupt it
+            return await self._get_loop().run_in_executor(None, executor_wrapper)
 
-            if next_output in tasks_done:
-                pending -= 1
-                yield next_output.result()
-                self.output_queue.task_done()
-                next_output = None
+    def _group_of(self, entry):
+        group = self.group_extractor.extract(entry.value)
+        try:
+            hash(group)
+        except TypeError:
+            group = utils.force_string(group)
+        return group
 
     async def handle(self, entry):
+        holds_slot = True
+        if self.dedupe:
+            holds_slot = await self.process_deduplicated(entry)
+        else:
+            await self.process(entry)
+        if holds_slot:
+            self._release_slot()
+        self._save_result(entry)
+
+    def _dedupe_key(self, value):
+        # Tag every value with its type, at any depth, so that 1, 1.0 and True (or (1,) and (True,),
+        # {1: 'x'} and {'1': 'x'}) aren't coalesced
+        type_name = type(value).__name__
+        if isinstance(value, (list, tuple)):
+            return (type_name, tuple(self._dedupe_key(item) for item in value))
+        if isinstance(value, dict):
+            return (type_name, frozenset((self._dedupe_key(key), self._dedupe_key(item)) for key, item in value.items()))
+        if isinstance(value, (set, frozenset)):
+            return (type_name, frozenset(self._dedupe_key(item) for item in value))
         try:
-            if asyncio.iscoroutinefunction(self.executor):
-                entry.value = await self.executor(entry.value)
+            hash(value)
+        except TypeError:
+            value = repr(value)
+        return (type_name, value)
+
+    async def process_deduplicated(self, entry):
+        """ Process an entry unless an identical value is in flight or memoized. Returns whether we still hold our worker """
+        key = self._dedupe_key(entry.value)
+        if key in self.dedupe_memo:
+            self.dedupe_memo.move_to_end(key)
+            entry.value = copy.deepcopy(self.dedupe_memo[key])
+            return True
+
+        if key in self.in_flight:
+            # No need to hold a worker while someone else does the work
+            self._release_slot()
+            value, errors = await self.in_flight[key]
+            if errors:
+                for error in errors:
+                    entry.error(error)
             else:
-                def executor_wrapper():
-                    return self.executor(entry.value)
-                entry.value = await self.loop.run_in_executor(None, executor_wrapper)
+                entry.value = copy.deepcopy(value)
+            return False
+
+        outcome = self._get_loop().create_future()
+        self.in_flight[key] = outcome
+        error_count = len(entry.errors)
+        try:
+            await self.process(entry)
+        finally:
+            del self.in_flight[key]
+            errors = entry.errors[error_count:]
+            outcome.set_result((entry.value, errors))
+
+        if not errors and self.dedupe_memo_size:
+            self.dedupe_memo[key] = copy.deepcopy(entry.value)
+            if len(self.dedupe_memo) > self.dedupe_memo_size:
+                self.dedupe_memo.popitem(last=False)
+        return True
+
+    async def process(self, entry):
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.cache_namespace, entry.value)
+            found, cached = await self.cache.fetch(cache_key)
+            if found:
+                entry.value = cached
+                return
+
+        error_count = len(entry.errors)
+        await self.run(entry)
+
+        if cache_key and len(entry.errors) == error_count:
+            if not (self.retry and self.retry.is_failure(result=entry.value)):
+                await self.cache.store(cache_key, entry.value)
+
+    async def attempt(self, value):
+        """ Execute once returning a (result, error) pair """
+        time_limit = self._time_limit()
+        try:
+            if time_limit is not None and time_limit <= 0:
+                raise asyncio.TimeoutError('Run deadline exceeded before execution started')
+            return await asyncio.wait_for(self.execute(value), time_limit), None
+        except asyncio.TimeoutError as e:
+            if not str(e):
+                e = asyncio.TimeoutError('Execution timed out after {:g} seconds'.format(time_limit))
+            return None, e
         except Exception as e:
-            entry.error(e)
-        self._save_result(entry)
-        self.active_count -= 1
+            return None, e
+
+    async def measured_attempt(self, value):
+        """ `attempt` within the rate limit, recording its latency """
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+
+        started = time.monotonic()
+        result, error = await self.attempt(value)
+        if self.latency_histogram:
+            self.latency_histogram.record(time.monotonic() - started)
+        if self.adaptive_limit:
+            failed = error is not None or (self.retry is not None and self.retry.is_failure(result=result))
+            self.adaptive_limit.record(started, time.monotonic() - started, failed=failed)
+        return result, error
+
+    async def run(self, entry):
+        group = self._group_of(entry) if self.group_semaphore else None
+        attempt = 1
+        while True:
+            if self.group_semaphore:
+                # Held per attempt so an entry backing off doesn't hold up the rest of its group. Note that an
+                # entry waiting on its group still occupies one of the workers
+                async with self.group_semaphore.hold(group):
+                    result, error = await self.measured_attempt(entry.value)
+            else:
+                result, error = await self.measured_attempt(entry.value)
+
+            if not (self.retry and self.retry.should_retry(attempt, result=result, error=error)):
+                break
+            delay = self.retry.delay(attempt)
+            if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+                break
+
+            # Hand our worker (and group) to someone else while we back off
+            self._release_slot()
+            await asyncio.sleep(delay)
+            await self._acquire_slot()
+            attempt += 1
+
+        if error is not None:
+            entry.error(error)
+        else:
+            entry.value = result
 
 @arg_help('No operation. Just for testing.')
-async def noop(source):
-    async for entry in source:
-        yield entry
+@per_entry
+def noop(entry):
+    return entry
 
 @arg_help('Filter out values that are not truthy')
-async def truthy(source):
-    async for entry in source:
-        if entry.value:
-            yield entry
+@per_entry
+def truthy(entry):
+    if entry.value:
+        return entry
 
 @arg_help('Filter out values that are truthy')
-async def falsey(source):
-    async for entry in source:
-        if not entry.value:
-            yield entry
+@per_entry
+def falsey(entry):
+    if not entry.value:
+        return entry
 
 @arg_help('Take json strings and parse them into objects so other streamers can inspect attributes')
-async def json_parser(source):
-    async for entry in source:
-        if not isinstance(entry.value, str):
-            yield entry
-            continue
-        try:
-            entry.value = json.loads(entry.value)
-        except Exception as e:
-            entry.error(e)
-        yield entry
+@per_entry
+def json_parser(entry):
+    if not isinstance(entry.value, str):
+        return entry
+    try:
+        entry.value = serializers.loads(entry.value)
+    except Exception as e:
+        entry.error(e)
+    return entry
 
 @arg_help('Take any values that are an array and treat each value of an array as a separate input ')
 async def split_lists(source):
@@ -301,15 +611,41 @@ async def split_lists(source):
             yield new_entry
 
 @arg_help('Replace the value with the original input')
-async def input_values(source):
-    """ Splits arrays into multiple entries """
-    async for entry in source:
-        entry.value = entry.original_value
-        yield entry
-
-@arg_help('Take any values that are an array and treat each value of an array as a separate input ')
+@per_entry
+def input_values(entry):
+    entry.value = entry.original_value
+    return entry
+
+# Characters that make a delimiter a regular expression rather than a plain string
+REGEX_SPECIAL_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+def iter_split(pattern, text, max_split=0):
+    """ Like `re.split` but yielding the pieces as matches are found """
+    start = 0
+    for count, match in enumerate(pattern.finditer(text), 1):
+        yield text[start:match.start()]
+        # Captured groups are included like `re.split` does
+        yield from match.groups()
+        start = match.end()
+        if count == max_split:
+            break
+    yield text[start:]
+
+def iter_split_literal(text, delimiter, max_split=-1):
+    """ Like `str.split` with a delimiter but yielding the pieces as they are found """
+    start = 0
+    while max_split != 0:
+        end = text.find(delimiter, start)
+        if end == -1:
+            break
+        yield text[start:end]
+        start = end + len(delimiter)
+        max_split -= 1
+    yield text[start:]
+
+@arg_help('Split string values into a separate entry for each piece', example='--delimiter , --max-split 2')
 class Split(BaseStreamer):
-    """ Splits arrays into multiple entries """
+    """ Splits strings into multiple entries """
     DEFAULT_DELIMITER = r'\s+'
 
     @classmethod
@@ -317,13 +653,44 @@ class Split(BaseStreamer):
         parser.add_argument(
             '--delimiter',
             default=cls.DEFAULT_DELIMITER,
-            help='Regular expression pattern on which to split',
+            help='Regular expression pattern on which to split (plain strings are split on directly)',
+        )
+        parser.add_argument(
+            '--max-split',
+            type=int,
+            default=None,
+            help='Split at most this many times, leaving the rest of the value in the last piece (0 for no limit)',
+        )
+        parser.add_argument(
+            '--lazy',
+            action='store_true',
+            default=False,
+            help='Produce pieces as they are found instead of splitting the whole value at once (for huge values)',
         )
 
     def initialize(self):
         delim = self.options.get('delimiter', self.DEFAULT_DELIMITER)
+        self.max_split = self.options.get('max_split', None)
+        if self.max_split is not None and self.max_split < 0:
+            # str.split and re.split disagree on what a negative count means
+            raise ValueError('--max-split must be 0 (no limit) or more, got {}'.format(self.max_split))
+        self.lazy = self.options.get('lazy', False)
+        # str.split is much faster than a regular expression for a fixed string
+        self.literal = delim if delim and REGEX_SPECIAL_CHARACTERS.isdisjoint(delim) else None
         self.pattern = re.compile(delim)
 
+    def split(self, value):
+        if self.literal is not None:
+            max_split = self.max_split or -1
+            if self.lazy:
+                return iter_split_literal(value, self.literal, max_split)
+            return value.split(self.literal, max_split)
+
+        max_split = self.max_split or 0
+        if self.lazy:
+            return iter_split(self.pattern, value, max_split)
+        return self.pattern.split(value, max_split)
+
     async def stream(self, source):
         async for entry in source:
             # No-op on non-str values
@@ -331,13 +698,15 @@ class Split(BaseStreamer):
                 yield entry
                 continue
 
-            for wrapped_value in entry_wrap(re.split(self.pattern, entry.value)):
-                yield wrapped_value
+            # Each piece keeps the index and history of the entry it came from
+            for piece in self.split(entry.value):
+                new_entry = entry.clone()
+                new_entry.value = piece
+                yield new_entry
 
 @arg_help('Show a report of how many input values ended up with a particular result value')
-class ValueBreakdown(BaseStreamer):
+class ValueBreakdown(AggregateStreamer):
     """ Gives summary stats either instead of the values or as an extra event at the end"""
-
     @classmethod
     def args(cls, parser):
         parser.add_argument(
@@ -361,6 +730,7 @@ class ValueBreakdown(BaseStreamer):
     def __init__(self, inputs=False, append_summary=False, group_by=None):
         self.inputs = inputs
         self.append = append_summary
+        self.passthrough = append_summary
         if isinstance(group_by, list):
             self.group_by = group_by
         elif group_by:
@@ -369,36 +739,44 @@ class ValueBreakdown(BaseStreamer):
             self.group_by = ['value']
         self.group_by_extractors = [Extractor(gb, value_symbol=True) for gb in self.group_by]
 
-    async def stream(self, source):
-        stats = OrderedDict()
-        async for entry in source:
-            group_by_value = [e.extract(entry.value) for e in self.group_by_extractors]
-            if len(group_by_value) == 1:
-                group_by_value = group_by_value[0]
-            else:
-                group_by_value = tuple(group_by_value)
-            if group_by_value in stats:
-                value_stats = stats[group_by_value]
-                value_stats['count'] += 1
-                if self.inputs:
-                    value_stats['inputs'].append(entry.original_value)
-            else:
-                metadata = {
-                    'value': group_by_value,
-                    'count': 1,
-                }
-                if self.inputs:
-                    metadata['inputs'] = [entry.original_value]
-                stats[group_by_value] = metadata
+    def init(self):
+        return OrderedDict()
 
-            if self.append:
-                yield entry
+    def update(self, stats, entry):
+        group_by_value = [e.extract(entry.value) for e in self.group_by_extractors]
+        if len(group_by_value) == 1:
+            group_by_value = group_by_value[0]
+        else:
+            group_by_value = tuple(group_by_value)
+        if group_by_value in stats:
+            value_stats = stats[group_by_value]
+            value_stats['count'] += 1
+            if self.inputs:
+                value_stats['inputs'].append(entry.original_value)
+        else:
+            metadata = {
+                'value': group_by_value,
+                'count': 1,
+            }
+            if self.inputs:
+                metadata['inputs'] = [entry.original_value]
+            stats[group_by_value] = metadata
+        return stats
+
+    def merge(self, stats, other):
+        for group_by_value, metadata in other.items():
+            if group_by_value not in stats:
+                stats[group_by_value] = metadata
+                continue
+            stats[group_by_value]['count'] += metadata['count']
+            if self.inputs:
+                stats[group_by_value]['inputs'].extend(metadata['inputs'])
+        return stats
 
+    def finalize(self, stats):
         if self.append:
-            yield Entry(list(stats.values()))
-        else:
-            for wrapped_value in entry_wrap(stats.values()):
-                yield wrapped_value
+            return [Entry(list(stats.values()))]
+        return entry_wrap(stats.values())
 
 @arg_help('Force each value to a string and prefix each with the original input value')
 class InputHeaders(BaseStreamer):
@@ -411,41 +789,41 @@ class InputHeaders(BaseStreamer):
             help='Also prepend index',
         )
 
-    async def stream(self, source):
-        async for entry in source:
-            value = utils.force_string(entry.value)
-            header = utils.force_string(entry.original_value)
-            if self.options.get('indexes', False):
-                entry.value = '[{}] {}: {}'.format(entry.index, header, value)
-            else:
-                entry.value = '{}: {}'.format(header, value)
-            yield entry
+    def transform(self, entry):
+        value = utils.force_string(entry.value)
+        header = utils.force_string(entry.original_value)
+        if self.options.get('indexes', False):
+            entry.value = '[{}] {}: {}'.format(entry.index, header, value)
+        else:
+            entry.value = '{}: {}'.format(header, value)
+        return entry
 
 @arg_help('Filter out any entries that have produced an error')
-async def filter_out_errors(source):
-    async for entry in source:
-        if not entry.errors:
-            yield entry
+@per_entry
+def filter_out_errors(entry):
+    if not entry.errors:
+        return entry
 
 @arg_help('Use the latest error on the entry as the value')
-async def error_values(source):
-    async for entry in source:
-        if not entry.errors:
-            yield entry
-            continue
-
-        error = entry.errors[-1]
-        if isinstance(error, Exception) and getattr(error, '__traceback__', None):
-            error = '{}: {}\n{}'.format(
-                str(type(error).__name__),
-                str(error),
-                '\n'.join(traceback.format_tb(error.__traceback__))       
-            )
-        entry.value = error
-        yield entry
+@per_entry
+def error_values(entry):
+    if not entry.errors:
+        return entry
+
+    error = entry.errors[-1]
+    if isinstance(error, Exception) and getattr(error, '__traceback__', None):
+        error = '{}: {}\n{}'.format(
+            str(type(error).__name__),
+            str(error),
+            '\n'.join(traceback.format_tb(error.__traceback__))       
+        )
+    entry.value = error
+    return entry
 
 @arg_help('Hold entries in memory until a certain number is reached (give no args to buffer all)', example='--buffer 20')
 class StreamingBuffer(BaseStreamer):
+    global_view = True
+
     @classmethod
     def args(cls, parser):
         parser.add_argument(
@@ -461,20 +839,19 @@ class StreamingBuffer(BaseStreamer):
             self.buffer_size = None
 
     async def stream(self, source):
-        buffer_list = []
+        buffer = SpillBuffer()
         async for entry in source:
-            buffer_list.append(entry)
+            buffer.append(entry)
             if self.buffer_size is None:
                 # We want to accrue all
                 continue
-            elif buffer_list >= self.buffer_size:
+            elif len(buffer) >= self.buffer_size:
                 # Empty the buffer
-                for entry in buffer_list:
+                for entry in buffer.drain():
                     yield entry
-                buffer_list = []
 
         # Drain any remaining
-        for entry in buffer_list:
+        for entry in buffer.drain():
             yield entry
 
 @arg_help('Strip surrounding whitespace from each string entry, removing entries that are only whitespace', example='--buffer 20')
@@ -487,23 +864,22 @@ class StripWhitespace(BaseStreamer):
             help='Dont remove blank entries',
         )
 
-    async def stream(self, source):
-        keep_blank = bool(self.options.get('keep_blank', False))
-        async for entry in source:
-            value = entry.value
-            if not isinstance(value, str):
-                yield entry
-                continue
+    def transform(self, entry):
+        value = entry.value
+        if not isinstance(value, str):
+            return entry
 
-            value = value.strip()
-            if value == '' and not keep_blank:
-                continue
-            if value != entry.value:
-                entry.value = value
-            yield entry
+        value = value.strip()
+        if value == '' and not self.options.get('keep_blank', False):
+            return None
+        if value != entry.value:
+            entry.value = value
+        return entry
 
 @arg_help('Only take the first X entries (Default 1)', example='--count 20')
 class HeadStreamer(BaseStreamer):
+    global_view = True
+
     @classmethod
     def args(cls, parser):
         parser.add_argument(
@@ -563,7 +939,7 @@ class ReadFileStreamer(BaseStreamer):
             yield entry
 
 @arg_help('Perform mathmatical statistics on a given numeric value', example='--path value')
-class StatsStreamer(BaseStreamer):
+class StatsStreamer(AggregateStreamer):
     @classmethod
     def args(cls, parser):
         parser.add_argument(
@@ -575,33 +951,46 @@ class StatsStreamer(BaseStreamer):
     def initialize(self):
         self.extractor = Extractor(self.options.get('path', None), value_symbol=True)
 
-    async def stream(self, source):
-        stats = {
+    def init(self):
+        return {
             'count': 0,
             'sum': 0,
             'min': None,
             'max': None,
         }
-        async for entry in source:
-            value = self.extractor.extract(entry.value)
-            try:
-                num = float(value)
-            except Exception as e:
-                continue
-            stats['count'] += 1
-            stats['sum'] += num
-            if stats['min'] is None or num < stats['min']:
-                stats['min'] = num
-            if stats['max'] is None or num > stats['max']:
-                stats['max'] = num
+
+    def update(self, stats, entry):
+        value = self.extractor.extract(entry.value)
+        try:
+            num = float(value)
+        except Exception as e:
+            return stats
+        stats['count'] += 1
+        stats['sum'] += num
+        if stats['min'] is None or num < stats['min']:
+            stats['min'] = num
+        if stats['max'] is None or num > stats['max']:
+            stats['max'] = num
+        return stats
+
+    def merge(self, stats, other):
+        stats['count'] += other['count']
+        stats['sum'] += other['sum']
+        for key, pick in (('min', min), ('max', max)):
+            values = [v for v in (stats[key], other[key]) if v is not None]
+            stats[key] = pick(values) if values else None
+        return stats
+
+    def finalize(self, stats):
+        stats = dict(stats)
         if stats['count'] == 0:
             stats['average'] = 0
         else:
             stats['average'] = stats['sum'] / stats['count']
-        yield Entry(stats)
+        return [Entry(stats)]
 
 @arg_help('Sort entries alphanumerically or numerically given a value or subvalue', example='--path value --numeric')
-class SortStreamer(BaseStreamer):
+class SortStreamer(AggregateStreamer):
     @classmethod
     def args(cls, parser):
         parser.add_argument(
@@ -638,30 +1027,33 @@ class SortStreamer(BaseStreamer):
             sort_value = str(sort_value)
         return sort_value
 
-    async def stream(self, source):
-        # Buffer all entries and then sort after all values have been calculated
-        items_with_value = []
-        items_without_value = []
-        async for entry in source:
-            sort_value = self._extract_sort_value(entry)
-            if sort_value is None:
-                items_without_value.append(entry)
-            else:
-                items_with_value.append((entry, sort_value))
+    def init(self):
+        # Entries with a sort value (paired with it, sorted as they spill to disk) and those without
+        return (SpillBuffer(key=itemgetter(1), reverse=self.descending), SpillBuffer())
 
-        result = []
-        sorted_items = [e[0] for e in sorted(items_with_value, key=itemgetter(1), reverse=self.descending)]
-        if self.descending:
-            result.extend(sorted_items)
-            result.extend(items_without_value)
+    def update(self, state, entry):
+        items_with_value, items_without_value = state
+        sort_value = self._extract_sort_value(entry)
+        if sort_value is None:
+            items_without_value.append(entry)
         else:
-            result.extend(items_without_value)
-            result.extend(sorted_items)
+            items_with_value.append((entry, sort_value))
+        return state
 
-        for entry in result:
-            yield entry
+    def merge(self, state, other):
+        state[0].extend(other[0].drain())
+        state[1].extend(other[1].drain())
+        return state
 
-STREAMERS = {
+    def finalize(self, state):
+        # Buffer all entries and then sort after all values have been calculated
+        items_with_value, items_without_value = state
+        sorted_items = (entry for entry, sort_value in items_with_value.drain())
+        if self.descending:
+            return itertools.chain(sorted_items, items_without_value.drain())
+        return itertools.chain(items_without_value.drain(), sorted_items)
+
+STREAMERS = utils.LazyRegistry({
     'extract': ExtractionStreamer,
     'py': PyExecTransform,
     'pyfilter': PyExecFilter,
@@ -682,39 +1074,47 @@ STREAMERS = {
     'combine': Combiner,
     'stats': StatsStreamer,
     'sort': SortStreamer,
-}
-# Add executors that need to be wrapped with AsyncExecutor
-STREAMERS.update(executors.EXECUTORS)
+})
+# Add executors that need to be wrapped with AsyncExecutor (see `executors.EXECUTORS`), imported on first use
+STREAMERS.update({
+    'http': 'streamline.executors:HTTPHandler',
+    'ssh': 'streamline.executors:SSHHandler',
+    'ssh_bash': 'streamline.executors:SSHBashScript',
+    'ssh_exec': 'streamline.executors:SSHExecHandler',
+    'shell': 'streamline.executors:ShellHandler',
+    'scp': 'streamline.executors:ScpHandler',
+    'sleep': 'streamline.executors:SleepHandler',
+})
 
 @arg_help('Start a new history tree')
-async def history_push(source):
-    async for entry in source:
-        entry.push()
-        yield entry
+@per_entry
+def history_push(entry):
+    entry.push()
+    return entry
         
 @arg_help('Walk back up one level in the history tree')
-async def history_pop(source):
-    async for entry in source:
-        entry.pop()
-        yield entry
+@per_entry
+def history_pop(entry):
+    entry.pop()
+    return entry
 
 @arg_help('Treat the latest value as the original')
-async def history_collapse(source):
-    async for entry in source:
-        entry.collapse()
-        yield entry
+@per_entry
+def history_collapse(entry):
+    entry.collapse()
+    return entry
 
 @arg_help('Clear all levels of history')
-async def history_reset(source):
-    async for entry in source:
-        entry.reset()
-        yield entry
+@per_entry
+def history_reset(entry):
+    entry.reset()
+    return entry
 
 @arg_help('Set the current value to a list of all previous values')
-async def history_all(source):
-    async for entry in source:
-        entry.value = entry.get_history()
-        yield entry
+@per_entry
+def history_all(entry):
+    entry.value = entry.get_history()
+    return entry
 
 # entry-transformations
 STREAMERS.update({
@@ -727,56 +1127,112 @@ STREAMERS.update({
 
 # Stateful hidden streamers
 class ProgressStreamer():
-    def __init__(self, buffer_start=True, buffer_end=True):
+    """
+        Tracks entries entering and leaving the pipeline and redraws a status
+        line on a fixed timer (rather than per entry) to stderr so it never
+        mixes with output written to stdout. When stderr isn't a terminal a
+        plain line is logged each interval instead.
+    """
+    DEFAULT_INTERVAL = 0.5
+    BAR_WIDTH = 30
+
+    def __init__(self, buffer_start=True, buffer_end=True, executors=None, target=None, interval=DEFAULT_INTERVAL):
+        self.executors = executors or []
         self.started_count = 0
         self.complete_count = 0
-        self.in_progress_count = 0
         self.buffer_start = buffer_start
         self.buffer_end = buffer_end
         self.all_loaded = False
+        self.target = target or sys.stderr
+        self.interval = interval
+        self.started_at = None
+        self.renderer = None
+
+    def _format_duration(self, seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return '{}:{:02}:{:02}'.format(hours, minutes, seconds)
+
+    def render(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        rate = self.complete_count / elapsed
+        if self.started_count:
+            complete_perc = min(100, math.floor((self.complete_count / self.started_count) * 100))
+        else:
+            complete_perc = 0
+        filled = complete_perc * self.BAR_WIDTH // 100
 
-    def update_progress(self, complete=False, started=False):
-        if complete:
-            self.complete_count += 1
-        elif started:
-            self.started_count += 1
-        complete_perc = min(100, math.floor((self.complete_count / self.started_count) * 100))
-
-        loading_bar = ('#' * (complete_perc)) + ((100 - complete_perc) * ' ')
-        message = '|{}| ({}/{} - {}%)'.format(
-            loading_bar,
+        message = '|{}{}| {}/{}{} ({}%) {:.1f}/s, {} in flight'.format(
+            '#' * filled,
+            ' ' * (self.BAR_WIDTH - filled),
             self.complete_count,
             self.started_count,
+            '' if self.all_loaded else '+',
             complete_perc,
+            rate,
+            self.started_count - self.complete_count,
         )
-        message = '\r' + message
-        sys.stdout.write(message)
-        if self.all_loaded and self.complete_count == self.started_count:
-            sys.stdout.write('\n')
+        if self.all_loaded and rate > 0:
+            message += ', ETA {}'.format(self._format_duration((self.started_count - self.complete_count) / rate))
+        adaptive_limits = [str(ae.concurrency_limit()) for ae in self.executors if ae.adaptive_limit]
+        if adaptive_limits:
+            message += ' [workers: {}]'.format(', '.join(adaptive_limits))
+        return message
+
+    def draw(self, final=False):
+        is_tty = hasattr(self.target, 'isatty') and self.target.isatty()
+        if is_tty:
+            # Pad to clear any leftovers of a longer previous line
+            self.target.write('\r' + self.render().ljust(100) + ('\n' if final else ''))
+        else:
+            self.target.write(self.render() + '\n')
+        self.target.flush()
+
+    async def _render_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.draw()
+
+    def start(self):
+        if self.renderer is None:
+            self.started_at = time.monotonic()
+            self.renderer = asyncio.ensure_future(self._render_periodically())
+
+    def stop(self):
+        if self.renderer is not None:
+            self.renderer.cancel()
+            self.renderer = None
+            self.draw(final=True)
 
     async def streamer_start(self, source):
+        self.start()
         if self.buffer_start:
-            started = []
+            started = SpillBuffer()
             async for entry in source:
                 started.append(entry)
-                self.update_progress(started=True)
-            for entry in started:
+                self.started_count += 1
+            self.all_loaded = True
+            for entry in started.drain():
                 yield entry
         else:
             async for entry in source:
-                self.update_progress(started=True)
+                self.started_count += 1
                 yield entry
-        self.all_loaded = True
+            self.all_loaded = True
 
     async def streamer_end(self, source):
-        if self.buffer_end:
-            done = []
-            async for entry in source:
-                done.append(entry)
-                self.update_progress(complete=True)
-            for entry in done:
-                yield entry
-        else:
-            async for entry in source:
-                self.update_progress(complete=True)
-                yield entry
+        try:
+            if self.buffer_end:
+                done = SpillBuffer()
+                async for entry in source:
+                    done.append(entry)
+                    self.complete_count += 1
+                self.stop()
+                for entry in done.drain():
+                    yield entry
+            else:
+                async for entry in source:
+                    self.complete_count += 1
+                    yield entry
+        finally:
+            self.stop()
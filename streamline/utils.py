@@ -1,12 +1,22 @@
 from importlib import import_module
-import json
+import threading
+import queue
+import stat
 import sys
+import io
 import os
 
+from . import serializers
+
 def strip_nulls(source):
     return {key: value for key, value in source.items() if value is not None}
 
-def get_file_io(name, write=False):
+def get_file_io(name, write=False, threaded=False, encoding=None):
+    """
+        Open a file (or "-" for stdin/stdout) as text. Compressed input is
+        detected and decompressed, in a background thread with `threaded`.
+        Input is decoded with `encoding` (None for the default of `open()`).
+    """
     # Test for file-like objects we can use first
     if hasattr(name, 'write') and write:
         return name
@@ -17,10 +27,229 @@ def get_file_io(name, write=False):
     if name == '-' and write:
         return sys.stdout
     elif name == '-' and not write:
-        return sys.stdin
+        return open_stdin(threaded=threaded, encoding=encoding)
 
     # Assume this is a file
-    return open(name, 'w' if write else 'r', 1)
+    if write:
+        return open(name, 'w', 1)
+    return open_input(name, threaded=threaded, encoding=encoding)
+
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+COMPRESSIONS = tuple(COMPRESSION_EXTENSIONS.values())
+
+def compression_from_name(name):
+    """ The compression implied by a file name's extension (or None) """
+    if not isinstance(name, str):
+        return None
+    for extension, compression in COMPRESSION_EXTENSIONS.items():
+        if name.endswith(extension):
+            return compression
+    return None
+
+def compressed_writer(raw, compression, level=None):
+    """ Wrap a binary file object so what's written to it is compressed (closing it leaves `raw` open) """
+    # Compression modules are imported on demand to keep startup fast
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6 if level is None else level)
+    elif compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(raw, 'wb', compresslevel=9 if level is None else level)
+    elif compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(raw, 'wb', preset=level)
+    elif compression == 'zstd':
+        inject_module('zstandard', globals())
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.stream_writer(raw, closefd=False)
+    raise ValueError('Invalid compression: {}'.format(compression))
+
+READ_BUFFER_SIZE = 2 ** 20
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+# "BZh", the block size and then the magic number of a block (or of the end of the stream)
+BZ2_BLOCK_MAGIC = (b'1AY&SY', b'\x17rE8P\x90')
+
+def detect_compression(head):
+    """ The compression of data starting with the bytes `head` (or None) """
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    if head[:3] == b'BZh' and head[3:4].isdigit() and head[4:10] in BZ2_BLOCK_MAGIC:
+        return 'bz2'
+    return None
+
+def file_compression(path):
+    """ The compression of a file, by extension or else the first bytes of a regular file """
+    compression = compression_from_name(path)
+    # Reading from a pipe or FIFO would take the data from whoever reads it next
+    if compression is None and os.path.isfile(path):
+        with open(path, 'rb') as f:
+            compression = detect_compression(f.read(10))
+    return compression
+
+def open_compressed(source, compression):
+    """ A binary reader decompressing a path or binary file object (only a path is closed with the reader) """
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(source, 'rb')
+    elif compression == 'bz2':
+        import bz2
+        return bz2.open(source, 'rb')
+    elif compression == 'xz':
+        import lzma
+        return lzma.open(source, 'rb')
+    elif compression == 'zstd':
+        inject_module('zstandard', globals())
+        if isinstance(source, str):
+            source = open(source, 'rb', buffering=READ_BUFFER_SIZE)
+            return zstandard.ZstdDecompressor().stream_reader(source, read_size=READ_BUFFER_SIZE, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(source, read_size=READ_BUFFER_SIZE, closefd=False)
+    raise ValueError('Invalid compression: {}'.format(compression))
+
+class ThreadedReader(io.RawIOBase):
+    """ Reads a binary stream ahead in a background thread so (e.g.) decompression overlaps with the pipeline """
+    QUEUE_SIZE = 4
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, source, chunk_size=READ_BUFFER_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(self.QUEUE_SIZE)
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped:
+            try:
+                self.chunks.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _read_ahead(self):
+        try:
+            while not self.stopped:
+                chunk = self.source.read(self.chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            if self.finished:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self.finished = True
+                return 0
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            self.thread.join()
+            self.source.close()
+        super().close()
+
+class ClosingReader(io.RawIOBase):
+    """ Reads through `reader` (e.g. a decompressor), closing the `source` file it reads from along with it """
+    def __init__(self, reader, source):
+        self.reader = reader
+        self.source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.reader.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.reader.close()
+            finally:
+                self.source.close()
+        super().close()
+
+def _text_reader(binary, threaded, encoding=None):
+    if threaded:
+        binary = io.BufferedReader(ThreadedReader(binary), READ_BUFFER_SIZE)
+    return io.TextIOWrapper(binary, encoding=encoding)
+
+def open_input(path, threaded=False, encoding=None):
+    """
+        Open a file for reading text, decompressing it if need be. Without a
+        telling extension the magic bytes are peeked at on the one handle
+        (like `open_stdin`) so pipes and FIFOs, e.g. `<(...)`, work too.
+    """
+    compression = compression_from_name(path)
+    if compression is not None:
+        return _text_reader(open_compressed(path, compression), threaded, encoding)
+
+    raw = open(path, 'rb', buffering=READ_BUFFER_SIZE)
+    if stat.S_ISREG(os.fstat(raw.fileno()).st_mode):
+        # Doesn't move the file position, nor copy the whole read buffer like `peek` does
+        head = os.pread(raw.fileno(), 10, 0)
+    else:
+        head = raw.peek(10)[:10]
+    compression = detect_compression(head)
+    if compression is None:
+        return io.TextIOWrapper(raw, encoding=encoding)
+    binary = io.BufferedReader(ClosingReader(open_compressed(raw, compression), raw), READ_BUFFER_SIZE)
+    return _text_reader(binary, threaded, encoding)
+
+def open_stdin(threaded=False, encoding=None):
+    buffer = getattr(sys.stdin, 'buffer', None)
+    if not hasattr(buffer, 'peek'):
+        # Replaced by a plain text stream (e.g. in tests)
+        return sys.stdin
+    compression = detect_compression(buffer.peek(10)[:10])
+    if compression is None:
+        if encoding is None:
+            return sys.stdin
+        return io.TextIOWrapper(buffer, encoding=encoding)
+    return _text_reader(open_compressed(buffer, compression), threaded, encoding)
+
+SIZE_UNITS = {
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+def parse_size(size):
+    """ Convert a human friendly byte count such as "10M" into an int """
+    if size is None or isinstance(size, int):
+        return size
+    size = str(size).strip().upper().rstrip('B')
+    multiplier = 1
+    if size and size[-1] in SIZE_UNITS:
+        multiplier = SIZE_UNITS[size[-1]]
+        size = size[:-1]
+    return int(float(size) * multiplier)
 
 def get_env_as(var, constructor, default=0):
     if var not in os.environ:
@@ -47,6 +276,32 @@ def import_obj(path):
         raise ValueError('Unable to import object: {}'.format(path))
     return handler_obj
 
+class LazyRegistry(dict):
+    """
+        A name -> object mapping where values may also be given as
+        "package.module:attr" import paths. Paths are imported the first time
+        the name is looked up so a run only pays for the modules it uses.
+    """
+    def __getitem__(self, name):
+        value = super().__getitem__(name)
+        if isinstance(value, str):
+            module_path, attr = value.split(':', 1)
+            value = getattr(import_module(module_path), attr)
+            super().__setitem__(name, value)
+        return value
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
 def inject_module(module_name, namespace):
     try:
         module = import_module(module_name)
@@ -72,7 +327,7 @@ def force_string(value):
     if isinstance(value, str):
         return value
     try:
-        value = json.dumps(value)
+        value = serializers.dumps(value)
     except Exception as e:
         value = str(value)
     return value
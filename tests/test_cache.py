@@ -0,0 +1,91 @@
+import time
+
+from streamline import streamers
+from streamline.cache import ResultCache
+from streamline.core import static_pipe, sync_exec
+from streamline.entries import entry_wrap
+
+
+def test_cache_get_put(tmpdir):
+    cache = ResultCache(str(tmpdir))
+    key = cache.make_key(['shell', {'command': 'uptime'}], 'host1')
+    assert key != cache.make_key(['shell', {'command': 'date'}], 'host1')
+    assert cache.get(key) == (False, None)
+    cache.put(key, {'stdout': 'up', 'exit_code': 0})
+    assert cache.get(key) == (True, {'stdout': 'up', 'exit_code': 0})
+
+    # Unserializable results are skipped
+    cache.put('other', object())
+    assert cache.get('other') == (False, None)
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'stores': 1, 'evictions': 0}
+    cache.close()
+
+    # Persisted for the next run
+    cache = ResultCache(str(tmpdir))
+    assert cache.get(key) == (True, {'stdout': 'up', 'exit_code': 0})
+
+def test_cache_ttl(tmpdir):
+    cache = ResultCache(str(tmpdir), ttl=.1)
+    cache.put('key', 1)
+    assert cache.get('key') == (True, 1)
+    time.sleep(.2)
+    assert cache.get('key') == (False, None)
+
+def test_cache_eviction(tmpdir):
+    cache = ResultCache(str(tmpdir), max_entries=2)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, key)
+        time.sleep(.01)
+    cache.get('a')
+    cache.evict()
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 'a')
+    assert cache.get('c') == (True, 'c')
+
+def test_async_executor_cache(tmpdir):
+    calls = []
+
+    async def executor(value):
+        calls.append(value)
+        return value * 2
+
+    cache = ResultCache(str(tmpdir))
+    for i in range(2):
+        entries = entry_wrap([1, 2])
+        ae = streamers.AsyncExecutor(executor=executor, cache=cache, cache_namespace='double')
+        sync_exec(static_pipe(ae.stream, entries))
+        assert [entry.value for entry in entries] == [2, 4]
+    assert sorted(calls) == [1, 2]
+    assert cache.stats()['hits'] == 2
+
+def test_async_executor_cache_side_effects(tmpdir, capsys):
+    from streamline.executors import ShellHandler
+
+    cache = ResultCache(str(tmpdir))
+    # A cache hit would skip writing the output file
+    handler = ShellHandler(command='echo {value}', stream_output=str(tmpdir.join('{value}.log')))
+    ae = streamers.AsyncExecutor(executor=handler.handle, cache=cache, cache_namespace='shell')
+    assert ae.cache is None
+    assert 'Not caching ShellHandler' in capsys.readouterr().err
+
+    ae = streamers.AsyncExecutor(executor=ShellHandler(command='echo {value}').handle, cache=cache, cache_namespace='shell')
+    assert ae.cache is cache
+
+def test_cache_off_loop(tmpdir):
+    import threading
+    cache = ResultCache(str(tmpdir))
+    threads = []
+    original_get = cache.get
+
+    def get(key):
+        threads.append(threading.current_thread())
+        return original_get(key)
+    cache.get = get
+
+    async def run():
+        await cache.store('key', 1)
+        return await cache.fetch('key')
+
+    assert sync_exec(run()) == (True, 1)
+    assert threads and threads[0] is not threading.main_thread()
+    cache.close()
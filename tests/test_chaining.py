@@ -1,4 +1,7 @@
-from test_e2e import do_cli_call
+from streamline import streamers
+from streamline.core import fuse, static_pipe, sync_exec
+from streamline.entries import entry_wrap, entry_unwrap
+from test_e2e import do_cli_call, streamer_addone
 
 
 def test_appending_data():
@@ -53,3 +56,23 @@ def test_shorthand_indexing():
         'Foo\nBar',
         'FFFFFFFF\nBBBBBBBB',
     )
+
+def test_fusion():
+    extract = streamers.ExtractionStreamer(selector='number').stream
+    chain = [streamers.json_parser, extract, streamer_addone, streamers.truthy, streamers.history_push, streamers.noop]
+    fused = fuse(chain)
+    assert len(fused) == 3
+    assert fused[0].__name__ == 'fused(json_parser+ExtractionStreamer)'
+    assert fused[1] is streamer_addone
+    assert fuse([extract]) == [extract]
+
+    # Entries dropped by a fused stage (truthy) skip the stages after it
+    inputs = ['{"number": 1}', '{"number": -1}', 'not json']
+    for streamer_chain in (fused, chain):
+        stream = lambda source: pipe_chain(source, streamer_chain)
+        assert entry_unwrap(sync_exec(static_pipe(stream, entry_wrap(inputs)))) == [2]
+
+def pipe_chain(source, chain):
+    for streamer in chain:
+        source = streamer(source)
+    return source
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from streamline.checkpoint import CheckpointJournal
+from streamline.core import pipe, drain, sync_exec, transync
+from streamline.entries import EntryFactory, entry_unwrap
+from test_e2e import do_cli_call
+
+
+async def double(source):
+    async for entry in source:
+        entry.value = entry.value * 2
+        yield entry
+
+def run_with_journal(journal, inputs):
+    factory = EntryFactory()
+    source = journal.skip_completed(transync([factory(value) for value in inputs]))
+    outputs = []
+
+    async def consumer(stream):
+        outputs.extend(await drain(stream))
+
+    sync_exec(pipe(source, [double, journal.replay_and_record], consumer=consumer))
+    return entry_unwrap(outputs)
+
+def test_checkpoint_journal(tmpdir):
+    path = str(tmpdir.join('journal'))
+    assert run_with_journal(CheckpointJournal(path), [1, 2]) == [2, 4]
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == [
+            {'index': 0, 'input': 1, 'value': 2},
+            {'index': 1, 'input': 2, 'value': 4},
+            {'index': 0, 'done': True},
+            {'index': 1, 'done': True},
+        ]
+
+    # Simulate a crash mid-write leaving a partial line
+    with open(path, 'a') as f:
+        f.write('{"index": 2, "inp')
+
+    journal = CheckpointJournal(path, resume=True)
+    assert sorted(journal.completed) == [0, 1]
+    assert run_with_journal(journal, [1, 2, 3]) == [2, 4, 6]
+    journal = CheckpointJournal(path, resume=True)
+    assert sorted(journal.completed) == [0, 1, 2]
+    assert run_with_journal(journal, [1, 2, 3]) == [2, 4, 6]
+
+async def explode(source):
+    async for entry in source:
+        for piece in range(3):
+            new_entry = entry.clone()
+            new_entry.value = [entry.value, piece]
+            yield new_entry
+
+async def generate(inputs):
+    # Like the CLI generators, entries only exist once they're read
+    factory = EntryFactory()
+    for value in inputs:
+        yield factory(value)
+
+def test_checkpoint_fan_out_crash(tmpdir):
+    path = str(tmpdir.join('journal'))
+    inputs = ['a', 'b', 'c']
+    expected = [[value, piece] for value in inputs for piece in range(3)]
+
+    async def crashing_consumer(stream):
+        # Written entries aren't kept, so an input finishes once its last piece has been journaled
+        count = 0
+        async for entry in stream:
+            count += 1
+            if count == 5:
+                raise RuntimeError('crash')
+
+    journal = CheckpointJournal(path, batch_size=1)
+    source = journal.skip_completed(generate(inputs))
+    with pytest.raises(RuntimeError):
+        sync_exec(pipe(source, [explode, journal.replay_and_record], consumer=crashing_consumer))
+
+    # "b" only had some of its pieces journaled so it's run again rather than skipped
+    journal = CheckpointJournal(path, resume=True)
+    assert list(journal.completed) == [0]
+    source = journal.skip_completed(generate(inputs))
+    outputs = []
+
+    async def consumer(stream):
+        outputs.extend(await drain(stream))
+
+    sync_exec(pipe(source, [explode, journal.replay_and_record], consumer=consumer))
+    assert entry_unwrap(outputs) == expected
+
+    journal = CheckpointJournal(path, resume=True)
+    assert sorted(journal.completed) == [0, 1, 2]
+    assert [record['value'] for index in range(3) for record in journal.completed[index]] == expected
+
+def test_resume_e2e(tmpdir):
+    path = str(tmpdir.join('journal'))
+    do_cli_call('streamline py --checkpoint {} -- "value.upper()"'.format(path), 'foo\nbar', 'FOO\nBAR')
+    do_cli_call('streamline py --resume {} -- "value.upper()"'.format(path), 'foo\nbar\nbaz', 'FOO\nBAR\nBAZ')
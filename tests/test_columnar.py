@@ -0,0 +1,126 @@
+import collections
+import os
+
+import pytest
+
+from streamline import columnar, consumers
+from streamline.core import sync_exec, transync
+from streamline.entries import entry_wrap
+
+
+def write(values, **options):
+    writer = consumers.CONSUMERS['columnar'](**options)
+    sync_exec(writer.stream(transync(entry_wrap(values))))
+    return writer
+
+def test_infer_type():
+    assert columnar.infer_type([True, None, False]) == 'bool'
+    assert columnar.infer_type([1, 2]) == 'int'
+    assert columnar.infer_type([1, 2.5]) == 'float'
+    assert columnar.infer_type(['a', None]) == 'str'
+    assert columnar.infer_type([1, 'a']) == 'json'
+    assert columnar.infer_type([{'a': 1}]) == 'json'
+    assert columnar.infer_type([None]) == 'str'
+    assert columnar.infer_type([1, 2 ** 70]) == 'json'
+
+def test_widen_type():
+    assert columnar.widen_type('int', [1, None]) == 'int'
+    assert columnar.widen_type('int', [1.5]) == 'float'
+    assert columnar.widen_type('float', [2]) == 'float'
+    assert columnar.widen_type('int', [2 ** 70]) == 'json'
+    assert columnar.widen_type('bool', [1]) == 'json'
+    assert columnar.widen_type('str', [{'a': 1}]) == 'str'
+    assert columnar.widen_type('bool', [None]) == 'bool'
+
+def test_builtin_roundtrip(tmpdir, capsys):
+    path = str(tmpdir.join('rows.stc'))
+    values = [
+        {'id': i, 'score': i / 2, 'ok': i % 2 == 0, 'name': 'row é{}'.format(i), 'tags': [i]}
+        for i in range(25)
+    ]
+    # Missing keys come back as null
+    values.append({'name': 7})
+    writer = write(values, output=path, format='builtin', batch_size=10)
+    assert [column.type for column in writer.columns] == ['int', 'float', 'bool', 'str', 'json']
+
+    columns = columnar.read_columnar(path)
+    assert list(columns) == ['id', 'score', 'ok', 'name', 'tags']
+    assert columns['id'] == list(range(25)) + [None]
+    assert columns['score'] == [i / 2 for i in range(25)] + [None]
+    assert columns['ok'][:3] == [True, False, True]
+    assert columns['name'][-2:] == ['row é24', '7']
+    assert columns['tags'] == [[i] for i in range(25)] + [None]
+    assert capsys.readouterr().err == ''
+
+    # Unwanted columns are skipped over
+    assert columnar.read_columnar(path, columns=['ok']) == {'ok': columns['ok']}
+
+def test_builtin_widens_columns(tmpdir, capsys):
+    path = str(tmpdir.join('rows.stc'))
+    # Values that don't fit the type inferred from the first batch are kept, not written as null
+    values = [{'id': i, 'count': i} for i in range(10)]
+    values += [{'id': 1.5, 'count': 2 ** 70}, {'id': 'x', 'count': 3}, {'id': 4, 'count': 5}]
+    writer = write(values, output=path, format='builtin', batch_size=10)
+    assert [column.type for column in writer.columns] == ['json', 'json']
+    assert columnar.read_columnar(path) == {
+        'id': list(range(10)) + [1.5, 'x', 4],
+        'count': list(range(10)) + [2 ** 70, 3, 5],
+    }
+    assert 'Column id widened from int to json' in capsys.readouterr().err
+
+    write(values[:11], output=path, format='builtin', batch_size=10)
+    columns = columnar.read_columnar(path)
+    assert columns['id'] == list(range(10)) + [1.5]
+    assert [type(value) for value in columns['id']] == [int] * 10 + [float]
+
+def test_builtin_non_dict_rows(tmpdir):
+    path = str(tmpdir.join('values.stc'))
+    write(['a', 'b'], output=path, format='builtin')
+    assert columnar.read_columnar(path) == {'input': ['a', 'b'], 'value': ['a', 'b']}
+
+    Row = collections.namedtuple('Row', ['a', 'b'])
+    write([Row(1, 'x'), Row(2, None)], output=path, format='builtin', input_column=True)
+    assert columnar.read_columnar(path) == {'input': [[1, 'x'], [2, None]], 'a': [1, 2], 'b': ['x', None]}
+
+    write([], output=path, format='builtin')
+    assert columnar.read_columnar(path) == {}
+
+def test_columnar_requires_output():
+    with pytest.raises(ValueError):
+        consumers.CONSUMERS['columnar'](output='-')
+
+def test_columnar_format_from_extension(tmpdir, monkeypatch):
+    monkeypatch.setattr(columnar, 'pyarrow_available', lambda: False)
+    # Never the built-in format under a name that promises Parquet or Arrow
+    for name in ('out.parquet', 'out.arrow'):
+        with pytest.raises(ValueError):
+            consumers.CONSUMERS['columnar'](output=str(tmpdir.join(name)))
+    assert consumers.CONSUMERS['columnar'](output=str(tmpdir.join('out.stc'))).format == 'builtin'
+
+def test_columnar_failed_stream(tmpdir):
+    path = str(tmpdir.join('rows.stc'))
+
+    async def source():
+        for entry in entry_wrap([{'a': i} for i in range(5)]):
+            yield entry
+        raise RuntimeError('upstream failure')
+
+    with pytest.raises(RuntimeError):
+        sync_exec(consumers.CONSUMERS['columnar'](output=path, format='builtin', batch_size=2).stream(source()))
+    # The file is closed but left without its end marker, so it can't pass for complete
+    with pytest.raises(ValueError, match='truncated'):
+        columnar.read_columnar(path)
+
+def test_pyarrow_output(tmpdir):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    path = str(tmpdir.join('rows.parquet'))
+    write([{'a': i, 'b': str(i)} for i in range(15)], output=path, batch_size=10)
+    table = pyarrow.parquet.read_table(path)
+    assert table.column('a').to_pylist() == list(range(15))
+    assert table.column('b').to_pylist() == [str(i) for i in range(15)]
+    assert os.path.getsize(path) > 0
+
+    # A Parquet schema can't change once written, so values that don't fit fail rather than becoming null
+    with pytest.raises(ValueError, match='needs type float'):
+        write([{'a': i} for i in range(10)] + [{'a': 1.5}], output=path, batch_size=10)
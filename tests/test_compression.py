@@ -0,0 +1,95 @@
+import threading
+import gzip
+import lzma
+import bz2
+import os
+
+import pytest
+
+from streamline import generators, utils
+from streamline.core import drain, sync_exec
+from streamline.entries import entry_unwrap
+
+
+LINES = ['line {}'.format(i) for i in range(5000)]
+OPENERS = {
+    'gzip': (gzip.open, '.gz'),
+    'bz2': (bz2.open, '.bz2'),
+    'xz': (lzma.open, '.xz'),
+}
+
+def write_compressed(tmpdir, compression, name):
+    opener, extension = OPENERS[compression]
+    path = str(tmpdir.join(name.format(extension)))
+    with opener(path, 'wt') as f:
+        f.write('\n'.join(LINES))
+    return path
+
+def read_lines(**options):
+    return entry_unwrap(sync_exec(drain(generators.FileReader(**options).stream())))
+
+@pytest.mark.parametrize('compression', sorted(OPENERS))
+@pytest.mark.parametrize('threaded', [False, True])
+def test_compressed_input(tmpdir, compression, threaded):
+    by_extension = write_compressed(tmpdir, compression, 'logs{}')
+    assert utils.file_compression(by_extension) == compression
+    assert read_lines(input=by_extension, read_thread=threaded) == LINES
+
+    # No telling extension, found from the magic bytes
+    by_magic = write_compressed(tmpdir, compression, 'logs.txt')
+    assert utils.file_compression(by_magic) == compression
+    assert read_lines(input=by_magic, read_thread=threaded) == LINES
+
+def test_detect_compression(tmpdir):
+    assert utils.detect_compression(b'BZh9 is just text') is None
+    assert utils.detect_compression(bz2.compress(b'data')[:10]) == 'bz2'
+    assert utils.detect_compression(b'plain') is None
+
+    path = str(tmpdir.join('plain.txt'))
+    with open(path, 'w') as f:
+        f.write('\n'.join(LINES))
+    assert utils.file_compression(path) is None
+    assert read_lines(input=path, read_thread=True) == LINES
+
+def test_threaded_reader_close(tmpdir):
+    # Closing early stops the read-ahead thread
+    path = write_compressed(tmpdir, 'gzip', 'logs{}')
+    reader = utils.get_file_io(path, threaded=True)
+    assert reader.readline() == 'line 0\n'
+    reader.close()
+
+def test_compressed_csv(tmpdir):
+    path = str(tmpdir.join('rows.csv.gz'))
+    with gzip.open(path, 'wt') as f:
+        f.write('a,b\n1,2\n3,4\n')
+    rows = entry_unwrap(sync_exec(drain(generators.CSVReader(input=path, parallel=2).stream())))
+    assert rows == [{'a': '1', 'b': '2'}, {'a': '3', 'b': '4'}]
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_fifo_input(tmpdir, compressed):
+    # Non-regular files (FIFOs, `<(...)` pipes) can only be read once so aren't opened twice
+    data = '\n'.join(LINES).encode('utf-8')
+    if compressed:
+        data = gzip.compress(data)
+    path = str(tmpdir.join('fifo'))
+    os.mkfifo(path)
+
+    def write():
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        assert utils.file_compression(path) is None
+        assert read_lines(input=path) == LINES
+    finally:
+        writer.join()
+
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(write_fd, 'wb') as f:
+        f.write(gzip.compress(b'a\nb') if compressed else b'a\nb')
+    reader = utils.get_file_io('/dev/fd/{}'.format(read_fd))
+    assert reader.read() == 'a\nb'
+    reader.close()
+    os.close(read_fd)
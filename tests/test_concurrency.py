@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from streamline.concurrency import AdaptiveLimit, TokenBucket, KeyedSemaphore
+from streamline.core import sync_exec
+
+
+def test_adaptive_limit_growth():
+    limit = AdaptiveLimit(2, min_limit=1, max_limit=4)
+    for i in range(50):
+        limit.record(time.monotonic(), .1)
+    assert limit.current() == 4
+
+def test_adaptive_limit_backoff():
+    limit = AdaptiveLimit(10, min_limit=2, max_limit=10)
+    started = time.monotonic()
+    limit.record(started, .1)
+
+    # A whole window of failures only cuts the limit once
+    for i in range(5):
+        limit.record(started, .1, failed=True)
+    assert limit.current() == 7
+
+    # Latency well beyond the baseline counts as congestion
+    limit.record(time.monotonic(), 5)
+    assert limit.current() == 4
+
+    for i in range(10):
+        limit.record(time.monotonic(), .1, failed=True)
+    assert limit.current() == 2
+
+def test_token_bucket():
+    bucket = TokenBucket(20, burst=2)
+
+    async def acquire_all():
+        for i in range(6):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    sync_exec(acquire_all())
+    # Two come from the burst and the remaining four are spaced out at 20/s
+    assert .15 < time.monotonic() - started < .5
+
+def test_keyed_semaphore():
+    semaphore = KeyedSemaphore(2)
+    active = {}
+    peaks = {}
+
+    async def work(key):
+        async with semaphore.hold(key):
+            active[key] = active.get(key, 0) + 1
+            peaks[key] = max(peaks.get(key, 0), active[key])
+            await asyncio.sleep(.05)
+            active[key] -= 1
+
+    async def run_all():
+        await asyncio.gather(*[work(key) for key in 'aaaaabbb'])
+
+    sync_exec(run_all())
+    assert peaks == {'a': 2, 'b': 2}
+    assert semaphore.semaphores == {}
@@ -0,0 +1,73 @@
+import csv
+import io
+
+from streamline import generators, consumers
+from streamline.core import drain, sync_exec, transync
+from streamline.entries import entry_wrap, entry_unwrap
+
+
+CSV_TEXT = 'host,port,status\na.com,22,open\n\nb.com,80\nc.com,443,open,extra\n' + ''.join(
+    'host-{},{},closed\n'.format(i, i) for i in range(50)
+)
+
+def read_csv(**options):
+    return entry_unwrap(sync_exec(drain(generators.CSVReader(**options).stream())))
+
+def test_csv_reader(tmpdir):
+    path = str(tmpdir.join('input.csv'))
+    with open(path, 'w') as f:
+        f.write(CSV_TEXT)
+
+    expected = list(csv.DictReader(io.StringIO(CSV_TEXT)))
+    assert read_csv(input=path) == expected
+
+    rows = read_csv(input=path, tuples=True)
+    assert [row._asdict() for row in rows[:2]] == [
+        {'host': 'a.com', 'port': '22', 'status': 'open'},
+        {'host': 'b.com', 'port': '80', 'status': None},
+    ]
+    assert type(rows[0]) is type(rows[-1])
+
+def test_csv_reader_parallel(tmpdir, monkeypatch):
+    path = str(tmpdir.join('input.csv'))
+    with open(path, 'w') as f:
+        f.write(CSV_TEXT)
+
+    # Small ranges so range edges land mid-line
+    monkeypatch.setattr(generators.CSVReader, 'RANGE_SIZE', 37)
+    assert read_csv(input=path, parallel=2) == list(csv.DictReader(io.StringIO(CSV_TEXT)))
+
+    with open(path, 'w') as f:
+        f.write('id,note\n1,"line one\nline two"\n2,plain\n')
+    try:
+        read_csv(input=path, parallel=2)
+    except ValueError as e:
+        assert 'spanning lines' in str(e)
+    else:
+        assert False, 'Multiline fields were not detected'
+
+def test_csv_writer():
+    output = io.StringIO()
+    output.close = lambda: None
+    values = [
+        {'name': 'a', 'count': 1, 'ratio': 0.5, 'ok': True, 'tags': ['x'], 'missing': None},
+        {'name': 'b,c', 'count': 2, 'ratio': float('nan')},
+    ]
+    sync_exec(consumers.CSVWriter(output=output).stream(transync(entry_wrap(values))))
+    assert output.getvalue() == (
+        'name,count,ratio,ok,tags,missing\n'
+        'a,1,0.5,true,"[""x""]",null\n'
+        '"b,c",2,NaN,,,\n'
+    )
+
+def test_csv_reader_encoding(tmpdir, monkeypatch):
+    path = str(tmpdir.join('input.csv'))
+    text = 'name,city\n' + ''.join('n{},Zürich\n'.format(i) for i in range(20))
+    with open(path, 'w', encoding='latin-1') as f:
+        f.write(text)
+
+    # The serial and --parallel paths decode the same way
+    monkeypatch.setattr(generators.CSVReader, 'RANGE_SIZE', 37)
+    expected = list(csv.DictReader(io.StringIO(text)))
+    assert read_csv(input=path, encoding='latin-1') == expected
+    assert read_csv(input=path, encoding='latin-1', parallel=2) == expected
@@ -4,6 +4,8 @@ import sys
 import os
 import io
 
+import pytest
+
 from streamline import cli
 
 async def executor_addone(value):
@@ -119,3 +121,28 @@ def test_clone_history():
         'foo\nbar',
         'foo: f\nfoo: o\nfoo: o\nbar: b\nbar: a\nbar: r',
     )
+
+def test_shell_pool():
+    do_cli_call(
+        'streamline shell extract -- "echo {value}" --pool 1 --selector stdout',
+        'foo\nbar',
+        'foo\n\nbar\n',
+    )
+
+def test_progress_keeps_stdout_clean():
+    for mode in ['buffer', 'stream-output', 'streaming']:
+        do_cli_call('streamline py -p {} -- "value.upper()"'.format(mode), 'foo\nbar', 'FOO\nBAR')
+
+def test_event_loop_selection():
+    for loop in ['asyncio', 'auto', 'uvloop']:
+        do_cli_call('streamline sleep --loop {} -- --seconds 0'.format(loop), 'Foo\nBar', 'Foo\nBar')
+
+def test_event_loop_environment(monkeypatch):
+    # e.g. STREAMLINE_EVENT_LOOP=bogus is a usage error rather than a crash
+    monkeypatch.setattr(cli, 'DEFAULT_EVENT_LOOP', 'bogus')
+    fake_io = FakeIO('Foo')
+    with pytest.raises(SystemExit) as exc_info, fake_io:
+        cli.streamline_command([])
+    assert exc_info.value.code == 2
+    assert "invalid STREAMLINE_EVENT_LOOP: 'bogus'" in fake_io.read_all('stderr')
+    do_cli_call('streamline --loop asyncio', 'Foo', 'Foo')
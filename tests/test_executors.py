@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from streamline import executors
+from streamline.core import sync_exec
+
+
+def test_shell_handler():
+    handler = executors.ShellHandler(command='echo {value}; echo oops >&2; exit 3')
+    result = sync_exec(handler.handle('foo bar'))
+    assert result == {'stdout': 'foo bar\n', 'stderr': 'oops\n', 'exit_code': 3}
+
+def test_shell_pool():
+    handler = executors.ShellHandler(command='printf {value}; printf err >&2; cd /; exit 4', pool=2)
+
+    async def run_all():
+        results = [await handler.handle(value) for value in ['a', 'b c', 'd']]
+        await handler.close()
+        return results
+
+    results = sync_exec(run_all())
+    assert results == [
+        {'stdout': 'a', 'stderr': 'err', 'exit_code': 4},
+        {'stdout': 'b c', 'stderr': 'err', 'exit_code': 4},
+        {'stdout': 'd', 'stderr': 'err', 'exit_code': 4},
+    ]
+
+def test_shell_pool_unbalanced_quote():
+    # A quote in a value can't swallow the end of command markers
+    for pool in (None, 1):
+        handler = executors.ShellHandler(command="echo '{value}'", pool=pool)
+
+        async def run_all():
+            broken = await asyncio.wait_for(handler.handle("it's"), 5)
+            fine = await asyncio.wait_for(handler.handle('ok'), 5)
+            await handler.close()
+            return broken, fine
+
+        broken, fine = sync_exec(run_all())
+        assert broken['exit_code'] != 0 and broken['stdout'] == ''
+        assert fine == {'stdout': 'ok\n', 'stderr': '', 'exit_code': 0}
+
+def test_shell_pool_reuses_shells():
+    handler = executors.ShellHandler(command='echo $$', pool=1)
+    first = sync_exec(handler.handle(''))
+    second = sync_exec(handler.handle(''))
+    assert first['stdout'] == second['stdout']
+    sync_exec(handler.close())
+
+def test_shell_max_output():
+    for pool in (None, 1):
+        handler = executors.ShellHandler(
+            command='head -c 100000 /dev/zero | tr "\\0" x; echo {value} >&2',
+            max_output='1K',
+            pool=pool,
+        )
+        result = sync_exec(handler.handle('err'))
+        sync_exec(handler.close())
+        assert result == {
+            'stdout': 'x' * 1024,
+            'stderr': 'err\n',
+            'exit_code': 0,
+            'stdout_truncated': True,
+            'stderr_truncated': False,
+        }
+
+def test_shell_stream_output(tmpdir):
+    target = str(tmpdir.join('{value}.txt'))
+    handler = executors.ShellHandler(command='echo {value}', stream_output=target)
+    result = sync_exec(handler.handle('foo'))
+    assert result == {'stderr': '', 'exit_code': 0}
+    assert tmpdir.join('foo.txt').read() == 'foo\n'
+
+    handler = executors.ShellHandler(command='echo {value}', stream_output=target, stream_append=True)
+    sync_exec(handler.handle('foo'))
+    assert tmpdir.join('foo.txt').read() == 'foo\nfoo\n'
+
+def test_shell_timeout_kills_command():
+    for pool in (None, 1):
+        handler = executors.ShellHandler(command='sleep {value}', pool=pool)
+
+        async def run_with_timeout():
+            try:
+                await asyncio.wait_for(handler.handle('5'), .2)
+            except asyncio.TimeoutError:
+                pass
+            # Pooled shells must recover after a killed command
+            result = await handler.handle('0')
+            await handler.close()
+            return result
+
+        started = time.monotonic()
+        result = sync_exec(run_with_timeout())
+        assert time.monotonic() - started < 2
+        assert result['exit_code'] == 0
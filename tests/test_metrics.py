@@ -0,0 +1,55 @@
+import asyncio
+
+from streamline import streamers
+from streamline.core import pipe, drain, sync_exec, transync
+from streamline.entries import entry_wrap
+from streamline.metrics import Histogram, MetricsCollector, stage_name
+
+
+async def example_executor(value):
+    await asyncio.sleep(.01)
+    return value
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in [.001, .001, .002, .5]:
+        histogram.record(seconds)
+    stats = histogram.to_dict()
+    assert stats['count'] == 4
+    assert stats['max'] == .5
+    assert .001 <= stats['p50'] <= .002
+    assert stats['p99'] == .5
+
+def test_stage_names():
+    assert stage_name(streamers.noop) == 'noop'
+    assert stage_name(streamers.HeadStreamer().stream) == 'HeadStreamer'
+    ae = streamers.AsyncExecutor(executor=example_executor)
+    assert stage_name(ae.stream) == 'AsyncExecutor(example_executor)'
+
+def test_metrics_collector(tmpdir):
+    async def executor(value):
+        # The third value is still running when HeadStreamer stops reading, and is cancelled
+        await asyncio.sleep(.01 if value < 3 else 10)
+        return value
+
+    metrics = MetricsCollector()
+    ae = streamers.AsyncExecutor(executor=executor)
+    source, instrumented, consumer = metrics.instrument(
+        transync(entry_wrap([1, 2, 3])),
+        [ae.stream, streamers.HeadStreamer(count=2).stream],
+        drain,
+    )
+    path = str(tmpdir.join('metrics.json'))
+    sync_exec(metrics.run(pipe(source, instrumented, consumer=consumer), path=path))
+
+    snapshot = metrics.snapshot()
+    counts = [(stage['name'], stage['entries_in'], stage['entries_out']) for stage in snapshot['stages']]
+    assert counts == [
+        ('generator', 0, 3),
+        ('AsyncExecutor(executor)', 3, 2),
+        ('HeadStreamer', 2, 2),
+        ('consumer', 2, 0),
+    ]
+    assert snapshot['executors'][0]['latency']['count'] == 2
+    assert 'HeadStreamer' in metrics.summary()
+    assert tmpdir.join('metrics.json').check()
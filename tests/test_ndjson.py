@@ -0,0 +1,91 @@
+import gzip
+import io
+import json
+import os
+import sys
+
+import pytest
+
+from streamline import consumers
+from streamline.core import sync_exec, transync
+from streamline.entries import entry_wrap
+
+
+def write(values, **options):
+    writer = consumers.NDJsonWriter(**options)
+    sync_exec(writer.stream(transync(entry_wrap(values))))
+    return writer
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+def test_ndjson_writer(tmpdir):
+    path = str(tmpdir.join('out.ndjson'))
+    values = [{'a': 1}, 'two', [3], None]
+    write(values, output=path, block_size='4')
+    assert read_lines(path) == values
+    assert os.listdir(str(tmpdir)) == ['out.ndjson']
+
+def test_ndjson_rotation(tmpdir):
+    values = [{'index': i, 'text': 'x' * 10} for i in range(25)]
+
+    writer = write(values, output=str(tmpdir.join('events.ndjson.gz')), rotate_entries=10)
+    assert [os.path.basename(path) for path in writer.paths] == [
+        'events-00000.ndjson.gz',
+        'events-00001.ndjson.gz',
+        'events-00002.ndjson.gz',
+    ]
+    assert [len(read_lines(path)) for path in writer.paths] == [10, 10, 5]
+    assert sum((read_lines(path) for path in writer.paths), []) == values
+
+    # Exactly filling the last segment doesn't leave an empty one behind
+    writer = write(values[:20], output=str(tmpdir.join('by-size-{part}.ndjson')), rotate_size='100')
+    assert [os.path.basename(path) for path in writer.paths] == ['by-size-{}.ndjson'.format(i) for i in range(7)]
+    assert sum((read_lines(path) for path in writer.paths), []) == values[:20]
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith('.tmp')]
+
+def test_ndjson_atomic_segments(tmpdir):
+    path = str(tmpdir.join('out.ndjson'))
+
+    async def source():
+        for entry in entry_wrap([1, 2]):
+            yield entry
+        # Mid-run only the hidden temporary file exists
+        assert os.listdir(str(tmpdir)) == ['.out.ndjson.tmp']
+
+    sync_exec(consumers.NDJsonWriter(output=path).stream(source()))
+    assert read_lines(path) == [1, 2]
+
+def test_ndjson_zstd(tmpdir):
+    zstandard = pytest.importorskip('zstandard')
+    path = str(tmpdir.join('out.ndjson.zst'))
+    write([{'a': 1}, {'b': 2}], output=path)
+    with open(path, 'rb') as f:
+        text = zstandard.ZstdDecompressor().stream_reader(f).read().decode('utf-8')
+    assert text == '{"a": 1}\n{"b": 2}\n'
+
+def test_ndjson_failed_stream(tmpdir):
+    async def source():
+        for entry in entry_wrap(list(range(5))):
+            yield entry
+        raise RuntimeError('upstream failure')
+
+    # Completed segments stay, the unfinished one is never published
+    writer = consumers.NDJsonWriter(output=str(tmpdir.join('out.ndjson')), rotate_entries=2)
+    with pytest.raises(RuntimeError):
+        sync_exec(writer.stream(source()))
+    assert sorted(os.listdir(str(tmpdir))) == ['out-00000.ndjson', 'out-00001.ndjson']
+
+    path = str(tmpdir.join('single.ndjson'))
+    with pytest.raises(RuntimeError):
+        sync_exec(consumers.NDJsonWriter(output=path).stream(source()))
+    assert not os.path.exists(path)
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith('.tmp')]
+
+def test_ndjson_text_stdout(monkeypatch):
+    output = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', output)
+    write([{'a': 1}, 'b'])
+    assert output.getvalue() == '{"a": 1}\n"b"\n'
@@ -0,0 +1,20 @@
+import pstats
+import time
+
+from test_e2e import do_cli_call
+
+
+def test_profile_e2e(tmpdir):
+    path = str(tmpdir.join('run.prof'))
+    do_cli_call(
+        'streamline py sleep --profile {} -- "time.sleep(.02) or value" --seconds .05'.format(path),
+        'foo\nbar',
+        'foo\nbar',
+    )
+    stats = pstats.Stats(path)
+    assert any(func[2] == 'streamline_command' or func[2] == 'stream' for func in stats.stats)
+    with open(path + '.collapsed') as f:
+        lines = f.read().strip().split('\n')
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
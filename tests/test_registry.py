@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+from streamline import streamers, executors
+from streamline.utils import LazyRegistry
+
+
+def test_lazy_registry():
+    registry = LazyRegistry({'noop': streamers.noop, 'shell': 'streamline.executors:ShellHandler'})
+    assert dict.__getitem__(registry, 'shell') == 'streamline.executors:ShellHandler'
+    assert registry['shell'] is executors.ShellHandler
+    assert registry.get('noop') is streamers.noop
+    assert registry.get('missing') is None
+    assert dict(registry.items()) == {'noop': streamers.noop, 'shell': executors.ShellHandler}
+
+def test_streamer_registry_matches_executors():
+    for name, Executor in executors.EXECUTORS.items():
+        assert streamers.STREAMERS[name] is Executor
+
+def test_cli_import_is_lazy():
+    code = 'import sys, streamline.cli; print(" ".join(m for m in ("yaml", "streamline.executors", "sqlite3") if m in sys.modules))'
+    output = subprocess.check_output([sys.executable, '-c', code]).decode('utf-8')
+    assert output.strip() == ''
@@ -0,0 +1,83 @@
+from streamline import streamers
+from streamline.core import static_pipe, sync_exec
+from streamline.entries import entry_wrap
+from streamline.retry import RetryPolicy, parse_codes
+
+import asyncio
+
+
+def test_parse_codes():
+    assert parse_codes('255, 429') == {255, 429}
+    assert parse_codes('5xx') == set(range(500, 600))
+    assert parse_codes(None) is None
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, exit_codes='255', status_codes='5xx', exceptions='OSError')
+    assert policy.should_retry(1, error=ConnectionRefusedError())
+    assert not policy.should_retry(1, error=ValueError())
+    assert not policy.should_retry(3, error=ConnectionRefusedError())
+    assert policy.should_retry(1, result={'exit_code': 255})
+    assert not policy.should_retry(1, result={'exit_code': 0})
+    assert policy.should_retry(2, result={'code': 503})
+    assert not policy.should_retry(2, result={'code': 200})
+    assert not policy.should_retry(1, result='503')
+
+    # No exception types means retry any exception
+    assert RetryPolicy(attempts=2).should_retry(1, error=ValueError())
+
+def test_retry_delay():
+    policy = RetryPolicy(backoff=1, max_delay=5)
+    assert 0 <= policy.delay(1) <= 1
+    assert 0 <= policy.delay(10) <= 5
+
+def test_async_executor_retries():
+    calls = {}
+
+    async def flaky_executor(value):
+        calls[value] = calls.get(value, 0) + 1
+        if calls[value] < 3:
+            raise ConnectionError('flaky')
+        return {'code': 200 if value != 'bad' else 503}
+
+    entries = entry_wrap(['a', 'b', 'bad'])
+    ae = streamers.AsyncExecutor(
+        executor=flaky_executor,
+        workers=1,
+        retry=RetryPolicy(attempts=4, backoff=.01, status_codes='5xx'),
+    )
+    sync_exec(static_pipe(ae.stream, entries))
+    assert calls == {'a': 3, 'b': 3, 'bad': 4}
+    assert [entry.value for entry in entries] == [{'code': 200}, {'code': 200}, {'code': 503}]
+    assert all(not entry.errors for entry in entries)
+
+    # Give up after the last attempt
+    calls.clear()
+    entries = entry_wrap(['a'])
+    ae = streamers.AsyncExecutor(executor=flaky_executor, retry=RetryPolicy(attempts=2, backoff=.01))
+    sync_exec(static_pipe(ae.stream, entries))
+    assert calls == {'a': 2}
+    assert isinstance(entries[0].errors[0], ConnectionError)
+
+def test_async_executor_retry_releases_group():
+    class FixedDelay(RetryPolicy):
+        def delay(self, attempt):
+            return .3
+
+    finished = []
+
+    async def executor(value):
+        if value['name'] == 'flaky' and 'flaky' not in finished:
+            finished.append('flaky')
+            raise ConnectionError('flaky')
+        await asyncio.sleep(.01)
+        finished.append(value['name'])
+        return value['name']
+
+    # One worker per host: the other entry runs while the flaky one backs off
+    entries = entry_wrap([{'host': 'a', 'name': 'flaky'}, {'host': 'a', 'name': 'other'}])
+    ae = streamers.AsyncExecutor(
+        executor=executor, group_key='value.host', group_workers=1, retry=FixedDelay(attempts=2),
+    )
+    sync_exec(static_pipe(ae.stream, entries))
+    assert finished == ['flaky', 'other', 'flaky']
+    assert [entry.value for entry in entries] == ['flaky', 'other']
@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+from streamline import serializers, consumers, utils
+from streamline.core import sync_exec, transync
+from streamline.entries import entry_wrap
+
+
+VALUES = [{'a': [1, 2.5, None, True], 'b': {'c': 'd/é'}}, 'text', 2 ** 70, float('nan'), {1: 'int key'}]
+
+@pytest.fixture
+def serializer():
+    yield
+    serializers.set_serializer(serializers.DEFAULT_SERIALIZER)
+
+def test_load_serializer():
+    assert serializers.load_serializer('json').name == 'json'
+    assert serializers.load_serializer('auto').name in ('orjson', 'ujson', 'json')
+    with pytest.raises(ValueError):
+        serializers.load_serializer('yaml')
+
+@pytest.mark.parametrize('name', ['orjson', 'ujson', 'json'])
+def test_serializer_fallbacks(name):
+    try:
+        serializer = serializers.LIBRARIES[name]()
+    except ImportError:
+        pytest.skip('{} is not installed'.format(name))
+
+    # Whatever the library can't handle still comes out like the standard library would do it
+    stdlib = serializers.JsonSerializer()
+    for value in VALUES:
+        text = serializer.dumps(value)
+        if value != value:
+            assert text in ('NaN', 'null')
+        else:
+            assert stdlib.loads(text) == stdlib.loads(stdlib.dumps(value))
+    assert serializer.loads('{"big": 1180591620717411303424, "nan": NaN}')['big'] == 2 ** 70
+    # On their own too, where a library doesn't fail but gives a float
+    for big in (2 ** 70, -2 ** 63 - 1, 2 ** 64):
+        assert serializer.loads('{{"big": {}}}'.format(big)) == {'big': big}
+        assert type(serializer.loads(str(big))) is int
+    with pytest.raises(ValueError):
+        serializer.loads('{not json')
+
+def test_parsing_follows_serializer(serializer):
+    # Parsing is exact by default, like writing
+    assert serializers.loads('{"big": 1180591620717411303424}') == {'big': 2 ** 70}
+    name = serializers.set_serializer('auto')
+    assert serializers.loads('[1180591620717411303424, 1.5]') == [2 ** 70, 1.5]
+    assert serializers.get_serializer().name == name
+
+def test_json_writer(serializer, monkeypatch):
+    monkeypatch.setattr(consumers.JsonWriter, 'BLOCK_SIZE', 4)
+
+    def write(values):
+        output = io.StringIO()
+        output.close = lambda: None
+        sync_exec(consumers.JsonWriter(output=output).stream(transync(entry_wrap(values))))
+        return output.getvalue()
+
+    assert write([]) == '[\n\n]'
+    assert write([{'a': 1}, 'b', [3]]) == '[\n    {"a": 1},\n    "b",\n    [3]\n]'
+
+    if serializers.set_serializer('auto') != 'json':
+        assert write([{'a': 1}, 'b']) == '[\n    {"a":1},\n    "b"\n]'
+        assert utils.force_string({'a': 1}) == '{"a":1}'
@@ -0,0 +1,94 @@
+import os
+
+from streamline.sharding import ShardedPipeline, split_streamers
+from streamline.core import static_pipe, sync_exec
+from streamline.entries import EntryFactory, entry_wrap, entry_unwrap
+from streamline import streamers
+from test_e2e import do_cli_call
+
+
+async def tag_pid(source):
+    async for entry in source:
+        entry.value = (entry.value * 2, os.getpid())
+        yield entry
+
+async def fail_on_three(source):
+    async for entry in source:
+        if entry.value == 3:
+            raise ValueError('three')
+        yield entry
+
+def run_sharded(stream_funcs, inputs, **kwargs):
+    factory = EntryFactory()
+    pipeline = ShardedPipeline(stream_funcs, **kwargs)
+    return entry_unwrap(sync_exec(static_pipe(pipeline.stream, [factory(value) for value in inputs])))
+
+def test_split_streamers():
+    sort = streamers.SortStreamer().stream
+    head = streamers.HeadStreamer().stream
+    assert split_streamers([tag_pid, sort, tag_pid, head]) == ([tag_pid], [sort, tag_pid, head])
+    assert split_streamers([tag_pid, streamers.history_push]) == ([tag_pid, streamers.history_push], [])
+    assert split_streamers([sort]) == ([], [sort])
+
+def test_sharded_pipeline():
+    inputs = list(range(100))
+    results = run_sharded([tag_pid], inputs, processes=2, batch_size=10, ordered=True)
+    assert [value for value, pid in results] == [value * 2 for value in inputs]
+    assert os.getpid() not in {pid for value, pid in results}
+
+    results = run_sharded([tag_pid], inputs, processes=3, batch_size=7)
+    assert sorted(value for value, pid in results) == [value * 2 for value in inputs]
+
+class ClosingHandler():
+    def __init__(self):
+        self.closed = 0
+
+    async def handle(self, value):
+        return (value, self.closed)
+
+    def close(self):
+        self.closed += 1
+
+def test_sharded_executors_stay_open():
+    # Executors (and whatever their handlers hold, like shell pools) last across batches
+    for ordered in (False, True):
+        executor = streamers.AsyncExecutor(executor=ClosingHandler().handle, workers=3)
+        results = run_sharded([executor.stream], list(range(50)), processes=2, batch_size=5, ordered=ordered)
+        assert sorted(results) == [(value, 0) for value in range(50)]
+
+def test_sharded_aggregate():
+    inputs = ['a', 'b', 'a', 'c'] * 50
+    pipeline = ShardedPipeline([], processes=2, batch_size=30, aggregate=streamers.ValueBreakdown())
+    results = sync_exec(static_pipe(pipeline.stream, entry_wrap(inputs)))
+    assert sorted(entry_unwrap(results), key=lambda r: r['value']) == [
+        {'value': 'a', 'count': 100},
+        {'value': 'b', 'count': 50},
+        {'value': 'c', 'count': 50},
+    ]
+
+def test_sharded_worker_error():
+    try:
+        run_sharded([fail_on_three], [1, 2, 3, 4], processes=2, batch_size=1)
+    except RuntimeError as e:
+        assert 'three' in str(e)
+    else:
+        assert False, 'Worker error was not raised'
+
+def test_sharded_cli():
+    do_cli_call(
+        'streamline py --processes 2 --ordered -- "value.upper()"',
+        'a\nb\nc',
+        'A\nB\nC',
+    )
+    # Sorting needs every entry so it runs after the shards are merged
+    do_cli_call(
+        'streamline py sort --processes 3 -- "int(value) * 3" -- --numeric',
+        '\n'.join(str(i) for i in range(20, 0, -1)),
+        '\n'.join(str(i * 3) for i in range(1, 21)),
+    )
+    # Aggregates are computed per process and merged
+    do_cli_call(
+        'streamline py stats --processes 2 -- "int(value) * 2"',
+        '\n'.join(str(i) for i in range(1, 501)),
+        '{"count": 500, "sum": 250500.0, "min": 2.0, "max": 1000.0, "average": 501.0}',
+    )
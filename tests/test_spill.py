@@ -0,0 +1,103 @@
+from operator import itemgetter
+import pickle
+import random
+
+import pytest
+
+from streamline import spill, streamers
+from streamline.core import drain, sync_exec, transync
+from streamline.entries import entry_wrap, entry_unwrap
+
+
+@pytest.fixture
+def memory_limit():
+    def set_limit(limit):
+        spill.set_memory_limit(limit)
+    yield set_limit
+    spill.set_memory_limit(spill.DEFAULT_MEMORY_LIMIT)
+
+def test_spill_buffer_unlimited():
+    buffer = spill.SpillBuffer()
+    buffer.extend(range(5))
+    assert len(buffer) == 5
+    assert list(buffer.drain()) == [0, 1, 2, 3, 4]
+    assert len(buffer) == 0 and list(buffer.drain()) == []
+
+def test_spill_buffer_spills(memory_limit):
+    memory_limit('1K')
+    buffer = spill.SpillBuffer()
+    values = [{'index': i, 'text': 'x' * 20} for i in range(200)]
+    buffer.extend(values)
+    assert len(buffer.runs) == 1
+    assert spill.memory_used() <= 1024
+
+    assert list(buffer.drain()) == values
+    assert spill.memory_used() == 0
+
+def test_spill_buffer_sorted_runs(memory_limit):
+    memory_limit('512')
+    values = [(i, random.randint(0, 50)) for i in range(500)]
+    for reverse in (False, True):
+        buffer = spill.SpillBuffer(key=itemgetter(1), reverse=reverse)
+        buffer.extend(values)
+        assert len(buffer.runs) > 1
+        # Merging the runs is stable, like sorting everything at once
+        assert list(buffer.drain()) == sorted(values, key=itemgetter(1), reverse=reverse)
+    assert spill.memory_used() == 0
+
+def test_spill_buffer_unpicklable(memory_limit):
+    memory_limit('64')
+    values = ['x' * 40, lambda: None, 'y' * 40]
+    buffer = spill.SpillBuffer()
+    buffer.extend(values)
+    assert buffer.runs
+    assert list(buffer.drain()) == values
+
+def test_spill_buffer_pickles(memory_limit):
+    memory_limit('64')
+    buffer = spill.SpillBuffer()
+    buffer.extend(['x' * 40] * 5)
+    assert list(pickle.loads(pickle.dumps(buffer)).drain()) == ['x' * 40] * 5
+
+@pytest.mark.parametrize('limit', [None, '256'])
+def test_buffering_streamers(memory_limit, limit):
+    memory_limit(limit)
+    values = [random.randint(0, 100) for _ in range(300)] + ['a', None]
+
+    sort = streamers.SortStreamer(numeric=True, descending=True)
+    results = entry_unwrap(sync_exec(drain(sort.stream(transync(entry_wrap(values))))))
+    assert results == sorted(values[:-2], reverse=True) + ['a', None]
+
+    buffer = streamers.StreamingBuffer(buffer='7')
+    assert entry_unwrap(sync_exec(drain(buffer.stream(transync(entry_wrap(values)))))) == values
+
+    progress = streamers.ProgressStreamer(target=open('/dev/null', 'w'))
+    stream = progress.streamer_end(progress.streamer_start(transync(entry_wrap(values))))
+    assert entry_unwrap(sync_exec(drain(stream))) == values
+    assert spill.memory_used() == 0
+
+def test_spill_buffers_share_budget(memory_limit):
+    memory_limit(2000)
+    values = [random.randint(0, 1000) for _ in range(3000)]
+
+    # Another buffer holding most of the budget is spilled rather than the sort writing tiny runs
+    other = spill.SpillBuffer()
+    other.extend(['x' * 40] * 35)
+    assert not other.runs
+    buffer = spill.SpillBuffer(key=lambda value: value)
+    buffer.extend(values)
+    assert other.runs
+    assert len(buffer.runs) < 20
+    assert list(buffer.drain()) == sorted(values)
+
+    # Memory that can't be spilled (a replay in progress) doesn't make a run per item either
+    replay = other.drain()
+    holder = spill.SpillBuffer()
+    holder.extend(['y' * 40] * 35)
+    pending = holder.drain()
+    buffer.extend(values)
+    assert len(buffer.runs) < spill.MAX_OPEN_RUNS
+    assert list(buffer.drain()) == sorted(values)
+    assert list(pending) == ['y' * 40] * 35
+    assert list(replay) == ['x' * 40] * 35
+    assert spill.memory_used() == 0
@@ -1,10 +1,14 @@
 from streamline import streamers
-from streamline.core import static_pipe, sync_exec
+from streamline.core import static_pipe, sync_exec, transync
 from streamline.entries import entry_wrap, entry_unwrap, Entry
 
 import asyncio
+import time
+import io
 import re
 
+import pytest
+
 
 def do_streamer_test(streamer, inputs, expected_outputs=None, options=None, wrap=True):
     if wrap:
@@ -130,6 +134,94 @@ def test_async_executor():
         [2,3,4,5,6],
     )
 
+def test_async_executor_timeout():
+    async def slow_executor(value):
+        await asyncio.sleep(value)
+        return value
+
+    entries = entry_wrap([0, 5, 0])
+    sync_exec(static_pipe(streamers.AsyncExecutor(executor=slow_executor, timeout=.2).stream, entries))
+    assert [entry.value for entry in entries] == [0, None, 0]
+    assert isinstance(entries[1].errors[0], asyncio.TimeoutError)
+
+def test_async_executor_deadline():
+    entries = entry_wrap([1, 2])
+    ae = streamers.AsyncExecutor(executor=example_async_executor, deadline=time.monotonic() - 1)
+    sync_exec(static_pipe(ae.stream, entries))
+    assert [entry.value for entry in entries] == [None, None]
+    assert all(isinstance(entry.errors[0], asyncio.TimeoutError) for entry in entries)
+
+def test_async_executor_dedupe():
+    calls = []
+
+    async def executor(value):
+        calls.append(value)
+        await asyncio.sleep(.05)
+        if value == 'bad':
+            raise ValueError(value)
+        return {'result': value}
+
+    entries = entry_wrap(['a', 'b', 'a', 'bad', 'a', 'bad', 'b'])
+    ae = streamers.AsyncExecutor(executor=executor, workers=2, dedupe=True)
+    sync_exec(static_pipe(ae.stream, entries))
+    assert sorted(calls) == ['a', 'b', 'bad']
+    assert [entry.value for entry in entries] == [
+        {'result': 'a'}, {'result': 'b'}, {'result': 'a'}, None, {'result': 'a'}, None, {'result': 'b'},
+    ]
+    assert entries[0].value is not entries[2].value
+    assert isinstance(entries[5].errors[0], ValueError)
+
+def test_async_executor_dedupe_types():
+    async def executor(value):
+        return type(value).__name__
+
+    # A list and its JSON text are different values
+    entries = entry_wrap([['a'], '["a"]', ['a']])
+    ae = streamers.AsyncExecutor(executor=executor, dedupe=True)
+    sync_exec(static_pipe(ae.stream, entries))
+    assert [entry.value for entry in entries] == ['list', 'str', 'list']
+
+    # Including inside containers and dict keys
+    async def executor(value):
+        return repr(value)
+
+    values = [(1, 'a'), (True, 'a'), (1.0, 'a'), {1: 'x'}, {'1': 'x'}, {'a': [1]}, {'a': [True]}, {'a': [1]}]
+    entries = entry_wrap(values)
+    ae = streamers.AsyncExecutor(executor=executor, dedupe=True)
+    sync_exec(static_pipe(ae.stream, entries))
+    assert [entry.value for entry in entries] == [repr(value) for value in values]
+    assert ae._dedupe_key({'a': [1], 'b': 2}) == ae._dedupe_key({'b': 2, 'a': [1]})
+
+def test_async_executor_early_close():
+    class Handler():
+        def __init__(self):
+            self.cancelled = 0
+            self.closed = False
+
+        async def handle(self, value):
+            try:
+                await asyncio.sleep(value)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            return value
+
+        def close(self):
+            self.closed = True
+
+    handler = Handler()
+    ae = streamers.AsyncExecutor(executor=handler.handle, workers=3)
+
+    async def take_first():
+        stream = ae.stream(transync(entry_wrap([.05, 5, 5])))
+        first = await stream.__anext__()
+        # e.g. a downstream `head` done reading
+        await stream.aclose()
+        return first.value
+
+    assert sync_exec(take_first()) == .05
+    assert handler.cancelled == 2 and handler.closed
+
 def test_split_lists():
     do_streamer_test(
         streamers.split_lists,
@@ -144,6 +236,27 @@ def test_split_strings():
         ['foo', 'bar', 'mine', 'zip', 'zip', 'zip']
     )
 
+@pytest.mark.parametrize('lazy', [False, True])
+def test_split_options(lazy):
+    values = ['a,b,,c', 'd', '', 'x1y22z']
+    for delimiter, max_split in [(',', None), (',', 1), (r'\d+', None), (r'(\d)', None), (r'\d*', 2), (r'\d', 0)]:
+        split = streamers.Split(delimiter=delimiter, max_split=max_split, lazy=lazy)
+        expected = sum((re.split(delimiter, value, maxsplit=max_split or 0) for value in values), [])
+        do_streamer_test(split.stream, values, expected)
+    assert streamers.Split(delimiter=',').literal == ','
+    assert streamers.Split().literal is None
+
+@pytest.mark.parametrize('delimiter', [',', r'\d'])
+def test_split_negative_max_split(delimiter):
+    with pytest.raises(ValueError):
+        streamers.Split(delimiter=delimiter, max_split=-1)
+
+def test_split_lineage():
+    entries = entry_wrap(['a b'])
+    entries[0].index = 3
+    results = sync_exec(static_pipe(streamers.Split().stream, entries))
+    assert [(entry.index, entry.original_value, entry.value) for entry in results] == [(3, 'a b', 'a'), (3, 'a b', 'b')]
+
 def test_value_breakdown():
     # summary mode
     do_streamer_test(
@@ -194,6 +307,30 @@ def test_value_breakdown():
         ],
     )
 
+def test_aggregate_merge():
+    def merged(aggregate, *parts):
+        # Build a partial state per part and merge them as a sharded run would
+        state = aggregate.init()
+        for part in parts:
+            partial = aggregate.init()
+            for entry in entry_wrap(part):
+                partial = aggregate.update(partial, entry)
+            state = aggregate.merge(state, partial)
+        return entry_unwrap(aggregate.finalize(state))
+
+    assert merged(streamers.ValueBreakdown(inputs=True), ['A', 'B'], [], ['B', 'C']) == [
+        {'value': 'A', 'count': 1, 'inputs': ['A']},
+        {'value': 'B', 'count': 2, 'inputs': ['B', 'B']},
+        {'value': 'C', 'count': 1, 'inputs': ['C']},
+    ]
+    assert merged(streamers.StatsStreamer(), ['1', '5'], ['x'], ['3']) == [
+        {'count': 3, 'sum': 9, 'min': 1, 'max': 5, 'average': 3},
+    ]
+    assert merged(streamers.StatsStreamer(), [], []) == [
+        {'count': 0, 'sum': 0, 'min': None, 'max': None, 'average': 0},
+    ]
+    assert merged(streamers.SortStreamer(numeric=True), ['10', 'x', '2'], ['1', '30']) == ['x', '1', '2', '10', '30']
+
 def test_input_headers():
     a = Entry('a', index=0)
     a.value = 1
@@ -283,3 +420,21 @@ def test_head():
         [1,2,3,4,5],
         [1,2,3,4],
     )
+
+def test_progress():
+    target = io.StringIO()
+    progress = streamers.ProgressStreamer(buffer_start=False, buffer_end=False, target=target, interval=.01)
+
+    async def slow(source):
+        async for entry in source:
+            await asyncio.sleep(.01)
+            yield entry
+
+    def stream(source):
+        return progress.streamer_end(slow(progress.streamer_start(source)))
+
+    do_streamer_test(stream, [1, 2, 3], [1, 2, 3])
+    lines = target.getvalue().strip().split('\n')
+    assert len(lines) >= 2
+    assert lines[-1].startswith('|{}| 3/3 (100%)'.format('#' * streamers.ProgressStreamer.BAR_WIDTH))
+    assert '0 in flight' in lines[-1]